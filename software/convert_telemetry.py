@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""Convert a binary telemetry log to per-column NumPy files.
+
+Usage:
+    python convert_telemetry.py <telemetry_path> [output_dir]
+
+If output_dir is not specified, writes to a directory next to the log
+with the same name and the extension removed. Each column is saved as
+<column>.npy and can be loaded with numpy.load(..., mmap_mode='r').
+"""
+
+import sys
+import os
+
+from fluidics.control.telemetry import export_columns
+
+
+def convert_telemetry(telemetry_path, out_dir=None):
+    """Decode a telemetry log into a directory of .npy columns.
+
+    Returns the output directory.
+    """
+    if out_dir is None:
+        out_dir = os.path.splitext(telemetry_path)[0]
+
+    export_columns(telemetry_path, out_dir)
+
+    return out_dir
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python convert_telemetry.py <telemetry_path> [output_dir]")
+        sys.exit(1)
+
+    telemetry_path = sys.argv[1]
+    out_dir = sys.argv[2] if len(sys.argv) > 2 else None
+
+    output = convert_telemetry(telemetry_path, out_dir)
+    print(f"Converted: {telemetry_path} -> {output}")
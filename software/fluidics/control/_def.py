@@ -1,5 +1,3 @@
-import numpy as np
-
 MCU_CMD_LENGTH = 15
 MCU_MSG_LENGTH = 30
 
@@ -25,7 +23,7 @@ class MCU_CONSTANTS:
   KP_MAX =  8
   KI_MAX =  1
   KD_MAX =  8
-  ILIM_MAX = np.iinfo(np.uint16).max
+  ILIM_MAX = 0xFFFF # uint16 max
   # Disc pump params
   TTP_MAX_PW = 1000
   # Control loop params
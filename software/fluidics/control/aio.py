@@ -0,0 +1,335 @@
+"""Asyncio transport for the MCU, plus sync bridges onto a single event loop.
+
+`AsyncFluidController` talks to the Teensy from coroutines: commands are
+built by the same `encode_command` as `FluidController.send_command`, and a
+read task decodes every COBS status frame into the latest snapshot and into
+any `status_stream()` subscribers. Together with
+`tecancavro.TecanAPIAsyncSerial` this lets one event loop drive the MCU and
+any number of syringe pumps without a thread per device.
+
+Existing blocking code keeps working through thin wrappers that run the
+coroutines on an `EventLoopThread`:
+
+    loop = EventLoopThread().start()
+    fc = FluidControllerBridge(AsyncFluidController(port=...), loop)
+    fc.begin()
+    link = TecanAPIBridge(TecanAPIAsyncSerial(0, '/dev/ttyUSB0', 9600), loop)
+    pump = SyringePump(None, 5000, 20, 1, com_link=link)
+"""
+
+import asyncio
+import threading
+
+import serial
+from cobs import cobs
+
+from ._def import COMMAND_STATUS, CMD_SET, MCU_MSG_LENGTH
+from .controller import encode_command, print_message
+from .device_registry import registry
+from .framing import COBSFrameReader
+from .mcu_status import decode_status
+from .tecancavro.aio_transport import AsyncSerialPort
+
+
+class EventLoopThread:
+    """An asyncio event loop running forever on a daemon thread."""
+
+    def __init__(self, name='FluidicsEventLoop'):
+        self.name = name
+        self.loop = None
+        self._thread = None
+
+    def start(self):
+        '''Start the loop thread (no-op if already running) and return self'''
+        if self.running():
+            return self
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.call_soon(started.set)
+            self.loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name=self.name, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        '''Stop the loop, wait for the thread to exit and close the loop'''
+        if not self.running():
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+        self._thread = None
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def run(self, coro, timeout=None):
+        '''
+        Run a coroutine on the loop and block until it finishes, returning its result.
+        Raises TimeoutError (and cancels the coroutine) if `timeout` seconds elapse first.
+        '''
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def call(self, fn, *args):
+        '''Call a plain function on the loop thread and return its result'''
+        async def call():
+            return fn(*args)
+        return self.run(call())
+
+
+class AsyncFluidController:
+    """FluidController equivalent whose I/O runs on an asyncio event loop."""
+
+    BAUDRATE = 2000000
+
+    def __init__(self, serial_number=None, port=None, debug=False):
+        '''
+        Arguments:
+            string serial_number: serial number of the microcontroller
+            string port: serial device to open instead of searching by serial number (e.g. MCUEmulator.port)
+            bool debug: print every decoded status
+        '''
+        self.serial_number = serial_number
+        self.port = port
+        self.debug = debug
+        self.serial = None
+        self.framer = COBSFrameReader()
+        self.cmd_uid = 0
+        self.cmd_sent = CMD_SET.CLEAR
+        self.recorded_data = {}
+        self.status_seq = 0
+        self._port = None
+        self._read_task = None
+        self._reader_stopped = True
+        self._status_cond = None
+        self._subscribers = []
+        self._command_listeners = []
+
+    async def begin(self):
+        '''Open the serial port and start the read task. Must be awaited on the loop that will use the controller.'''
+        if self.port is not None:
+            controller_ports = [self.port]
+        else:
+            controller_ports = [p for p in [registry.find_device(self.serial_number)] if p is not None]
+        if not controller_ports:
+            raise IOError("No Controller Found")
+        self.serial = serial.Serial(controller_ports[0], self.BAUDRATE, timeout=0)
+        self._port = AsyncSerialPort(self.serial)
+        self._status_cond = asyncio.Condition()
+        self.framer.clear()
+        self._reader_stopped = False
+        self._read_task = asyncio.get_running_loop().create_task(self._read_loop())
+        print_message('Teensy connected')
+
+    async def close(self):
+        '''Stop the read task and close the serial port'''
+        if self._read_task is not None:
+            self._read_task.cancel()
+            try:
+                await self._read_task
+            except asyncio.CancelledError:
+                pass
+            self._read_task = None
+        if self.serial is not None:
+            self.serial.close()
+            self.serial = None
+
+    def reader_running(self):
+        '''True while the read task is decoding status packets'''
+        return not self._reader_stopped
+
+    async def _read_loop(self):
+        try:
+            while True:
+                self.framer.feed(await self._port.read_some())
+                for msg in self.framer.pop_frames():
+                    if len(msg) != MCU_MSG_LENGTH:
+                        # Corrupted frame, skip it
+                        continue
+                    await self._publish(decode_status(msg))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print_message(f'MCU reader stopped: {e}')
+        finally:
+            self._reader_stopped = True
+            for queue in self._subscribers:
+                queue.put_nowait(None)
+            async with self._status_cond:
+                self._status_cond.notify_all()
+
+    async def _publish(self, status):
+        if self.debug:
+            print(status.to_dict())
+        async with self._status_cond:
+            self.recorded_data = status
+            self.status_seq += 1
+            self._status_cond.notify_all()
+        for queue in self._subscribers:
+            queue.put_nowait(status)
+
+    def send_command(self, command, *args):
+        '''
+        Encode and write a command (see controller.encode_command) without waiting for the MCU.
+        Returns:
+            int uid: the UID the MCU will report for this command
+        '''
+        command_array = encode_command(command, *args)
+        self.cmd_uid = (self.cmd_uid + 1) & 0xFFFF
+        if command == CMD_SET.CLEAR:
+            self.cmd_uid = 0
+        self.cmd_sent = command_array[2]
+        command_array[0] = self.cmd_uid >> 8
+        command_array[1] = self.cmd_uid & 0xFF
+        packet = bytearray(cobs.encode(bytearray(command_array)))
+        packet.append(0)
+        self._port.write(packet)
+        for callback in list(self._command_listeners):
+            callback(command, args)
+        return self.cmd_uid
+
+    def add_command_listener(self, callback):
+        '''Call callback(command, args) after every command is sent, on the event loop thread'''
+        self._command_listeners.append(callback)
+
+    def remove_command_listener(self, callback):
+        if callback in self._command_listeners:
+            self._command_listeners.remove(callback)
+
+    async def wait_for_completion(self, uid=None, timeout=None):
+        '''
+        Wait until the MCU reports command `uid` (default: the last command sent) as no longer IN_PROGRESS, return the status.
+        Raises TimeoutError if `timeout` seconds elapse first, or IOError if the read task stops.
+        '''
+        if uid is None:
+            uid = self.cmd_uid
+
+        def is_complete():
+            data = self.recorded_data
+            return (self.status_seq > 0 and data['MCU_received_command_UID'] == uid and
+                    data['MCU_command_execution_status'] != COMMAND_STATUS.IN_PROGRESS)
+
+        async with self._status_cond:
+            try:
+                await asyncio.wait_for(
+                    self._status_cond.wait_for(lambda: is_complete() or not self.reader_running()), timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Command {uid} did not complete within {timeout} s") from None
+            if not is_complete():
+                raise IOError("MCU reader stopped")
+            return self.recorded_data['MCU_command_execution_status']
+
+    async def send_command_blocking(self, command, *args, timeout=None):
+        '''Send a command and wait for it to complete'''
+        uid = self.send_command(command, *args)
+        return await self.wait_for_completion(uid, timeout)
+
+    async def get_mcu_status(self):
+        '''Return the latest decoded status, waiting for the first packet if none has arrived yet'''
+        async with self._status_cond:
+            await self._status_cond.wait_for(lambda: self.status_seq > 0 or not self.reader_running())
+            if self.status_seq == 0:
+                raise IOError("MCU reader stopped")
+            return self.recorded_data
+
+    def get_latest_status(self):
+        '''Return (sequence number, status) for the most recently decoded packet'''
+        return self.status_seq, self.recorded_data
+
+    async def status_stream(self):
+        '''
+        Async generator yielding every decoded status packet, in arrival order, from the time it is first iterated.
+        Ends when the read task stops.
+        '''
+        queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        try:
+            while True:
+                status = await queue.get()
+                if status is None:
+                    return
+                yield status
+        finally:
+            self._subscribers.remove(queue)
+
+
+class TecanAPIBridge:
+    """Blocking `sendRcv` over an async Tecan link, usable as a Syringe com_link."""
+
+    def __init__(self, async_link, loop_thread):
+        '''
+        Arguments:
+            TecanAPIAsyncSerial async_link: link whose coroutines run on loop_thread
+            EventLoopThread loop_thread: running event loop thread
+        '''
+        self.async_link = async_link
+        self.loop_thread = loop_thread
+
+    def sendRcv(self, cmd):
+        return self.loop_thread.run(self.async_link.sendRcv(cmd))
+
+    def close(self):
+        self.loop_thread.call(self.async_link.close)
+
+
+class FluidControllerBridge:
+    """Blocking FluidController interface over an AsyncFluidController."""
+
+    def __init__(self, async_fc, loop_thread):
+        '''
+        Arguments:
+            AsyncFluidController async_fc: controller whose coroutines run on loop_thread
+            EventLoopThread loop_thread: running event loop thread
+        '''
+        self.async_fc = async_fc
+        self.loop_thread = loop_thread
+
+    @property
+    def cmd_uid(self):
+        return self.async_fc.cmd_uid
+
+    def begin(self):
+        self.loop_thread.run(self.async_fc.begin())
+
+    def close(self):
+        self.loop_thread.run(self.async_fc.close())
+
+    def send_command(self, command, *args):
+        return self.loop_thread.call(self.async_fc.send_command, command, *args)
+
+    def wait_for_completion(self, uid=None, timeout=None):
+        return self.loop_thread.run(self.async_fc.wait_for_completion(uid, timeout))
+
+    def send_command_blocking(self, command, *args, timeout=None):
+        return self.loop_thread.run(self.async_fc.send_command_blocking(command, *args, timeout=timeout))
+
+    def get_mcu_status(self):
+        return self.loop_thread.run(self.async_fc.get_mcu_status())
+
+    def get_latest_status(self):
+        return self.async_fc.get_latest_status()
+
+    def reader_running(self):
+        return self.async_fc.reader_running()
+
+    def add_command_listener(self, callback):
+        self.async_fc.add_command_listener(callback)
+
+    def remove_command_listener(self, callback):
+        self.async_fc.remove_command_listener(callback)
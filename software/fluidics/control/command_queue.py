@@ -0,0 +1,218 @@
+"""Pipelined MCU commands with futures resolved from the status stream.
+
+The firmware handles command packets one at a time, in the order they
+arrive, and every status packet carries the UID of the latest command it
+received. `MCUCommandQueue` sends commands without waiting for the previous
+one and matches each status packet against the commands still in flight:
+
+- A packet with a command's UID and a status other than IN_PROGRESS
+  resolves that command's future with the reported status.
+- A packet with a later command's UID means every earlier command has
+  already been handled. Earlier commands never reported as IN_PROGRESS
+  resolve as COMPLETED_WITHOUT_ERRORS. Earlier commands last seen IN_PROGRESS
+  were interrupted by the next command and resolve as IN_PROGRESS. The
+  status packet rate (TX_INTERVAL_MS) means an error in a command that was
+  superseded before any packet reported it cannot be observed.
+- A command whose UID has not shown up within `ack_timeout` seconds, or that
+  is outrun by a UID the queue never sent (e.g. after an MCU reset), is
+  re-sent with a new UID, together with any later unacknowledged commands.
+  The firmware sends no status while it blocks in a command (a rotary valve
+  move), so the `ack_timeout` of a command only starts once every command
+  before it has been acknowledged, and nothing is re-sent while an earlier
+  command is still IN_PROGRESS. Packets carrying a UID the queue sent
+  earlier, including the UIDs of re-sent commands, are not unknown; an
+  unknown UID triggers a re-send once, when it first shows up.
+  After `max_retries` re-sends its future fails with TimeoutError.
+- A command that is acknowledged but still IN_PROGRESS after its own
+  `timeout` fails with TimeoutError.
+"""
+
+import threading
+from collections import deque
+from concurrent.futures import Future
+from time import monotonic
+
+from ._def import COMMAND_STATUS
+
+
+class _PendingCommand:
+    __slots__ = ('command', 'args', 'future', 'uid', 'uids', 'timeout', 'ack_deadline',
+                 'completion_deadline', 'acked', 'last_status', 'retries')
+
+    def __init__(self, command, args, timeout):
+        self.command = command
+        self.args = args
+        self.future = Future()
+        self.future.set_running_or_notify_cancel()
+        self.uid = None
+        self.uids = []              # every UID the command was sent with, the latest last
+        self.timeout = timeout
+        self.ack_deadline = None
+        self.completion_deadline = None
+        self.acked = False
+        self.last_status = None
+        self.retries = 0
+
+
+class MCUCommandQueue:
+    """Submit MCU commands without waiting and get a Future for each one."""
+
+    # Number of recently sent UIDs recognised in status packets
+    SENT_UIDS_KEPT = 256
+
+    def __init__(self, fc, ack_timeout=0.5, max_retries=2):
+        '''
+        Arguments:
+            FluidController fc: connected controller; its reader thread is started by start()
+            float ack_timeout: seconds to wait for a command's UID to appear in the status stream before re-sending it
+            int max_retries: number of re-sends before a command fails
+        Commands must not be sent to `fc` directly while the queue is in use, since the queue relies on owning the UID sequence.
+        '''
+        self.fc = fc
+        self.ack_timeout = ack_timeout
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._pending = []
+        self._last_uid = None
+        self._sent_uids = deque(maxlen=self.SENT_UIDS_KEPT)
+        self._running = False
+
+    def start(self):
+        '''Start listening to the status stream (starts the controller's reader thread)'''
+        with self._lock:
+            self._last_uid = self.fc.cmd_uid
+            self._running = True
+        self.fc.add_status_listener(self._on_status)
+        self.fc.start_reader()
+
+    def close(self):
+        '''Stop listening and fail any command still in flight'''
+        self.fc.remove_status_listener(self._on_status)
+        with self._lock:
+            self._running = False
+            pending, self._pending = self._pending, []
+        for entry in pending:
+            entry.future.set_exception(RuntimeError("Command queue closed"))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, command, *args, timeout=None):
+        '''
+        Send a command and return a Future that resolves to its COMMAND_STATUS.
+        Arguments:
+            command, *args: as for FluidController.send_command
+            float timeout: seconds the command may stay IN_PROGRESS after it is acknowledged (None: no limit)
+        '''
+        entry = _PendingCommand(command, args, timeout)
+        with self._lock:
+            if not self._running:
+                raise RuntimeError("Command queue is not running")
+            self._send(entry, monotonic())
+            self._pending.append(entry)
+        return entry.future
+
+    def pending_count(self):
+        '''Number of commands still in flight'''
+        with self._lock:
+            return len(self._pending)
+
+    def _send(self, entry, now):
+        entry.uid = self.fc.send_command(entry.command, *entry.args)
+        entry.uids.append(entry.uid)
+        self._sent_uids.append(entry.uid)
+        # Queued behind an unacknowledged command: its ack timeout starts once that one is acknowledged
+        behind_unacked = False
+        for earlier in self._pending:
+            if earlier is entry:
+                break
+            behind_unacked = behind_unacked or not earlier.acked
+        entry.ack_deadline = None if behind_unacked else now + self.ack_timeout
+
+    def _on_status(self, status):
+        if status is None:
+            self._fail_all(RuntimeError("MCU reader stopped"))
+            return
+        now = monotonic()
+        resolved = []
+        with self._lock:
+            uid = status.MCU_received_command_UID
+            execution_status = status.MCU_command_execution_status
+            index = None
+            for i in range(len(self._pending) - 1, -1, -1):
+                if uid in self._pending[i].uids:
+                    index = i
+                    break
+
+            if index is not None:
+                # Everything sent before this UID has been handled by the firmware
+                for entry in self._pending[:index]:
+                    resolved.append((entry, entry.last_status if entry.last_status is not None
+                                     else COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS))
+                entry = self._pending[index]
+                del self._pending[:index]
+                if not entry.acked:
+                    entry.acked = True
+                    if entry.timeout is not None:
+                        entry.completion_deadline = now + entry.timeout
+                if execution_status == COMMAND_STATUS.IN_PROGRESS:
+                    entry.last_status = execution_status
+                else:
+                    resolved.append((entry, execution_status))
+                    del self._pending[0]
+                self._last_uid = uid
+                mismatch = False
+            else:
+                # A UID the queue never sent (e.g. 0 after CLEAR or a reset) triggers one re-send;
+                # further packets with the same UID wait for the ack deadline again
+                mismatch = uid != self._last_uid and uid not in self._sent_uids
+                self._last_uid = uid
+
+            resolved.extend(self._check_timeouts(now, mismatch))
+
+        for entry, result in resolved:
+            if isinstance(result, BaseException):
+                entry.future.set_exception(result)
+            else:
+                entry.future.set_result(result)
+
+    def _check_timeouts(self, now, mismatch):
+        '''Fail overdue commands and re-send unacknowledged ones. Called with the lock held.'''
+        failed = []
+        for entry in self._pending:
+            if entry.completion_deadline is not None and now >= entry.completion_deadline:
+                failed.append((entry, TimeoutError(f"Command {entry.command} did not complete within {entry.timeout} s")))
+
+        unacked = [entry for entry in self._pending if not entry.acked]
+        if unacked:
+            first = unacked[0]
+            if first.ack_deadline is None:
+                # Every command before it has just been acknowledged
+                first.ack_deadline = now + self.ack_timeout
+            # Nothing is re-sent while an earlier command runs: the firmware may not have read the next one yet
+            busy = any(entry.last_status == COMMAND_STATUS.IN_PROGRESS for entry in self._pending if entry.acked)
+            if mismatch or (not busy and now >= first.ack_deadline):
+                resend = []
+                for entry in unacked:
+                    if entry.retries >= self.max_retries:
+                        failed.append((entry, TimeoutError(f"Command {entry.command} was not acknowledged after {entry.retries} retries")))
+                    else:
+                        entry.retries += 1
+                        resend.append(entry)
+                for entry in resend:
+                    self._send(entry, now)
+
+        if failed:
+            failed_entries = {id(entry) for entry, _ in failed}
+            self._pending = [entry for entry in self._pending if id(entry) not in failed_entries]
+        return failed
+
+    def _fail_all(self, exc):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for entry in pending:
+            entry.future.set_exception(exc)
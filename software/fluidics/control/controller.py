@@ -1,11 +1,15 @@
 from cobs import cobs
 import serial
 from ._def import *
-import serial.tools.list_ports
+from .framing import COBSFrameReader, FixedLengthFrameReader
+from .mcu_status import decode_status
+from .telemetry import TelemetryWriter
+from .device_registry import registry
 from datetime import datetime
 import os
 from pathlib import Path
 import numpy as np
+import threading
 from time import time, sleep
 
 SERIAL_NUMBER_DEBUGGING = '11972480'
@@ -34,23 +38,411 @@ def uint_to_bytes(uint, n_bytes):
         out.append(np.uint8(shifted & 0xFF))
     return out
 
+def encode_command(command, *args):
+    '''
+    Build the computer -> MCU packet for a command, with two placeholder bytes for the UID
+    Parameters are formatted differently depending on the command
+    Returns:
+        list command_array: [0, 0, command, parameters...]
+    '''
+    command_array = [0, 0] # Initialize with two empty cells for UID
+
+    cmd = np.uint8(command)
+    assert cmd == command, "Command is not uint8"
+    command_array.append(cmd)
+
+    if command == CMD_SET.CLEAR:
+        pass
+    elif command == CMD_SET.INITIALIZE_DISC_PUMP:
+        # For disc pump, we need pwr limit (2 bytes), source, mode, and stream config
+        assert len(args) == 1, "Need power limit"
+        pwr_lim = np.uint16(args[0])
+        assert pwr_lim == args[0], "Power limit not a uint16"
+
+        pwr_lim_hi, pwr_lim_lo = uint_to_bytes(pwr_lim, 2)
+
+        command_array.append(pwr_lim_hi)
+        command_array.append(pwr_lim_lo)
+        pass
+    elif command == CMD_SET.INITIALIZE_PRESSURE_SENSOR:
+        # Need index of pressure sensor to init
+        assert len(args) == 1, "Need sensor index"
+        idx = np.uint8(args[0])
+        assert idx == args[0], "Index is not a uint8"
+        
+        command_array.append(idx)
+        pass
+    elif command == CMD_SET.INITIALIZE_FLOW_SENSOR:
+        # Need index, medium, and do_crc
+        assert len(args) == 3, "Need I2C index, liquid medium, and whether we do CRC positional arguments"
+        idx = np.uint8(args[0])
+        assert idx == args[0], "Index not an int16"
+        medium = np.uint8(args[1])
+        assert medium in MCU_CONSTANTS.MEDIA, "Medium not recognized, must be MEDIUM_IPA or MEDIUM_WATER"
+        do_crc = bool(args[2])
+        assert do_crc == args[2], "do_crc setting is not a boolean"
+
+        command_array.append(idx)
+        command_array.append(medium)
+        command_array.append(do_crc)
+        pass
+    elif command == CMD_SET.INITIALIZE_BUBBLE_SENSORS:
+        # Need no additional info
+        assert len(args) == 0, "Unnecessary arguments present"
+        pass
+    elif command == CMD_SET.INITIALIZE_VALVES:
+        # Need no additional info
+        assert len(args) == 0, "Unnecessary arguments present"
+        pass
+    elif command == CMD_SET.INITIALIZE_BANG_BANG_PARAMS:
+        # Need loop type, low threshold, high threshold, min out, max out, and timestep
+        assert len(args) == 6, "Need loop type, low/high thresholds, min/max outputs, and timestep (ms)"
+        
+        loop_type = np.uint8(args[0])
+        assert loop_type in MCU_CONSTANTS.BB_LOOP_TYPES, "loop type is not a bang-bang type"
+
+        t_lower_intermediate = args[1] * MCU_CONSTANTS.SCALE_FACTOR_FLOW
+        t_lower = np.uint16(t_lower_intermediate)
+        assert t_lower_intermediate == t_lower, "Error calculating lower bound"
+        t_upper_intermediate = args[2] * MCU_CONSTANTS.SCALE_FACTOR_FLOW
+        t_upper = np.uint16(t_upper_intermediate)
+        assert t_upper_intermediate == t_upper, "Error calculating upper bound"
+
+        o_lower = np.uint16(args[3])
+        assert args[3] == o_lower, "Lower output not uint16"
+        o_upper = np.uint16(args[4])
+        assert args[4] == o_upper, "Upper output not uint16"
+
+        timestep = np.uint32(args[5])
+        assert timestep == args[5], "Timestep is not uint32"
+
+        t_lower_hi, t_lower_lo = uint_to_bytes(t_lower, 2)
+        t_upper_hi, t_upper_lo = uint_to_bytes(t_upper, 2)
+        o_lower_hi, o_lower_lo = uint_to_bytes(o_lower, 2)
+        o_upper_hi, o_upper_lo = uint_to_bytes(o_upper , 2)
+
+        tstep_3, tstep_2, tstep_1, tstep_0 = uint_to_bytes(timestep, 4)
+
+        command_array.append(loop_type)
+        command_array.append(t_lower_hi)
+        command_array.append(t_lower_lo)
+        command_array.append(t_upper_hi)
+        command_array.append(t_upper_lo)
+        command_array.append(o_lower_hi)
+        command_array.append(o_lower_lo)
+        command_array.append(o_upper_hi)
+        command_array.append(o_upper_lo)
+        command_array.append(tstep_3)
+        command_array.append(tstep_2)
+        command_array.append(tstep_1)
+        command_array.append(tstep_0)
+
+        pass
+    elif command == CMD_SET.INITIALIZE_PID_PARAMS:
+        # Need loop type, Kp, Ki, Kd, intergral winding limit, min/max outputs, and timestep
+        assert len(args) == 8, "Need loop type, Kp/Ki/Kd, winding limit, min/max outputs, and timestep (ms)"
+
+        loop_type = np.uint8(args[0])
+        assert loop_type in MCU_CONSTANTS.PID_LOOP_TYPES, "loop type is not PID type"
+
+        kp_intermediate = int((args[1]/MCU_CONSTANTS.KP_MAX) * np.iinfo(np.uint16).max)
+        kp = np.uint16(kp_intermediate)
+        assert kp_intermediate == kp, "Error calculating Kp"
+
+        ki_intermediate = int((args[2]/MCU_CONSTANTS.KI_MAX) * np.iinfo(np.uint16).max)
+        ki = np.uint16(ki_intermediate)
+        assert ki_intermediate == ki, "Error calculating Ki"
+
+        kd_intermediate = int((args[3]/MCU_CONSTANTS.KD_MAX) * np.iinfo(np.uint16).max)
+        kd = np.uint16(kd_intermediate)
+        assert kd_intermediate == kd, "Error calculating Kd"
+
+        ilim_intermediate = int((args[4]/MCU_CONSTANTS.ILIM_MAX) * np.iinfo(np.uint16).max)
+        ilim = np.uint16(ilim_intermediate)
+        assert ilim_intermediate == ilim, "Error calculating integral winding limit"
+        
+
+        o_lower = np.uint16(args[5])
+        assert args[5] == o_lower, "Lower output not uint16"
+        o_upper = np.uint16(args[6])
+        assert args[6] == o_upper, "Upper output not uint16"
+
+        timestep = np.uint32(args[7])
+        assert timestep == args[7], "Timestep is not uint32"
+
+        kp_hi, kp_lo = uint_to_bytes(kp, 2)
+        ki_hi, ki_lo = uint_to_bytes(ki, 2)
+        kd_hi, kd_lo = uint_to_bytes(kd, 2)
+        ilim_hi, ilim_lo = uint_to_bytes(ilim, 2)
+        o_lower_hi, o_lower_lo = uint_to_bytes(o_lower, 2)
+        o_upper_hi, o_upper_lo = uint_to_bytes(o_upper , 2)
+
+        tstep_3, tstep_2, tstep_1, tstep_0 = uint_to_bytes(timestep, 4)
+
+        command_array.append(loop_type)
+        command_array.append(kp_hi)
+        command_array.append(kp_lo)
+        command_array.append(ki_hi)
+        command_array.append(ki_lo)
+        command_array.append(kd_hi)
+        command_array.append(kd_lo)
+        command_array.append(ilim_hi)
+        command_array.append(ilim_lo)
+        command_array.append(o_lower_hi)
+        command_array.append(o_lower_lo)
+        command_array.append(o_upper_hi)
+        command_array.append(o_upper_lo)
+        command_array.append(tstep_3)
+        command_array.append(tstep_2)
+        command_array.append(tstep_1)
+        command_array.append(tstep_0)
+        pass
+    elif command == CMD_SET.SET_SOLENOID_VALVES:
+        # For setting all valves, need 16 bit setting
+        assert len(args) == 1, "Need setting"
+        setting = np.uint16(args[0])
+        assert setting == args[0], "Setting not an int16"
+
+        setting_hi, setting_lo = uint_to_bytes(setting, 2)
+        command_array.append(setting_hi)
+        command_array.append(setting_lo)
+        pass
+    elif command == CMD_SET.SET_SOLENOID_VALVE:
+        # For setting an individual valve, need on/off bool and index
+        assert len(args) == 2, "Need on/off bool and index"
+        on_off = bool(args[0])
+        assert on_off == args[0], "on_off setting is not a boolean"
+        idx = np.uint8(args[1])
+        assert idx == args[1], "idx is not uint8"
+
+        command_array.append(on_off)
+        command_array.append(idx)
+        pass
+    elif command == CMD_SET.SET_PUMP_PWR_OPEN_LOOP:
+        # To set the pump power, we just need the power
+        assert len(args) == 1, "Need power (milliwatts)"
+        pwr = np.uint16(args[0])
+        assert pwr == args[0], "power is not uint16"
+        pwr_hi, pwr_lo = uint_to_bytes(pwr, 2)
+        command_array.append(pwr_hi)
+        command_array.append(pwr_lo)
+        pass
+    elif command == CMD_SET.INITIALIZE_ROTARY:
+        # Initialize rotary valve with index and max positions
+        assert len(args) == 2, "Need index and number of positions"
+        idx = np.uint8(args[0])
+        assert idx == args[0], "index is not uint8"
+        n_pos = np.uint8(args[1])
+        assert n_pos == args[1], "Number of positions is not uint8"
+
+        command_array.append(idx)
+        command_array.append(n_pos)
+        pass
+    elif command == CMD_SET.SET_ROTARY_VALVE:
+        # Set rotary valve position, we need index and target position
+        assert len(args) == 2, "Need index and target position"
+        idx = np.uint8(args[0])
+        assert idx == args[0], "index is not uint8"
+        target = np.uint8(args[1])
+        assert target == args[1], "target position is not uint8"
+
+        command_array.append(idx)
+        command_array.append(target)
+        pass
+    elif command ==  CMD_SET.BEGIN_CLOSED_LOOP:
+        # Begin one of the control loops. We need the type of loop to begin
+        assert len(args) == 1, "Need loop type"
+        loop_type = np.uint8(args[0])
+        assert loop_type in MCU_CONSTANTS.LOOP_TYPES, "loop type not valid"
+        
+        command_array.append(loop_type)
+        pass
+    elif command == CMD_SET.STOP_CLOSED_LOOP:
+        # Need no additional info
+        assert len(args) == 0, "Unnecessary arguments present"
+        pass
+    elif (command == CMD_SET.REMOVE_ALL_MEDIUM) or (command == CMD_SET.EJECT_MEDIUM):
+        # Need open loop disc pump power, debounce time (ms), timeout time(ms), and pressure scale
+        assert len(args) == 4, "Need power, debounce time, timeout time, and pressure scale"
+
+        o_power = np.uint16(args[0])
+        assert args[0] == o_power, "Open loop power not uint16"
+        
+        t_debounce = np.uint16(args[1])
+        assert t_debounce == args[1], "debounce time is not uint16"
+
+        t_timeout = np.uint16(args[2])
+        assert t_timeout == args[2], "timeout time is not uint16"
+
+        pscale_intermediate = int(args[3] * np.iinfo(np.uint8).max)
+        pscale = np.uint8(pscale_intermediate)
+        assert pscale == pscale_intermediate, "error calculating pscale"
+
+        pwr_hi, pwr_lo = uint_to_bytes(o_power, 2)
+        db_hi, db_lo = uint_to_bytes(t_debounce, 2)
+        tt_hi,tt_lo = uint_to_bytes(t_timeout, 2)
+        command_array.append(pwr_hi)
+        command_array.append(pwr_lo)
+        command_array.append(tt_hi)
+        command_array.append(tt_lo)
+        command_array.append(db_hi)
+        command_array.append(db_lo)
+        command_array.append(pscale)
+        pass
+    elif command == CMD_SET.CLEAR_LINES:
+        # Need open loop disc pump power, debounce time (ms), and timeout time(ms)
+        assert len(args) == 3, "Need power, debounce time, and timeout time"
+
+        o_power = np.uint16(args[0])
+        assert args[0] == o_power, "Open loop power not uint16"
+        
+        t_debounce = np.uint16(args[1])
+        assert t_debounce == args[1], "debounce time is not uint16"
+
+        t_timeout = np.uint16(args[2])
+        assert t_timeout == args[2], "timeout time is not uint16"
+
+        pwr_hi, pwr_lo = uint_to_bytes(o_power, 2)
+        db_hi, db_lo = uint_to_bytes(t_debounce, 2)
+        tt_hi,tt_lo = uint_to_bytes(t_timeout, 2)
+        command_array.append(pwr_hi)
+        command_array.append(pwr_lo)
+        command_array.append(tt_hi)
+        command_array.append(tt_lo)
+        command_array.append(db_hi)
+        command_array.append(db_lo)
+        
+    elif command == CMD_SET.LOAD_FLUID_TO_SENSOR:
+        # Need open loop power and timeout time 
+        assert len(args) == 2, "Need power and timeout time"
+
+        pwr = np.uint16(args[0])
+        assert pwr == args[0], "power is not uint16"
+        t_timeout = np.uint16(args[1])
+        assert t_timeout == args[1], "timeout time is not uint16"
+
+        pwr_hi, pwr_lo = uint_to_bytes(pwr, 2)
+        tt_hi,tt_lo = uint_to_bytes(t_timeout, 2)
+        command_array.append(pwr_hi)
+        command_array.append(pwr_lo)
+        command_array.append(tt_hi)
+        command_array.append(tt_lo)
+        pass
+    elif command == CMD_SET.VOL_INTEGRATE_SETTING:
+        # Set whether to perform volume integration and reset the integrated volume
+        assert len(args) == 2, "Need vol integration setting and reset setting"
+        do_integration = bool(args[0])
+        assert do_integration == args[0], "do_integration setting is not a boolean"
+        reset_volume = bool(args[1])
+        assert reset_volume == args[1], "reset_volume setting is not a boolean" 
+
+        command_array.append(do_integration)
+        command_array.append(reset_volume)
+        pass
+    elif (command == CMD_SET.LOAD_FLUID_VOLUME) or (command == CMD_SET.UNLOAD_FLUID_VOLUME):
+        # Need control type, setpoint (ignore if control type is BB), timeout time in ms, and volume to load
+        loop_type = np.uint8(args[0])
+        assert loop_type == args[0], "Loop type must be uint8"
+        if (loop_type == MCU_CONSTANTS.FLUID_IN_BANG_BANG) or (loop_type == MCU_CONSTANTS.FLUID_OUT_BANG_BANG) :
+            assert len(args) == 3, "Need control type, timeout time, and volume target"
+            i_shift = 1
+        else:
+            assert len(args) == 4, "Need control type, setpoint, timeout time, and volume target"
+            i_shift = 0
+        
+        if command == CMD_SET.LOAD_FLUID_VOLUME:
+            assert loop_type in [MCU_CONSTANTS.OPEN_LOOP_CTRL, MCU_CONSTANTS.FLUID_IN_BANG_BANG, MCU_CONSTANTS.VACUUM_PID], "Control type must be open loop, fluid in BB, or vacuum PID"
+        else:
+            assert loop_type in [MCU_CONSTANTS.OPEN_LOOP_CTRL, MCU_CONSTANTS.FLUID_OUT_BANG_BANG, MCU_CONSTANTS.FLUID_OUT_PID, MCU_CONSTANTS.PRESSURE_PID], "Control type must be open loop, fluid out BB, fluid out PID, or pressure PID"
+        
+        t_timeout = np.uint16(args[2-i_shift])
+        assert t_timeout == args[2-i_shift], "timeout time is not uint16"
+
+        volume_intermediate = int((args[3-i_shift]/MCU_CONSTANTS.VOLUME_UL_MAX) * np.iinfo(np.uint16).max)
+        volume = np.uint16(volume_intermediate)
+        assert volume_intermediate == volume, "Error calculating volume"
+
+        # Setpoint is either a pressure or disc pump power depending on loop type
+        setpoint = 0
+        if loop_type == MCU_CONSTANTS.OPEN_LOOP_CTRL:
+            setpoint = np.uint16(args[1])
+            assert setpoint == args[1], "power not uint16"
+        elif (loop_type == MCU_CONSTANTS.VACUUM_PID) or (loop_type == MCU_CONSTANTS.PRESSURE_PID):
+            setpoint_intermediate = int(MCU_CONSTANTS._output_min + (args[0] - MCU_CONSTANTS._p_min) * (MCU_CONSTANTS._output_max - MCU_CONSTANTS._output_min) / (MCU_CONSTANTS._p_max - MCU_CONSTANTS._p_min))
+            setpoint = np.uint16(setpoint_intermediate)
+            assert setpoint == setpoint_intermediate, "Error calculating pressure setpoint"
+        elif loop_type == MCU_CONSTANTS.FLUID_OUT_PID:
+            setpoint_intermediate = int((abs(args[1])/abs(MCU_CONSTANTS.SLF3X_MAX_VAL_uL_MIN)) * np.iinfo(np.uint16).max)
+            setpoint = np.uint16(setpoint_intermediate)
+            assert setpoint == setpoint_intermediate, "Error calculating pressure setpoint"
+        
+        # 1 for setting the control type, 2 for setpoint (if applicable), 2 for timeout, 2 for volume setpoint
+        sp_hi, sp_lo = uint_to_bytes(setpoint, 2)
+        tt_hi, tt_lo = uint_to_bytes(t_timeout, 2)
+        vol_hi, vol_lo = uint_to_bytes(volume, 2)
+        command_array.append(loop_type)
+        command_array.append(sp_hi)
+        command_array.append(sp_lo)
+        command_array.append(tt_hi)
+        command_array.append(tt_lo)
+        command_array.append(vol_hi)
+        command_array.append(vol_lo)
+        pass
+    elif command == CMD_SET.VENT_VB0:
+        # 3 bytes for cmd and UID, 2 for vacuum threshold, 2 for timeout
+        assert len(args) == 2, "Need vacuum threshold and timeout time"
+
+        vacuum_intermediate = int(MCU_CONSTANTS._output_min + (args[0] - MCU_CONSTANTS._p_min) * (MCU_CONSTANTS._output_max - MCU_CONSTANTS._output_min) / (MCU_CONSTANTS._p_max - MCU_CONSTANTS._p_min))
+        vacuum = np.uint16(vacuum_intermediate)
+        assert vacuum_intermediate == vacuum, "Error calculating vacuum setting"
+        t_timeout = np.uint16(args[1])
+        assert t_timeout == args[1], "timeout time is not uint16"
+
+        tt_hi, tt_lo = uint_to_bytes(t_timeout, 2)
+        v_hi, v_lo = uint_to_bytes(vacuum, 2)
+        command_array.append(v_hi)
+        command_array.append(v_lo)
+        command_array.append(tt_hi)
+        command_array.append(tt_lo)
+        pass
+    elif command == CMD_SET.DELAY_MS:
+        # Do nothing for set time
+        assert len(args) == 1, "Need delay time"
+        delaytime = np.uint32(args[0])
+        assert delaytime == args[0], "delay time is not uint32"
+
+        dt_3, dt_2, dt_1, dt_0 = uint_to_bytes(delaytime, 4)
+        command_array.append(dt_3)
+        command_array.append(dt_2)
+        command_array.append(dt_1)
+        command_array.append(dt_0)
+    else:
+        # If we don't recognize the command, raise an error
+        raise Exception("Command not recognized")
+    return command_array
+
 # Define basic input/output from the microcontroller
 class Microcontroller():
-    def __init__(self, serial_number, use_cobs = True, cmd_len = MCU_CMD_LENGTH, buffer_len = MCU_MSG_LENGTH):
+    def __init__(self, serial_number, use_cobs = True, cmd_len = MCU_CMD_LENGTH, buffer_len = MCU_MSG_LENGTH, port = None):
         '''
         Arguments:
             string serial_number: serial number of target microcontroller
             bool use_cobs: set True to enable Consistent Overhead Byte Stuffing encoding, default value True
+            string port: connect to this device (e.g. an MCUEmulator pty) instead of searching by serial number
         '''
         self.serial = None
         self.serial_number = serial_number
+        self.port = port
         self.use_cobs = use_cobs
 
         # Parameters for fixed-length messages 
         self.tx_buffer_length = cmd_len
         self.rx_buffer_length = buffer_len
 
-        self.read_buffer = []
+        if self.use_cobs:
+            self.framer = COBSFrameReader()
+        else:
+            self.framer = FixedLengthFrameReader(self.rx_buffer_length)
         return
     
     def __del__(self):
@@ -62,10 +454,13 @@ class Microcontroller():
     
     def begin(self):
         '''
-        Find a Serial device that matches the serial number and connect to it.
+        Find a Serial device that matches the serial number (or use the given port) and connect to it.
         '''
-        self.read_buffer = []
-        controller_ports = [ p.device for p in serial.tools.list_ports.comports() if self.serial_number == p.serial_number]
+        self.framer.clear()
+        if self.port is not None:
+            controller_ports = [self.port]
+        else:
+            controller_ports = [p for p in [registry.find_device(self.serial_number)] if p is not None]
         if not controller_ports:
             raise IOError("No Controller Found")
         self.serial = serial.Serial(controller_ports[0],2000000)
@@ -90,82 +485,60 @@ class Microcontroller():
         self.serial.write(cmd)
         return
     
+    def _poll_serial(self):
+        '''Move everything waiting on the serial port into the frame reader with a single read'''
+        n_waiting = self.serial.in_waiting
+        if n_waiting:
+            self.framer.feed(self.serial.read(n_waiting))
+        return
+
     def read_received_packet_nowait(self, discard_buffer=False):
         '''
-        If there is serial data available, return it as an array of bytes.
-        If we are using COBS, decode it first
+        If a complete packet has been received, return it as bytes.
+        If we are using COBS, it is decoded first
         Arguments:
-            None
+            bool discard_buffer: return only the latest packet and drop any older ones
         Inputs:
             Reads data over Serial
         Returns:
-            uint8_t data[] or None: either the decoded data (variable length) or None
+            bytes data or None: either the decoded data (variable length) or None
         '''
-        if self.serial.in_waiting == 0:
-            return None
-        # If we want to get only the latest data, read and discard data until the buffer is the right length
-        byte_in = None
+        self._poll_serial()
         if discard_buffer:
-            self.read_buffer = []
-            while self.serial.in_waiting > (2 * self.rx_buffer_length):
-                byte_in = ord(self.serial.read())
-            if self.serial.in_waiting > self.rx_buffer_length:
-                if (self.use_cobs) and (byte_in is not None):
-                    while byte_in != 0:
-                        byte_in = ord(self.serial.read())
+            return self.framer.latest_frame()
+        return self.framer.next_frame()
 
-        if self.use_cobs:
-            # Read data into read_buffer until we hit an end-of-packet (0x00)
-            while self.serial.in_waiting:
-                byte_in = ord(self.serial.read())
-                if byte_in != 0:
-                    self.read_buffer.append(byte_in)
-                else:
-                    break
-
-            # If the last byte isn't 0, we didn't read a full packet yet
-            if byte_in != 0:
-                return None
-            # If it is 0, we have a full packet to decode. Clear the read buffer
-            else:
-                output = cobs.decode(bytearray(self.read_buffer))
-                self.read_buffer = []
+    def read_received_packets_nowait(self):
+        '''
+        Return every complete packet received so far, oldest first
+        Inputs:
+            Reads data over Serial
+        Returns:
+            list of bytes: decoded packets, possibly empty
+        '''
+        self._poll_serial()
+        return self.framer.pop_frames()
 
-        # If we aren't using COBS, use fixed-length command rx
-        else:
-            # If we have too many bytes in the buffer, throw out the excess
-            buffer_len = self.serial.in_waiting
-            if buffer_len > self.rx_buffer_length:
-                for _ in range(buffer_len - self.rx_buffer_length):
-                    self.serial.read()
-            # If we have too few bytes, return None
-            elif buffer_len < self.rx_buffer_length:
-                return None
-            
-            # Read the buffer
-            output = []
-            for _ in range(self.rx_buffer_length):
-                output.append(ord(self.serial.read()))
-        
-        return output
-    
 
 class FluidController(Microcontroller):
-    def __init__(self, serial_number, use_cobs = True, log_measurements = False, debug = False):
+    # Idle time between polls of the serial port when the reader thread finds no data
+    READER_POLL_INTERVAL_S = 0.001
+
+    def __init__(self, serial_number, use_cobs = True, log_measurements = False, debug = False, use_reader_thread = False, port = None):
         '''
         Initialize logging and microcontroller connection. This class inherits from Microcontroller
         Arguments:
             String serial_number: serial number of the microcontroller
             bool use_cobs: use Consistent Overhead Byte Stuffing for Serial I/O
-            bool log_measurements: save logs to a CSV
+            bool log_measurements: save raw status packets to a binary telemetry log (see telemetry.py)
             bool debug: print debug info
+            bool use_reader_thread: drain the serial port on a background thread and serve get_mcu_status from the latest snapshot
+            String port: serial device to open instead of searching by serial number (e.g. MCUEmulator.port)
         '''
         self.log_measurements = log_measurements
 
         if(self.log_measurements):
-            self.measurement_file = open(os.path.join(Path.home(),"Downloads","Fluidic Controller Logged Measurement_" + datetime.now().strftime('%Y-%m-%d %H-%M-%S.%f') + ".csv"), "w+")
-            self.measurement_file.write("timestamp,rx_uid,rx_cmd,cmd_status,mcu_state,bs1,bs2,mcu_time,sv0,sv1,sv2,sv3,sv4,valves,pump,p0,p1,p2,p3,f1,f2,vol_uL\n")
-            self.counter_measurement_file_flush = 1
+            self.telemetry = TelemetryWriter(os.path.join(Path.home(),"Downloads","Fluidic Controller Telemetry_" + datetime.now().strftime('%Y-%m-%d %H-%M-%S.%f') + ".tlm"))
 
         self.cmd_uid = 0
         self.cmd_sent = CMD_SET.CLEAR
@@ -177,28 +550,146 @@ class FluidController(Microcontroller):
 
         self.recorded_data = {}
 
-        super().__init__(self.serial_number, self.use_cobs)
+        # Latest-status snapshot shared with the reader thread
+        self.use_reader_thread = use_reader_thread
+        self.status_seq = 0
+        self._status_cond = threading.Condition()
+        self._reader_thread = None
+        self._reader_stop = threading.Event()
+        self._status_listeners = []
+        self._command_listeners = []
+
+        super().__init__(self.serial_number, self.use_cobs, port = port)
 
         return
 
     def __del__(self):
         '''Close the logfile if it's being used, reset, and disconnect'''
+        self.stop_reader()
         if self.log_measurements:
-            self.measurement_file.close()
+            self.telemetry.close()
         if self.serial is not None:
             self.serial.close()
         return
+
+    def begin(self):
+        '''Connect to the microcontroller and start the reader thread if enabled'''
+        super().begin()
+        if self.use_reader_thread:
+            self.start_reader()
+        return
+
+    def start_reader(self):
+        '''Start the background thread that drains the serial port and publishes each status packet'''
+        if self.reader_running():
+            return
+        self._reader_stop.clear()
+        self._reader_thread = threading.Thread(target=self._reader_loop, name='FluidControllerReader', daemon=True)
+        self._reader_thread.start()
+        return
+
+    def stop_reader(self):
+        '''Stop the background reader thread and wait for it to exit'''
+        self._reader_stop.set()
+        thread = self._reader_thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join()
+        self._reader_thread = None
+        return
+
+    def reader_running(self):
+        '''True if the background reader thread is alive'''
+        return self._reader_thread is not None and self._reader_thread.is_alive()
+
+    def _reader_loop(self):
+        '''Decode every packet the MCU sends until stop_reader() is called'''
+        while not self._reader_stop.is_set():
+            try:
+                msgs = self.read_received_packets_nowait()
+            except Exception as e:
+                print_message(f'MCU reader stopped: {e}')
+                # Wake up waiters so they can fall back to reading the port themselves
+                with self._status_cond:
+                    self._reader_stop.set()
+                    self._status_cond.notify_all()
+                break
+            if not msgs:
+                self._reader_stop.wait(self.READER_POLL_INTERVAL_S)
+                continue
+            for msg in msgs:
+                if len(msg) != MCU_MSG_LENGTH:
+                    # Corrupted frame, skip it
+                    continue
+                self._decode_and_publish(msg)
+        for callback in list(self._status_listeners):
+            callback(None)
+        return
+
+    def add_status_listener(self, callback):
+        '''
+        Call callback(status) with every decoded status packet, in arrival order.
+        When the reader thread exits, callback(None) is called once.
+        Callbacks run on the thread that decoded the packet and should return quickly.
+        '''
+        self._status_listeners.append(callback)
+
+    def remove_status_listener(self, callback):
+        if callback in self._status_listeners:
+            self._status_listeners.remove(callback)
+
+    def add_command_listener(self, callback):
+        '''Call callback(command, args) after every command is sent, on the sending thread'''
+        self._command_listeners.append(callback)
+
+    def remove_command_listener(self, callback):
+        if callback in self._command_listeners:
+            self._command_listeners.remove(callback)
+
+    def get_latest_status(self):
+        '''
+        Return (sequence number, status) for the most recently decoded packet without touching the serial port.
+        The sequence number is 0 until the first packet has been decoded.
+        '''
+        with self._status_cond:
+            return self.status_seq, self.recorded_data
     
-    def wait_for_completion(self):
-        '''Keep polling for status until it is no longer IN_PROGRESS, return the status'''
-        mcu_data = self.get_mcu_status()
-        status = mcu_data['MCU_command_execution_status']
-        while status == COMMAND_STATUS.IN_PROGRESS:
-            mcu_data = self.get_mcu_status()
-            status = mcu_data['MCU_command_execution_status']
-        
-        return status
-    
+    def wait_for_completion(self, uid=None, timeout=None):
+        '''
+        Wait until the MCU reports command `uid` (default: the last command sent) as no longer IN_PROGRESS, return the status.
+        Packets that still carry an older UID (sent before the command was accepted) are ignored.
+        If the reader thread is running, block on its snapshot condition instead of reading the serial port.
+        Raises TimeoutError if `timeout` seconds elapse first.
+        '''
+        if uid is None:
+            uid = self.cmd_uid
+
+        def is_complete(data):
+            return (data['MCU_received_command_UID'] == uid and
+                    data['MCU_command_execution_status'] != COMMAND_STATUS.IN_PROGRESS)
+
+        if self.reader_running():
+            with self._status_cond:
+                self._status_cond.wait_for(
+                    lambda: self._reader_stop.is_set() or (self.status_seq > 0 and is_complete(self.recorded_data)),
+                    timeout)
+                if self.status_seq > 0 and is_complete(self.recorded_data):
+                    return self.recorded_data['MCU_command_execution_status']
+                if not self._reader_stop.is_set():
+                    raise TimeoutError(f"Command {uid} did not complete within {timeout} s")
+            # The reader thread died, fall back to reading the port ourselves
+
+        deadline = None if timeout is None else time() + timeout
+        while True:
+            msg = self.read_received_packet_nowait(discard_buffer=True)
+            if msg is not None:
+                data = self._decode_and_publish(msg)
+                if is_complete(data):
+                    return data['MCU_command_execution_status']
+            if deadline is not None and time() > deadline:
+                raise TimeoutError(f"Command {uid} did not complete within {timeout} s")
+            if msg is None:
+                sleep(self.READER_POLL_INTERVAL_S)
+
     def add_uid_to_cmd(self, cmd):
         '''Break cmd_uid into two bytes and overwrite the first two bytes of the command array with the uid'''
         cmd[0] = self.cmd_uid >> 8
@@ -207,533 +698,115 @@ class FluidController(Microcontroller):
     
     def get_mcu_status(self):
         '''
-        Read a fixed-length packet from the microcontroller. If there is data available, unpack it. If in debug mode, print out the data. If we are aving logs, write to disc
+        Return the latest status from the microcontroller.
+        If the reader thread is running, return its most recent snapshot (blocking only until the first packet arrives).
+        Otherwise, read a fixed-length packet from the serial port and decode it.
         '''
-        msg = None
+        if self.reader_running():
+            with self._status_cond:
+                while self.status_seq == 0 and self.reader_running():
+                    self._status_cond.wait(0.1)
+                if self.status_seq > 0:
+                    return self.recorded_data
+        msg = self.read_received_packet_nowait(discard_buffer=True)
         while msg is None:
+            sleep(self.READER_POLL_INTERVAL_S)
             msg = self.read_received_packet_nowait(discard_buffer=True)
-        assert (len(msg) == MCU_MSG_LENGTH), f"Expected message of len {MCU_CMD_LENGTH}, got len {len(msg)}"
+        return self._decode_and_publish(msg)
 
+    def _decode_and_publish(self, msg):
         '''
-        #########################################################
-        #########   MCU -> Computer message structure   #########
-        #########################################################
-        byte 0-1    : computer -> MCU CMD counter (UID)
-        byte 2      : cmd from host computer (error checking through check sum => no need to transmit back the parameters associated with the command)
-        byte 3      : status of the command (see _def.py)
-        byte 4      : MCU internal program being executed (see _def.py)
-        byte 5      : Bubble sensor state (high and low nibble)
-        byte 6-10   : Selector valves status (1,2,3,4,5)
-        byte 11-12  : state of valve D1-D16
-        byte 13-14  : pump power
-        byte 15-16  : pressure sensor 1 reading
-        byte 17-18  : pressure sensor 2 reading
-        byte 19-20  : pressure sensor 3 reading
-        byte 21-22  : pressure sensor 4 reading
-        byte 23-24  : flow sensor 1 reading
-        byte 25-26  : flow sensor 2 reading
-        byte 27     : elapsed time since the start of the last internal program (in seconds)
-        byte 28-29  : total volume (ul), range: 0 - 5000
-
+        Unpack a status packet (layout documented in mcu_status.py). If in debug mode, print out the data. If we are saving logs, append the raw packet to the telemetry file.
+        Publish the result as the latest snapshot and wake up anyone waiting on it.
         '''
-        if self.debug:
-            print(str(list(msg)))
-
-        MCU_received_command_UID = (msg[0] << 8) + msg[1] 
-        MCU_received_command = msg[2]
-        MCU_command_execution_status = msg[3]
-        MCU_interal_program = msg[4]
-
-        bubble_sensor_1_state, bubble_sensor_2_state = split_byte(msg[5])
-
-        selector_valve_1_pos = msg[6]
-        selector_valve_2_pos = msg[7]
-        selector_valve_3_pos = msg[8]
-        selector_valve_4_pos = msg[9]
-        selector_valve_5_pos = msg[10]
+        assert (len(msg) == MCU_MSG_LENGTH), f"Expected message of len {MCU_MSG_LENGTH}, got len {len(msg)}"
 
-        solenoid_valves = np.int16((int(msg[11])<<8) + msg[12])
-
-        measurement_pump_power = MCU_CONSTANTS.TTP_MAX_PW * float((int(msg[13])<<8)+msg[14])/np.iinfo(np.uint16).max
-
-        _pressure_1_raw = (int(msg[15])<<8) + msg[16]
-        _pressure_2_raw = (int(msg[17])<<8) + msg[18]
-        _pressure_3_raw = (int(msg[19])<<8) + msg[20]
-        _pressure_4_raw = (int(msg[21])<<8) + msg[22]
-        
-        def raw_to_psi(raw_pressure):
-            return (raw_pressure - MCU_CONSTANTS._output_min) * (MCU_CONSTANTS._p_max - MCU_CONSTANTS._p_min) / (MCU_CONSTANTS._output_max - MCU_CONSTANTS._output_min) + MCU_CONSTANTS._p_min
+        if self.log_measurements:
+            self.telemetry.append(msg)
 
-        pressure_1 = raw_to_psi(_pressure_1_raw)
-        pressure_2 = raw_to_psi(_pressure_2_raw)
-        pressure_3 = raw_to_psi(_pressure_3_raw)
-        pressure_4 = raw_to_psi(_pressure_4_raw)
-        
-        flow_1 = float(np.int16((int(msg[23])<<8)+msg[24]))/MCU_CONSTANTS.SCALE_FACTOR_FLOW
-        flow_2 = float(np.int16((int(msg[25])<<8)+msg[26]))/MCU_CONSTANTS.SCALE_FACTOR_FLOW
-        MCU_CMD_time_elapsed = msg[27]
+        if self.debug:
+            print(str(list(msg)))
 
-        vol_ul = (float(np.int16((int(msg[28])<<8)+msg[29]))/np.iinfo(np.int16).max)*MCU_CONSTANTS.VOLUME_UL_MAX
+        status = decode_status(msg)
 
-        # Write the data to file
-        if self.log_measurements or self.debug:
+        if self.debug:
             line = (f"{datetime.now().strftime('%m/%d %H:%M:%S')},"
-                    f"{MCU_received_command_UID},"
-                    f"{MCU_received_command},"
-                    f"{MCU_command_execution_status},"
-                    f"{MCU_interal_program},"
-                    f"{bubble_sensor_1_state:>04b},"
-                    f"{bubble_sensor_2_state:>04b},"
-                    f"{MCU_CMD_time_elapsed},"
-                    f"{selector_valve_1_pos},"
-                    f"{selector_valve_2_pos},"
-                    f"{selector_valve_3_pos},"
-                    f"{selector_valve_4_pos},"
-                    f"{selector_valve_5_pos},"
-                    f"{solenoid_valves:>016b},"
-                    f"{measurement_pump_power:.2f},"
-                    f"{pressure_1:.2f},"
-                    f"{pressure_2:.2f},"
-                    f"{pressure_3:.2f},"
-                    f"{pressure_4:.2f},"
-                    f"{flow_1:.2f},"
-                    f"{flow_2:.2f},"
-                    f"{vol_ul:.2f}\n")
-            if self.log_measurements:
-                self.measurement_file.write(line)
-                self.counter_measurement_file_flush += 1
-                if self.counter_measurement_file_flush >= 500:
-                    self.counter_measurement_file_flush = 0
-                    self.measurement_file.flush()
-            if self.debug:
-                print(line)
+                    f"{status.MCU_received_command_UID},"
+                    f"{status.MCU_received_command},"
+                    f"{status.MCU_command_execution_status},"
+                    f"{status.MCU_interal_program},"
+                    f"{status.bubble_sensor_states[0]:>04b},"
+                    f"{status.bubble_sensor_states[1]:>04b},"
+                    f"{status.MCU_CMD_time_elapsed},"
+                    f"{status.selector_valves_pos[0]},"
+                    f"{status.selector_valves_pos[1]},"
+                    f"{status.selector_valves_pos[2]},"
+                    f"{status.selector_valves_pos[3]},"
+                    f"{status.selector_valves_pos[4]},"
+                    f"{status.solenoid_valves:>016b},"
+                    f"{status.measurement_pump_power:.2f},"
+                    f"{status.pressures[0]:.2f},"
+                    f"{status.pressures[1]:.2f},"
+                    f"{status.pressures[2]:.2f},"
+                    f"{status.pressures[3]:.2f},"
+                    f"{status.flowrates[0]:.2f},"
+                    f"{status.flowrates[1]:.2f},"
+                    f"{status.vol_ul:.2f}")
+            print(line)
 
         # this block of code should only be used when get_mcu_status is executed at fixed interval (< 1s)
         '''
         # Check for mismatch between received command and transmitted command
-        if (MCU_received_command != self.cmd_sent) or (MCU_received_command_UID != self.cmd_uid):
+        if (status.MCU_received_command != self.cmd_sent) or (status.MCU_received_command_UID != self.cmd_uid):
             if self.timestamp_last_mismatch is None:
                 self.timestamp_last_mismatch = time()
             else:
                 dt = time() - self.timestamp_last_mismatch
                 assert (dt < T_DIFF_COMPUTER_MCU_MISMATCH_FAULT_THRESHOLD_SECONDS), f"Command mismatch for {dt} seconds"
-                print((MCU_received_command, self.cmd_sent))
-                print((MCU_received_command_UID, self.cmd_uid))
+                print((status.MCU_received_command, self.cmd_sent))
+                print((status.MCU_received_command_UID, self.cmd_uid))
         else:
             self.timestamp_last_mismatch = None
         '''
 
-        # Load latest data into a shared dict
-        self.recorded_data = {
-            "MCU_received_command_UID": MCU_received_command_UID,
-            "MCU_received_command": MCU_received_command,
-            "MCU_command_execution_status": MCU_command_execution_status,
-            "MCU_interal_program": MCU_interal_program,
-            "bubble_sensor_states": [bubble_sensor_1_state, bubble_sensor_2_state],
-            "MCU_CMD_time_elapsed": MCU_CMD_time_elapsed,
-            "selector_valves_pos": [selector_valve_1_pos, selector_valve_2_pos, selector_valve_3_pos, selector_valve_4_pos, selector_valve_5_pos],
-            "solenoid_valves": solenoid_valves,
-            "measurement_pump_power": measurement_pump_power,
-            "pressures": [pressure_1, pressure_2, pressure_3, pressure_4],
-            "flowrates": [flow_1, flow_2],
-            "vol_ul": vol_ul
-        }
+        with self._status_cond:
+            self.recorded_data = status
+            self.status_seq += 1
+            self._status_cond.notify_all()
 
-        return self.recorded_data
+        for callback in list(self._status_listeners):
+            callback(status)
+
+        return status
 
     def send_command(self, command, *args):
         '''
         Commands are formatted as UID, command, parameters (arb. length)
-        Parameters are formatted differently depending on the command
+        Parameters are formatted differently depending on the command (see encode_command)
         '''
-        command_array = [0, 0] # Initialize with two empty cells for UID
-        self.cmd_uid += 1
-
-        self.cmd_sent = np.uint8(command)
-        assert self.cmd_sent == command, "Command is not uint8"
-        command_array.append(self.cmd_sent)
-
+        command_array = encode_command(command, *args)
+        self.cmd_uid = (self.cmd_uid + 1) & 0xFFFF # UID is sent as two bytes
         if command == CMD_SET.CLEAR:
             self.cmd_uid = 0
-            pass
-        elif command == CMD_SET.INITIALIZE_DISC_PUMP:
-            # For disc pump, we need pwr limit (2 bytes), source, mode, and stream config
-            assert len(args) == 1, "Need power limit"
-            pwr_lim = np.uint16(args[0])
-            assert pwr_lim == args[0], "Power limit not a uint16"
-
-            pwr_lim_hi, pwr_lim_lo = uint_to_bytes(pwr_lim, 2)
-
-            command_array.append(pwr_lim_hi)
-            command_array.append(pwr_lim_lo)
-            pass
-        elif command == CMD_SET.INITIALIZE_PRESSURE_SENSOR:
-            # Need index of pressure sensor to init
-            assert len(args) == 1, "Need sensor index"
-            idx = np.uint8(args[0])
-            assert idx == args[0], "Index is not a uint8"
-            
-            command_array.append(idx)
-            pass
-        elif command == CMD_SET.INITIALIZE_FLOW_SENSOR:
-            # Need index, medium, and do_crc
-            assert len(args) == 3, "Need I2C index, liquid medium, and whether we do CRC positional arguments"
-            idx = np.uint8(args[0])
-            assert idx == args[0], "Index not an int16"
-            medium = np.uint8(args[1])
-            assert medium in MCU_CONSTANTS.MEDIA, "Medium not recognized, must be MEDIUM_IPA or MEDIUM_WATER"
-            do_crc = bool(args[2])
-            assert do_crc == args[2], "do_crc setting is not a boolean"
-
-            command_array.append(idx)
-            command_array.append(medium)
-            command_array.append(do_crc)
-            pass
-        elif command == CMD_SET.INITIALIZE_BUBBLE_SENSORS:
-            # Need no additional info
-            assert len(args) == 0, "Unnecessary arguments present"
-            pass
-        elif command == CMD_SET.INITIALIZE_VALVES:
-            # Need no additional info
-            assert len(args) == 0, "Unnecessary arguments present"
-            pass
-        elif command == CMD_SET.INITIALIZE_BANG_BANG_PARAMS:
-            # Need loop type, low threshold, high threshold, min out, max out, and timestep
-            assert len(args) == 6, "Need loop type, low/high thresholds, min/max outputs, and timestep (ms)"
-            
-            loop_type = np.uint8(args[0])
-            assert loop_type in MCU_CONSTANTS.BB_LOOP_TYPES, "loop type is not a bang-bang type"
-
-            t_lower_intermediate = args[1] * MCU_CONSTANTS.SCALE_FACTOR_FLOW
-            t_lower = np.uint16(t_lower_intermediate)
-            assert t_lower_intermediate == t_lower, "Error calculating lower bound"
-            t_upper_intermediate = args[2] * MCU_CONSTANTS.SCALE_FACTOR_FLOW
-            t_upper = np.uint16(t_upper_intermediate)
-            assert t_upper_intermediate == t_upper, "Error calculating upper bound"
-
-            o_lower = np.uint16(args[3])
-            assert args[3] == o_lower, "Lower output not uint16"
-            o_upper = np.uint16(args[4])
-            assert args[4] == o_upper, "Upper output not uint16"
-
-            timestep = np.uint32(args[5])
-            assert timestep == args[5], "Timestep is not uint32"
-
-            t_lower_hi, t_lower_lo = uint_to_bytes(t_lower, 2)
-            t_upper_hi, t_upper_lo = uint_to_bytes(t_upper, 2)
-            o_lower_hi, o_lower_lo = uint_to_bytes(o_lower, 2)
-            o_upper_hi, o_upper_lo = uint_to_bytes(o_upper , 2)
-
-            tstep_3, tstep_2, tstep_1, tstep_0 = uint_to_bytes(timestep, 4)
-
-            command_array.append(loop_type)
-            command_array.append(t_lower_hi)
-            command_array.append(t_lower_lo)
-            command_array.append(t_upper_hi)
-            command_array.append(t_upper_lo)
-            command_array.append(o_lower_hi)
-            command_array.append(o_lower_lo)
-            command_array.append(o_upper_hi)
-            command_array.append(o_upper_lo)
-            command_array.append(tstep_3)
-            command_array.append(tstep_2)
-            command_array.append(tstep_1)
-            command_array.append(tstep_0)
-
-            pass
-        elif command == CMD_SET.INITIALIZE_PID_PARAMS:
-            # Need loop type, Kp, Ki, Kd, intergral winding limit, min/max outputs, and timestep
-            assert len(args) == 8, "Need loop type, Kp/Ki/Kd, winding limit, min/max outputs, and timestep (ms)"
-
-            loop_type = np.uint8(args[0])
-            assert loop_type in MCU_CONSTANTS.PID_LOOP_TYPES, "loop type is not PID type"
-
-            kp_intermediate = int((args[1]/MCU_CONSTANTS.KP_MAX) * np.iinfo(np.uint16).max)
-            kp = np.uint16(kp_intermediate)
-            assert kp_intermediate == kp, "Error calculating Kp"
-
-            ki_intermediate = int((args[2]/MCU_CONSTANTS.KI_MAX) * np.iinfo(np.uint16).max)
-            ki = np.uint16(ki_intermediate)
-            assert ki_intermediate == ki, "Error calculating Ki"
-
-            kd_intermediate = int((args[3]/MCU_CONSTANTS.KD_MAX) * np.iinfo(np.uint16).max)
-            kd = np.uint16(kd_intermediate)
-            assert kd_intermediate == kd, "Error calculating Kd"
-
-            ilim_intermediate = int((args[4]/MCU_CONSTANTS.ILIM_MAX) * np.iinfo(np.uint16).max)
-            ilim = np.uint16(ilim_intermediate)
-            assert ilim_intermediate == ilim, "Error calculating integral winding limit"
-            
-
-            o_lower = np.uint16(args[5])
-            assert args[5] == o_lower, "Lower output not uint16"
-            o_upper = np.uint16(args[6])
-            assert args[6] == o_upper, "Upper output not uint16"
-
-            timestep = np.uint32(args[7])
-            assert timestep == args[7], "Timestep is not uint32"
-
-            kp_hi, kp_lo = uint_to_bytes(kp, 2)
-            ki_hi, ki_lo = uint_to_bytes(ki, 2)
-            kd_hi, kd_lo = uint_to_bytes(kd, 2)
-            ilim_hi, ilim_lo = uint_to_bytes(ilim, 2)
-            o_lower_hi, o_lower_lo = uint_to_bytes(o_lower, 2)
-            o_upper_hi, o_upper_lo = uint_to_bytes(o_upper , 2)
-
-            tstep_3, tstep_2, tstep_1, tstep_0 = uint_to_bytes(timestep, 4)
-
-            command_array.append(loop_type)
-            command_array.append(kp_hi)
-            command_array.append(kp_lo)
-            command_array.append(ki_hi)
-            command_array.append(ki_lo)
-            command_array.append(kd_hi)
-            command_array.append(kd_lo)
-            command_array.append(ilim_hi)
-            command_array.append(ilim_lo)
-            command_array.append(o_lower_hi)
-            command_array.append(o_lower_lo)
-            command_array.append(o_upper_hi)
-            command_array.append(o_upper_lo)
-            command_array.append(tstep_3)
-            command_array.append(tstep_2)
-            command_array.append(tstep_1)
-            command_array.append(tstep_0)
-            pass
-        elif command == CMD_SET.SET_SOLENOID_VALVES:
-            # For setting all valves, need 16 bit setting
-            assert len(args) == 1, "Need setting"
-            setting = np.uint16(args[0])
-            assert setting == args[0], "Setting not an int16"
-
-            setting_hi, setting_lo = uint_to_bytes(setting, 2)
-            command_array.append(setting_hi)
-            command_array.append(setting_lo)
-            pass
-        elif command == CMD_SET.SET_SOLENOID_VALVE:
-            # For setting an individual valve, need on/off bool and index
-            assert len(args) == 2, "Need on/off bool and index"
-            on_off = bool(args[0])
-            assert on_off == args[0], "on_off setting is not a boolean"
-            idx = np.uint8(args[1])
-            assert idx == args[1], "idx is not uint8"
-
-            command_array.append(on_off)
-            command_array.append(idx)
-            pass
-        elif command == CMD_SET.SET_PUMP_PWR_OPEN_LOOP:
-            # To set the pump power, we just need the power
-            assert len(args) == 1, "Need power (milliwatts)"
-            pwr = np.uint16(args[0])
-            assert pwr == args[0], "power is not uint16"
-            pwr_hi, pwr_lo = uint_to_bytes(pwr, 2)
-            command_array.append(pwr_hi)
-            command_array.append(pwr_lo)
-            pass
-        elif command == CMD_SET.INITIALIZE_ROTARY:
-            # Initialize rotary valve with index and max positions
-            assert len(args) == 2, "Need index and number of positions"
-            idx = np.uint8(args[0])
-            assert idx == args[0], "index is not uint8"
-            n_pos = np.uint8(args[1])
-            assert n_pos == args[1], "Number of positions is not uint8"
-
-            command_array.append(idx)
-            command_array.append(n_pos)
-            pass
-        elif command == CMD_SET.SET_ROTARY_VALVE:
-            # Set rotary valve position, we need index and target position
-            assert len(args) == 2, "Need index and target position"
-            idx = np.uint8(args[0])
-            assert idx == args[0], "index is not uint8"
-            target = np.uint8(args[1])
-            assert target == args[1], "target position is not uint8"
-
-            command_array.append(idx)
-            command_array.append(target)
-            pass
-        elif command ==  CMD_SET.BEGIN_CLOSED_LOOP:
-            # Begin one of the control loops. We need the type of loop to begin
-            assert len(args) == 1, "Need loop type"
-            loop_type = np.uint8(args[0])
-            assert loop_type in MCU_CONSTANTS.LOOP_TYPES, "loop type not valid"
-            
-            command_array.append(loop_type)
-            pass
-        elif command == CMD_SET.STOP_CLOSED_LOOP:
-            # Need no additional info
-            assert len(args) == 0, "Unnecessary arguments present"
-            pass
-        elif (command == CMD_SET.REMOVE_ALL_MEDIUM) or (command == CMD_SET.EJECT_MEDIUM):
-            # Need open loop disc pump power, debounce time (ms), timeout time(ms), and pressure scale
-            assert len(args) == 4, "Need power, debounce time, timeout time, and pressure scale"
-
-            o_power = np.uint16(args[0])
-            assert args[0] == o_power, "Open loop power not uint16"
-            
-            t_debounce = np.uint16(args[1])
-            assert t_debounce == args[1], "debounce time is not uint16"
-
-            t_timeout = np.uint16(args[2])
-            assert t_timeout == args[2], "timeout time is not uint16"
-
-            pscale_intermediate = int(args[3] * np.iinfo(np.uint8).max)
-            pscale = np.uint8(pscale_intermediate)
-            assert pscale == pscale_intermediate, "error calculating pscale"
-
-            pwr_hi, pwr_lo = uint_to_bytes(o_power, 2)
-            db_hi, db_lo = uint_to_bytes(t_debounce, 2)
-            tt_hi,tt_lo = uint_to_bytes(t_timeout, 2)
-            command_array.append(pwr_hi)
-            command_array.append(pwr_lo)
-            command_array.append(tt_hi)
-            command_array.append(tt_lo)
-            command_array.append(db_hi)
-            command_array.append(db_lo)
-            command_array.append(pscale)
-            pass
-        elif command == CMD_SET.CLEAR_LINES:
-            # Need open loop disc pump power, debounce time (ms), and timeout time(ms)
-            assert len(args) == 3, "Need power, debounce time, and timeout time"
-
-            o_power = np.uint16(args[0])
-            assert args[0] == o_power, "Open loop power not uint16"
-            
-            t_debounce = np.uint16(args[1])
-            assert t_debounce == args[1], "debounce time is not uint16"
-
-            t_timeout = np.uint16(args[2])
-            assert t_timeout == args[2], "timeout time is not uint16"
-
-            pwr_hi, pwr_lo = uint_to_bytes(o_power, 2)
-            db_hi, db_lo = uint_to_bytes(t_debounce, 2)
-            tt_hi,tt_lo = uint_to_bytes(t_timeout, 2)
-            command_array.append(pwr_hi)
-            command_array.append(pwr_lo)
-            command_array.append(tt_hi)
-            command_array.append(tt_lo)
-            command_array.append(db_hi)
-            command_array.append(db_lo)
-            
-        elif command == CMD_SET.LOAD_FLUID_TO_SENSOR:
-            # Need open loop power and timeout time 
-            assert len(args) == 2, "Need power and timeout time"
-
-            pwr = np.uint16(args[0])
-            assert pwr == args[0], "power is not uint16"
-            t_timeout = np.uint16(args[1])
-            assert t_timeout == args[1], "timeout time is not uint16"
-
-            pwr_hi, pwr_lo = uint_to_bytes(pwr, 2)
-            tt_hi,tt_lo = uint_to_bytes(t_timeout, 2)
-            command_array.append(pwr_hi)
-            command_array.append(pwr_lo)
-            command_array.append(tt_hi)
-            command_array.append(tt_lo)
-            pass
-        elif command == CMD_SET.VOL_INTEGRATE_SETTING:
-            # Set whether to perform volume integration and reset the integrated volume
-            assert len(args) == 2, "Need vol integration setting and reset setting"
-            do_integration = bool(args[0])
-            assert do_integration == args[0], "do_integration setting is not a boolean"
-            reset_volume = bool(args[1])
-            assert reset_volume == args[1], "reset_volume setting is not a boolean" 
-
-            command_array.append(do_integration)
-            command_array.append(reset_volume)
-            pass
-        elif (command == CMD_SET.LOAD_FLUID_VOLUME) or (command == CMD_SET.UNLOAD_FLUID_VOLUME):
-            # Need control type, setpoint (ignore if control type is BB), timeout time in ms, and volume to load
-            loop_type = np.uint8(args[0])
-            assert loop_type == args[0], "Loop type must be uint8"
-            if (loop_type == MCU_CONSTANTS.FLUID_IN_BANG_BANG) or (loop_type == MCU_CONSTANTS.FLUID_OUT_BANG_BANG) :
-                assert len(args) == 3, "Need control type, timeout time, and volume target"
-                i_shift = 1
-            else:
-                assert len(args) == 4, "Need control type, setpoint, timeout time, and volume target"
-                i_shift = 0
-            
-            if command == CMD_SET.LOAD_FLUID_VOLUME:
-                assert loop_type in [MCU_CONSTANTS.OPEN_LOOP_CTRL, MCU_CONSTANTS.FLUID_IN_BANG_BANG, MCU_CONSTANTS.VACUUM_PID], "Control type must be open loop, fluid in BB, or vacuum PID"
-            else:
-                assert loop_type in [MCU_CONSTANTS.OPEN_LOOP_CTRL, MCU_CONSTANTS.FLUID_OUT_BANG_BANG, MCU_CONSTANTS.FLUID_OUT_PID, MCU_CONSTANTS.PRESSURE_PID], "Control type must be open loop, fluid out BB, fluid out PID, or pressure PID"
-            
-            t_timeout = np.uint16(args[2-i_shift])
-            assert t_timeout == args[2-i_shift], "timeout time is not uint16"
-
-            volume_intermediate = int((args[3-i_shift]/MCU_CONSTANTS.VOLUME_UL_MAX) * np.iinfo(np.uint16).max)
-            volume = np.uint16(volume_intermediate)
-            assert volume_intermediate == volume, "Error calculating volume"
-
-            # Setpoint is either a pressure or disc pump power depending on loop type
-            setpoint = 0
-            if loop_type == MCU_CONSTANTS.OPEN_LOOP_CTRL:
-                setpoint = np.uint16(args[1])
-                assert setpoint == args[1], "power not uint16"
-            elif (loop_type == MCU_CONSTANTS.VACUUM_PID) or (loop_type == MCU_CONSTANTS.PRESSURE_PID):
-                setpoint_intermediate = int(MCU_CONSTANTS._output_min + (args[0] - MCU_CONSTANTS._p_min) * (MCU_CONSTANTS._output_max - MCU_CONSTANTS._output_min) / (MCU_CONSTANTS._p_max - MCU_CONSTANTS._p_min))
-                setpoint = np.uint16(setpoint_intermediate)
-                assert setpoint == setpoint_intermediate, "Error calculating pressure setpoint"
-            elif loop_type == MCU_CONSTANTS.FLUID_OUT_PID:
-                setpoint_intermediate = int((abs(args[1])/abs(MCU_CONSTANTS.SLF3X_MAX_VAL_uL_MIN)) * np.iinfo(np.uint16).max)
-                setpoint = np.uint16(setpoint_intermediate)
-                assert setpoint == setpoint_intermediate, "Error calculating pressure setpoint"
-            
-            # 1 for setting the control type, 2 for setpoint (if applicable), 2 for timeout, 2 for volume setpoint
-            sp_hi, sp_lo = uint_to_bytes(setpoint, 2)
-            tt_hi, tt_lo = uint_to_bytes(t_timeout, 2)
-            vol_hi, vol_lo = uint_to_bytes(volume, 2)
-            command_array.append(loop_type)
-            command_array.append(sp_hi)
-            command_array.append(sp_lo)
-            command_array.append(tt_hi)
-            command_array.append(tt_lo)
-            command_array.append(vol_hi)
-            command_array.append(vol_lo)
-            pass
-        elif command == CMD_SET.VENT_VB0:
-            # 3 bytes for cmd and UID, 2 for vacuum threshold, 2 for timeout
-            assert len(args) == 2, "Need vacuum threshold and timeout time"
-
-            vacuum_intermediate = int(MCU_CONSTANTS._output_min + (args[0] - MCU_CONSTANTS._p_min) * (MCU_CONSTANTS._output_max - MCU_CONSTANTS._output_min) / (MCU_CONSTANTS._p_max - MCU_CONSTANTS._p_min))
-            vacuum = np.uint16(vacuum_intermediate)
-            assert vacuum_intermediate == vacuum, "Error calculating vacuum setting"
-            t_timeout = np.uint16(args[1])
-            assert t_timeout == args[1], "timeout time is not uint16"
-
-            tt_hi, tt_lo = uint_to_bytes(t_timeout, 2)
-            v_hi, v_lo = uint_to_bytes(vacuum, 2)
-            command_array.append(v_hi)
-            command_array.append(v_lo)
-            command_array.append(tt_hi)
-            command_array.append(tt_lo)
-            pass
-        elif command == CMD_SET.DELAY_MS:
-            # Do nothing for set time
-            assert len(args) == 1, "Need delay time"
-            delaytime = np.uint32(args[0])
-            assert delaytime == args[0], "delay time is not uint32"
-
-            dt_3, dt_2, dt_1, dt_0 = uint_to_bytes(delaytime, 4)
-            command_array.append(dt_3)
-            command_array.append(dt_2)
-            command_array.append(dt_1)
-            command_array.append(dt_0)
-        else:
-            # If we don't recognize the command, raise an error
-            raise Exception("Command not recognized")
+        self.cmd_sent = command_array[2]
 
         self.add_uid_to_cmd(command_array)
         self.send_mcu_command(command_array)
-        pass
+        for callback in list(self._command_listeners):
+            callback(command, args)
+        return self.cmd_uid
 
-    def send_command_blocking(self, command, *args):
+    def send_command_blocking(self, command, *args, timeout=None):
         '''Send a command, then write logs while waiting for it to complete'''
-        self.send_command(command, *args)
-        return self.wait_for_completion()
+        uid = self.send_command(command, *args)
+        return self.wait_for_completion(uid, timeout)
 
     def delay(self, dt):
         '''Keep logging data for time t'''
+        if self.reader_running():
+            # The reader thread is already logging every packet
+            sleep(dt)
+            return
         tf = time() + dt
         while time() <= tf:
             self.get_mcu_status()
@@ -741,29 +814,37 @@ class FluidController(Microcontroller):
 
 
 class FluidControllerSimulation():
-    def __init__(self, serial_number, use_cobs = True, log_measurements = False, debug = False):
+    def __init__(self, serial_number, use_cobs = True, log_measurements = False, debug = False, clock = None):
+        # clock: a virtual_clock.VirtualClock to wait on instead of real time
+        self.clock = clock
         self.data = {
             'selector_valves_pos': {0: 1, 1: 1, 2: 1, 3: 1, 4: 1}
         }
         return
 
+    def _sleep(self, seconds):
+        if self.clock is None:
+            sleep(seconds)
+        else:
+            self.clock.sleep(seconds)
+
     def begin(self):
         print("Simulated fluid controller.")
 
     def send_command(self, command, *args):
-        sleep(1)
+        self._sleep(1)
         if command == CMD_SET.SET_ROTARY_VALVE:
             self.data['selector_valves_pos'][args[0]] = args[1]
         return
 
-    def send_command_blocking(self, command, *args):
-        sleep(2)
+    def send_command_blocking(self, command, *args, timeout=None):
+        self._sleep(2)
         if command == CMD_SET.SET_ROTARY_VALVE:
             self.data['selector_valves_pos'][args[0]] = args[1]
-        return
+        return COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS
 
-    def wait_for_completion(self):
-        pass
+    def wait_for_completion(self, uid=None, timeout=None):
+        return COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS
 
     def get_mcu_status(self):
         return self.data
\ No newline at end of file
@@ -0,0 +1,145 @@
+"""Serial port enumeration shared by every device.
+
+`list_ports.comports()` reads the USB descriptors of every serial device on
+the machine, which takes seconds on hosts with many USB devices. A
+`DeviceRegistry` enumerates the ports once, indexes them by USB serial
+number, VID:PID and USB location, and serves every device lookup from that
+scan. The scan is repeated when the set of serial device nodes changes
+(hotplug), when it is older than `MAX_AGE_S`, or when a lookup misses a
+device that may just have been plugged in.
+
+The controllers, the syringe pump and the temperature controller resolve
+their serial numbers through the module-level `registry`, so one instrument
+start-up costs a single enumeration.
+"""
+
+import glob
+import sys
+import threading
+from time import monotonic
+
+from serial.tools import list_ports
+
+
+def port_vid_pid(port):
+    '''"VVVV:PPPP" (lowercase hex) of a ListPortInfo, or None for non-USB ports'''
+    if port.vid is None or port.pid is None:
+        return None
+    return f'{port.vid:04x}:{port.pid:04x}'
+
+
+def port_fingerprint():
+    '''
+    Cheap summary of the serial device nodes present, used to notice hotplug without a full enumeration.
+    Returns None where the platform offers no cheap listing (the scan then only ages out).
+    '''
+    if sys.platform.startswith('linux'):
+        return tuple(sorted(glob.glob('/dev/tty[A-Z]*') + glob.glob('/dev/rfcomm*')))
+    if sys.platform.startswith('darwin'):
+        return tuple(sorted(glob.glob('/dev/tty.*')))
+    return None
+
+
+class DeviceRegistry:
+    # A scan older than this is repeated even if no hotplug was noticed
+    MAX_AGE_S = 30.0
+
+    def __init__(self, comports=None, fingerprint=port_fingerprint, max_age_s=None):
+        '''
+        Arguments:
+            comports: enumeration function, list_ports.comports by default
+            fingerprint: hotplug detector, see port_fingerprint (None disables it)
+            max_age_s: overrides MAX_AGE_S
+        '''
+        self._comports = comports or list_ports.comports
+        self._fingerprint = fingerprint
+        self.max_age_s = self.MAX_AGE_S if max_age_s is None else max_age_s
+        self._lock = threading.Lock()
+        self._ports = None
+        self._scan_fingerprint = None
+        self._scanned_at = None
+        self.by_serial_number = {}
+        self.by_vid_pid = {}
+        self.by_location = {}
+
+    def invalidate(self):
+        '''Drop the cached scan; the next lookup enumerates the ports again'''
+        with self._lock:
+            self._ports = None
+
+    def _is_stale(self):
+        if self._ports is None or monotonic() - self._scanned_at > self.max_age_s:
+            return True
+        return self._fingerprint is not None and self._fingerprint() != self._scan_fingerprint
+
+    def _scan(self):
+        fingerprint = self._fingerprint() if self._fingerprint is not None else None
+        ports = list(self._comports())
+        by_serial_number, by_vid_pid, by_location = {}, {}, {}
+        for p in ports:
+            if p.serial_number:
+                by_serial_number.setdefault(p.serial_number, p)
+            key = port_vid_pid(p)
+            if key is not None:
+                by_vid_pid.setdefault(key, []).append(p)
+            if p.location:
+                by_location.setdefault(p.location, p)
+        self._ports = ports
+        self._scan_fingerprint = fingerprint
+        self._scanned_at = monotonic()
+        self.by_serial_number = by_serial_number
+        self.by_vid_pid = by_vid_pid
+        self.by_location = by_location
+
+    def ports(self, refresh=False):
+        '''
+        Returns:
+            list: ListPortInfo of every serial port, from the cached scan unless it is stale or refresh is set
+        '''
+        with self._lock:
+            if refresh or self._is_stale():
+                self._scan()
+            return list(self._ports)
+
+    def _match(self, serial_number, vid_pid_, location):
+        if serial_number is not None:
+            candidates = [self.by_serial_number[serial_number]] if serial_number in self.by_serial_number else []
+        elif vid_pid_ is not None:
+            candidates = self.by_vid_pid.get(vid_pid_.lower(), [])
+        elif location is not None:
+            candidates = [self.by_location[location]] if location in self.by_location else []
+        else:
+            raise ValueError('find() needs a serial_number, vid_pid or location')
+        return [p for p in candidates
+                if (vid_pid_ is None or port_vid_pid(p) == vid_pid_.lower())
+                and (location is None or p.location == location)]
+
+    def find(self, serial_number=None, vid_pid=None, location=None):
+        '''
+        Look up a port matching all the given criteria.
+        Arguments:
+            String serial_number: USB serial number
+            String vid_pid: "VVVV:PPPP" in hex
+            String location: USB location (e.g. "1-1.2:1.0")
+        Returns:
+            ListPortInfo of the first match, or None if there is none after a fresh scan
+        '''
+        with self._lock:
+            fresh = self._is_stale()
+            if fresh:
+                self._scan()
+            matches = self._match(serial_number, vid_pid, location)
+            if not matches and not fresh:
+                # The device may have been plugged in after the cached scan
+                self._scan()
+                matches = self._match(serial_number, vid_pid, location)
+        return matches[0] if matches else None
+
+    def find_device(self, serial_number=None, vid_pid=None, location=None):
+        '''Like find(), but returns the device path (e.g. /dev/ttyACM0) or None'''
+        port = self.find(serial_number, vid_pid, location)
+        return port.device if port is not None else None
+
+
+# Shared by every device of the process
+registry = DeviceRegistry()
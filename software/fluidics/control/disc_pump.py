@@ -2,8 +2,10 @@ from ._def import CMD_SET, MCU_CONSTANTS
 import threading
 
 class DiscPump():
-    def __init__(self, fluid_controller):
+    def __init__(self, fluid_controller, clock=None):
         self.fc = fluid_controller
+        # clock: a virtual_clock.VirtualClock to wait on instead of real time
+        self.clock = clock
         self._is_started = False
         self._abort_event = threading.Event()
         self._abort_event.clear()
@@ -21,7 +23,10 @@ class DiscPump():
     def aspirate(self, time_s):
         self.fc.send_command(CMD_SET.SET_PUMP_PWR_OPEN_LOOP, MCU_CONSTANTS.TTP_MAX_PW)
         self.fc.wait_for_completion()
-        self._abort_event.wait(time_s)
+        if self.clock is None:
+            self._abort_event.wait(time_s)
+        else:
+            self.clock.wait(self._abort_event, time_s)
         self.fc.send_command(CMD_SET.SET_PUMP_PWR_OPEN_LOOP, 0)
         self.fc.wait_for_completion()
 
@@ -0,0 +1,113 @@
+"""Frame readers that split the raw MCU serial byte stream into packets.
+
+Both readers are fed whatever bytes are waiting on the port in one call and
+keep the complete frames in arrival order, so draining a backlog costs one
+serial read instead of one per byte.
+"""
+
+from collections import deque
+
+from cobs import cobs
+
+
+def _decodes_memoryview():
+    '''True if cobs.decode accepts a memoryview; the cobs 1.2 C extension only takes bytes and bytearray'''
+    try:
+        cobs.decode(memoryview(b'\x01'))
+    except BufferError:
+        return False
+    return True
+
+
+class COBSFrameReader:
+    """Split a COBS-encoded stream on its 0x00 delimiters and decode each frame."""
+
+    # Decode frames from memoryview slices of the buffer, which copy nothing, where cobs.decode allows it
+    decode_from_view = _decodes_memoryview()
+
+    def __init__(self, max_buffer_len=1 << 16):
+        '''
+        Arguments:
+            int max_buffer_len: drop the partial frame if this many bytes arrive without a delimiter
+        '''
+        self.buffer = bytearray()
+        self.frames = deque()
+        self.max_buffer_len = max_buffer_len
+        self.decode_errors = 0
+
+    def clear(self):
+        '''Drop any partial frame and all undelivered frames'''
+        self.buffer.clear()
+        self.frames.clear()
+
+    def feed(self, data):
+        '''
+        Append raw bytes and decode every frame they complete.
+        Returns the number of new frames.
+        '''
+        if not data:
+            return 0
+        self.buffer += data
+        n_frames = len(self.frames)
+        frames = memoryview(self.buffer) if self.decode_from_view else self.buffer
+        start = 0
+        try:
+            end = self.buffer.find(0, start)
+            while end >= 0:
+                if end > start:
+                    try:
+                        self.frames.append(cobs.decode(frames[start:end]))
+                    except cobs.DecodeError:
+                        # Corrupted frame; resynchronize on the next delimiter
+                        self.decode_errors += 1
+                start = end + 1
+                end = self.buffer.find(0, start)
+        finally:
+            if frames is not self.buffer:
+                # The buffer cannot be resized while a view of it exists
+                frames.release()
+        # Compacted once for all the frames this read completed
+        del self.buffer[:start]
+        if len(self.buffer) > self.max_buffer_len:
+            self.buffer.clear()
+        return len(self.frames) - n_frames
+
+    def next_frame(self):
+        '''Return the oldest undelivered frame, or None'''
+        if self.frames:
+            return self.frames.popleft()
+        return None
+
+    def latest_frame(self):
+        '''Return the newest frame and discard the older ones, or None'''
+        if not self.frames:
+            return None
+        frame = self.frames[-1]
+        self.frames.clear()
+        return frame
+
+    def pop_frames(self):
+        '''Return all undelivered frames, oldest first'''
+        frames = list(self.frames)
+        self.frames.clear()
+        return frames
+
+
+class FixedLengthFrameReader(COBSFrameReader):
+    """Split an unencoded stream into packets of a fixed length."""
+
+    def __init__(self, frame_len, max_buffer_len=1 << 16):
+        super().__init__(max_buffer_len)
+        self.frame_len = frame_len
+
+    def feed(self, data):
+        if not data:
+            return 0
+        self.buffer += data
+        n_complete = len(self.buffer) // self.frame_len
+        view = memoryview(self.buffer)
+        for i in range(n_complete):
+            self.frames.append(view[i * self.frame_len:(i + 1) * self.frame_len].tobytes())
+        view.release()
+        del self.buffer[:n_complete * self.frame_len]
+        return n_complete
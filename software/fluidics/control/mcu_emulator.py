@@ -0,0 +1,655 @@
+"""Teensy fluidics controller emulator on a pseudo-terminal.
+
+`MCUEmulator` opens a Linux pty and behaves like firmware/controller_teensy41.ino
+on the other end of it: it accepts the COBS-framed CMD_SET packets written by
+`FluidController.send_command`, runs the same internal state machine, and
+sends 30-byte COBS status frames every TX_INTERVAL_MS. The real
+`FluidController` can be pointed at it with `FluidController(..., port=emulator.port)`.
+
+Hardware is replaced by simple models: rotary valve moves take
+`valve_settle_s + valve_step_s * ports travelled` and block command handling
+like RheoLink.set_position does, and flow, pressure and the bubble sensors
+follow the disc pump power. All emulated time runs `time_scale` times faster
+than the wall clock, including the status packet rate.
+
+Run standalone with:
+    python -m fluidics.control.mcu_emulator [time_scale]
+"""
+
+import math
+import os
+import select
+import threading
+import tty
+from time import monotonic
+
+from cobs import cobs
+
+from ._def import CMD_SET, COMMAND_STATUS, MCU_CONSTANTS, VALVE_POSITIONS
+from .framing import COBSFrameReader
+from .mcu_status import STATUS_STRUCT, raw_to_psi
+
+# Firmware constants (firmware/_defs.h, OPX350.h, RheoLink.h)
+TX_INTERVAL_MS = 60
+SENSOR_INTERVAL_MS = 20
+DEBOUNCE_TIME_MS = 150
+FLOWSENSOR_DB_TIME_MS = 100
+OPX35_CALIB_TIMEOUT_MS = 3000
+RHEOLINK_TIMEOUT_MS = 2000
+SELECTORVALVE_MAX = 5
+OPX350_NONE = 0b000
+OPX350_LOW = 0b001   # fluid present
+OPX350_HIGH = 0b010  # air
+
+
+class INTERNAL_STATE:
+    IDLE = 0
+    INITIALIZING_MEDIUM = 1
+    LOADING_MEDIUM = 2
+    VENT_VB0 = 3
+    UNLOADING = 4
+    CLEARING = 5
+    MOVING_ROTARY = 6
+    CALIB_FLUID = 7
+    REMOVING = 8
+    DELAYING = 9
+    EJECTING = 10
+
+
+# Internal programs that pull fluid towards the pump (negative flow, vacuum on sensor 0)
+_PULLING_STATES = (INTERNAL_STATE.INITIALIZING_MEDIUM, INTERNAL_STATE.LOADING_MEDIUM, INTERNAL_STATE.REMOVING)
+
+# Payload length (including UID and command bytes) expected by the firmware for each command
+_PACKET_SIZES = {
+    CMD_SET.CLEAR: 3,
+    CMD_SET.INITIALIZE_DISC_PUMP: 5,
+    CMD_SET.INITIALIZE_PRESSURE_SENSOR: 4,
+    CMD_SET.INITIALIZE_FLOW_SENSOR: 6,
+    CMD_SET.INITIALIZE_BUBBLE_SENSORS: 3,
+    CMD_SET.INITIALIZE_VALVES: 3,
+    CMD_SET.INITIALIZE_ROTARY: 5,
+    CMD_SET.INITIALIZE_BANG_BANG_PARAMS: 16,
+    CMD_SET.INITIALIZE_PID_PARAMS: 20,
+    CMD_SET.SET_SOLENOID_VALVES: 5,
+    CMD_SET.SET_SOLENOID_VALVE: 5,
+    CMD_SET.SET_ROTARY_VALVE: 5,
+    CMD_SET.SET_PUMP_PWR_OPEN_LOOP: 5,
+    CMD_SET.BEGIN_CLOSED_LOOP: 4,
+    CMD_SET.STOP_CLOSED_LOOP: 3,
+    CMD_SET.CLEAR_LINES: 9,
+    CMD_SET.LOAD_FLUID_TO_SENSOR: 7,
+    CMD_SET.LOAD_FLUID_VOLUME: 10,
+    CMD_SET.UNLOAD_FLUID_VOLUME: 10,
+    CMD_SET.VENT_VB0: 7,
+    CMD_SET.VOL_INTEGRATE_SETTING: 5,
+    CMD_SET.REMOVE_ALL_MEDIUM: 10,
+    CMD_SET.DELAY_MS: 7,
+    CMD_SET.EJECT_MEDIUM: 10,
+}
+
+
+def _u16(buffer, i):
+    return (buffer[i] << 8) + buffer[i + 1]
+
+
+def psi_to_raw(psi):
+    '''Inverse of mcu_status.raw_to_psi, clamped to the sensor range'''
+    raw = MCU_CONSTANTS._output_min + (psi - MCU_CONSTANTS._p_min) * (MCU_CONSTANTS._output_max - MCU_CONSTANTS._output_min) / (MCU_CONSTANTS._p_max - MCU_CONSTANTS._p_min)
+    return int(min(max(raw, MCU_CONSTANTS._output_min), MCU_CONSTANTS._output_max))
+
+
+class MCUEmulator:
+    """Emulated fluidics controller behind a pseudo-terminal."""
+
+    def __init__(self, n_selector_valves=SELECTORVALVE_MAX, time_scale=1.0,
+                 valve_settle_s=0.2, valve_step_s=0.05,
+                 flow_ul_min_per_mw=1.0, psi_per_mw=0.01,
+                 line_volume_ul=50.0, pressure_decay_s=1.0):
+        '''
+        Arguments:
+            int n_selector_valves: number of installed selector valves (SELECTORVALVE_QTY)
+            float time_scale: emulated seconds per wall-clock second
+            float valve_settle_s, valve_step_s: rotary valve move time is valve_settle_s + valve_step_s * ports travelled
+            float flow_ul_min_per_mw: flow produced by the disc pump per mW of power
+            float psi_per_mw: pressure (or vacuum) produced by the disc pump per mW of power
+            float line_volume_ul: liquid that has to move before a line is full (loading) or empty (clearing)
+            float pressure_decay_s: time constant of the pressure drop once a line runs dry, and of venting
+        '''
+        assert time_scale > 0, "time_scale must be positive"
+        self.n_selector_valves = n_selector_valves
+        self.time_scale = time_scale
+        self.valve_settle_s = valve_settle_s
+        self.valve_step_s = valve_step_s
+        self.flow_ul_min_per_mw = flow_ul_min_per_mw
+        self.psi_per_mw = psi_per_mw
+        self.line_volume_ul = line_volume_ul
+        self.pressure_decay_s = pressure_decay_s
+
+        self.port = None
+        self.commands_received = 0
+        self.packets_sent = 0
+        self.packets_dropped = 0
+        self._master_fd = None
+        self._slave_fd = None
+        self._thread = None
+        self._running = False
+        self._framer = COBSFrameReader()
+        self.reset()
+
+    def reset(self):
+        '''Return to the power-on state'''
+        self.state = INTERNAL_STATE.IDLE
+        self.execution_status = COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS
+        self.cmd_uid = 0
+        self.cmd_rxed = CMD_SET.CLEAR
+        self.solenoid_valves = 0
+        self.pump_power = 0.0
+        self.closed_loop = None
+        self.pid_setpoint = 0.0
+        self.bb_thresholds = {}
+        self.integrate_flowrate = False
+        self.integrated_volume_ul = 0.0
+        self.timeout_ms = 0
+        self.debounce_ms = DEBOUNCE_TIME_MS
+        self.cmd_data = 0
+        self.peak_pressure = 0.0
+        self.pressure_scale = 255
+        self.selector_valves_pos = [1] * self.n_selector_valves
+        self.selector_valves_max = [0] * self.n_selector_valves
+        self.bubble_sensors_init = False
+        self.flow_sensor_init = False
+        self.flowrate = 0.0
+        self.pressure_psi = 0.0
+        self.vacuum_psi = 0.0
+        self.fluid_front = False
+        self.fluid_back = False
+        self.fluid_in_flow_sensor = False
+        self.moved_ul = 0.0
+        self.dry_since_ms = None
+        self.now_ms = 0.0
+        self.cmd_started_ms = 0.0
+        self.op_started_ms = 0.0
+        self._busy_until_ms = 0.0
+        self._next_tx_ms = TX_INTERVAL_MS
+        self._next_sensor_ms = SENSOR_INTERVAL_MS
+
+    # Lifecycle
+
+    def start(self):
+        '''Open the pty and start emulating. Returns the device path to connect to.'''
+        self._master_fd, self._slave_fd = os.openpty()
+        tty.setraw(self._slave_fd)
+        os.set_blocking(self._master_fd, False)
+        self.port = os.ttyname(self._slave_fd)
+        self._framer.clear()
+        self._t0 = monotonic()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='MCUEmulator', daemon=True)
+        self._thread.start()
+        return self.port
+
+    def stop(self):
+        '''Stop emulating and close the pty'''
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for fd in (self._master_fd, self._slave_fd):
+            if fd is not None:
+                os.close(fd)
+        self._master_fd = self._slave_fd = None
+        self.port = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _clock_ms(self):
+        return (monotonic() - self._t0) * self.time_scale * 1000
+
+    def _run(self):
+        while self._running:
+            self.advance(self._clock_ms())
+            next_event_ms = max(self._busy_until_ms, min(self._next_tx_ms, self._next_sensor_ms))
+            wait_s = max(0.0, (next_event_ms - self._clock_ms()) / 1000 / self.time_scale)
+            readable, _, _ = select.select([self._master_fd], [], [], min(wait_s, 0.05))
+            if readable:
+                try:
+                    data = os.read(self._master_fd, 4096)
+                except (BlockingIOError, OSError):
+                    data = b''
+                self._framer.feed(data)
+
+    # Main loop body, mirrors loop() in the firmware
+
+    def advance(self, now_ms):
+        '''Run the firmware loop up to emulated time now_ms'''
+        while True:
+            if self._busy_until_ms > self.now_ms:
+                # Blocked inside a command handler (rotary valve move)
+                if now_ms < self._busy_until_ms:
+                    return
+                self.now_ms = self._busy_until_ms
+                continue
+            if self._next_tx_ms <= now_ms and self._next_tx_ms <= self._next_sensor_ms:
+                self.now_ms = max(self.now_ms, self._next_tx_ms)
+                self._next_tx_ms += TX_INTERVAL_MS
+                self._send(self.status_packet())
+                continue
+            if self._next_sensor_ms <= now_ms:
+                self.now_ms = max(self.now_ms, self._next_sensor_ms)
+                self._next_sensor_ms += SENSOR_INTERVAL_MS
+                self.sensor_step(SENSOR_INTERVAL_MS)
+                continue
+            self.now_ms = max(self.now_ms, now_ms)
+            packet = self._framer.next_frame()
+            if packet is None:
+                return
+            self.handle_packet(packet)
+
+    def _send(self, packet):
+        if self._master_fd is None:
+            return
+        try:
+            os.write(self._master_fd, cobs.encode(packet) + b'\x00')
+            self.packets_sent += 1
+        except BlockingIOError:
+            # Host is not reading; drop the packet like a full USB buffer would
+            self.packets_dropped += 1
+
+    # Status packet
+
+    def status_packet(self):
+        '''Encode the current state as a 30-byte status packet'''
+        fs1 = self._bubble_reading(self.fluid_front)
+        fs2 = self._bubble_reading(self.fluid_back)
+        valves = list(self.selector_valves_pos[:SELECTORVALVE_MAX]) + [0] * (SELECTORVALVE_MAX - self.n_selector_valves)
+        pump_power = int(min(self.pump_power, MCU_CONSTANTS.TTP_MAX_PW) / MCU_CONSTANTS.TTP_MAX_PW * 0xFFFF)
+        flow = self.flowrate if self.flow_sensor_init else 0.0
+        flow_raw = int(max(-32768, min(32767, flow * MCU_CONSTANTS.SCALE_FACTOR_FLOW)))
+        volume_raw = int(max(-32768, min(32767, self.integrated_volume_ul / MCU_CONSTANTS.VOLUME_UL_MAX * 32767)))
+        elapsed = int((self.now_ms - self.cmd_started_ms) / 1000) & 0xFF
+        solenoid = self.solenoid_valves - 0x10000 if self.solenoid_valves & 0x8000 else self.solenoid_valves
+        return STATUS_STRUCT.pack(
+            self.cmd_uid, self.cmd_rxed, self.execution_status, self.state, (fs1 << 4) | fs2,
+            *valves,
+            solenoid, pump_power,
+            psi_to_raw(self.vacuum_psi), psi_to_raw(self.pressure_psi), 0, 0,
+            flow_raw, 0,
+            elapsed, volume_raw)
+
+    def _bubble_reading(self, fluid):
+        if not self.bubble_sensors_init:
+            return OPX350_NONE
+        return OPX350_LOW if fluid else OPX350_HIGH
+
+    # Sensors and internal programs
+
+    def sensor_step(self, dt_ms):
+        '''Update the hardware models and the internal state machine by dt_ms'''
+        self._update_physics(dt_ms)
+        if self.integrate_flowrate:
+            self.integrated_volume_ul += dt_ms * self.flowrate / (60.0 * 1000.0)
+
+        since_cmd = self.now_ms - self.cmd_started_ms
+        since_op = self.now_ms - self.op_started_ms
+        timed_out = since_cmd > self.timeout_ms
+        state = self.state
+
+        if state in (INTERNAL_STATE.DELAYING, INTERNAL_STATE.CALIB_FLUID):
+            if timed_out:
+                self._finish(COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+        elif state == INTERNAL_STATE.CLEARING:
+            if timed_out:
+                self._finish(COMMAND_STATUS.CMD_EXECUTION_ERROR)
+            elif self.fluid_front or self.fluid_back or self.fluid_in_flow_sensor:
+                self.op_started_ms = self.now_ms
+            elif since_op > self.cmd_data:
+                self._stop_pump()
+                self._finish(COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+        elif state == INTERNAL_STATE.INITIALIZING_MEDIUM:
+            if timed_out:
+                self._finish(COMMAND_STATUS.CMD_EXECUTION_ERROR)
+            elif self.fluid_in_flow_sensor and self.fluid_front:
+                self._stop_flow()
+                self._finish(COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+        elif state in (INTERNAL_STATE.LOADING_MEDIUM, INTERNAL_STATE.UNLOADING):
+            volume = 0xFFFF * self.integrated_volume_ul / MCU_CONSTANTS.VOLUME_UL_MAX
+            if state == INTERNAL_STATE.LOADING_MEDIUM:
+                volume = -volume
+            if timed_out or abs(self.integrated_volume_ul) > MCU_CONSTANTS.VOLUME_UL_MAX:
+                self._stop_flow()
+                self._finish(COMMAND_STATUS.CMD_EXECUTION_ERROR)
+            elif volume >= self.cmd_data:
+                self._stop_flow()
+                self._finish(COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+        elif state == INTERNAL_STATE.VENT_VB0:
+            if timed_out:
+                self.solenoid_valves = VALVE_POSITIONS.FLUID_STOP_FLOW
+                self._finish(COMMAND_STATUS.CMD_EXECUTION_ERROR)
+            elif psi_to_raw(self.vacuum_psi) >= self.cmd_data:
+                self.solenoid_valves = VALVE_POSITIONS.FLUID_STOP_FLOW
+                self._finish(COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+        elif state in (INTERNAL_STATE.REMOVING, INTERNAL_STATE.EJECTING):
+            target = -self.vacuum_psi if state == INTERNAL_STATE.REMOVING else self.pressure_psi
+            if since_cmd >= min(3.0, self.timeout_ms / 15.0):
+                self.peak_pressure = max(self.peak_pressure, target)
+            threshold = self.pressure_scale * self.peak_pressure / 255
+            if timed_out:
+                self._stop_flow()
+                self._finish(COMMAND_STATUS.CMD_EXECUTION_ERROR)
+            elif target >= threshold:
+                self.op_started_ms = self.now_ms
+            elif since_op > self.cmd_data:
+                self._stop_flow()
+                self._finish(COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+
+    def _update_physics(self, dt_ms):
+        pulling = self.state in _PULLING_STATES or self.closed_loop in (MCU_CONSTANTS.FLUID_IN_BANG_BANG, MCU_CONSTANTS.VACUUM_PID)
+        direction = -1 if pulling else 1
+
+        # Closed loops are assumed to hold their setpoint; back out the pump power that needs
+        if self.closed_loop in (MCU_CONSTANTS.PRESSURE_PID, MCU_CONSTANTS.VACUUM_PID):
+            self.pump_power = abs(self.pid_setpoint) / self.psi_per_mw
+        elif self.closed_loop == MCU_CONSTANTS.FLUID_OUT_PID:
+            self.pump_power = abs(self.pid_setpoint) / self.flow_ul_min_per_mw
+        elif self.closed_loop in self.bb_thresholds:
+            low, high = self.bb_thresholds[self.closed_loop]
+            self.pump_power = (low + high) / 2 / self.flow_ul_min_per_mw
+        self.pump_power = min(self.pump_power, MCU_CONSTANTS.TTP_MAX_PW)
+
+        flow = direction * self.pump_power * self.flow_ul_min_per_mw
+        self.moved_ul += abs(flow) * dt_ms / 60000.0
+        drive_psi = self.pump_power * self.psi_per_mw
+        decay = math.exp(-dt_ms / 1000.0 / self.pressure_decay_s)
+
+        if self.state == INTERNAL_STATE.CLEARING:
+            # The line empties once line_volume_ul has been pushed out
+            liquid = self.moved_ul < self.line_volume_ul
+            self.fluid_front = self.fluid_back = self.fluid_in_flow_sensor = liquid
+        elif self.state == INTERNAL_STATE.INITIALIZING_MEDIUM:
+            # Liquid reaches the sensors once line_volume_ul has been pulled in
+            liquid = self.moved_ul >= self.line_volume_ul
+            self.fluid_front = self.fluid_in_flow_sensor = liquid
+        elif self.state in (INTERNAL_STATE.REMOVING, INTERNAL_STATE.EJECTING):
+            # Pressure holds while liquid is in the line, then falls off once it runs dry
+            self.fluid_in_flow_sensor = self.moved_ul < self.line_volume_ul
+            if not self.fluid_in_flow_sensor:
+                if self.dry_since_ms is None:
+                    self.dry_since_ms = self.now_ms
+                drive_psi *= math.exp(-(self.now_ms - self.dry_since_ms) / 1000.0 / self.pressure_decay_s)
+        elif self.pump_power > 0:
+            self.fluid_in_flow_sensor = True
+
+        self.flowrate = flow if self.fluid_in_flow_sensor or self.state in (INTERNAL_STATE.LOADING_MEDIUM, INTERNAL_STATE.UNLOADING) else 0.0
+        if self.state == INTERNAL_STATE.VENT_VB0:
+            self.vacuum_psi *= decay
+            self.pressure_psi *= decay
+        elif pulling:
+            self.vacuum_psi = -drive_psi
+            self.pressure_psi = 0.0
+        else:
+            self.pressure_psi = drive_psi
+            self.vacuum_psi = 0.0
+
+    def _finish(self, status):
+        self.state = INTERNAL_STATE.IDLE
+        self.execution_status = status
+
+    def _stop_pump(self):
+        self.closed_loop = None
+        self.pump_power = 0.0
+
+    def _stop_flow(self):
+        self._stop_pump()
+        self.solenoid_valves = VALVE_POSITIONS.FLUID_STOP_FLOW
+
+    # Command handling, mirrors onPacketReceived in the firmware
+
+    def handle_packet(self, buffer):
+        '''Process one decoded command packet'''
+        size = len(buffer)
+        if size < 3:
+            return
+        self.commands_received += 1
+        self.cmd_rxed = buffer[2]
+        self.cmd_uid = _u16(buffer, 0)
+        self.cmd_started_ms = self.now_ms
+        expected = _PACKET_SIZES.get(self.cmd_rxed)
+        if expected is None:
+            return
+        if size != expected:
+            self.state = INTERNAL_STATE.IDLE
+            self.execution_status = COMMAND_STATUS.CMD_INVALID
+            return
+        handler = getattr(self, '_cmd_' + _COMMAND_NAMES[self.cmd_rxed].lower())
+        handler(buffer)
+
+    def _start_program(self, state):
+        self.state = state
+        self.execution_status = COMMAND_STATUS.IN_PROGRESS
+        self.op_started_ms = self.now_ms
+        self.moved_ul = 0.0
+        self.dry_since_ms = None
+
+    def _move_rotary(self, idx, pos):
+        '''Block for the valve move time; returns True if the move finished within RHEOLINK_TIMEOUT_MS'''
+        n_ports = self.selector_valves_max[idx] or 1
+        distance = abs(pos - self.selector_valves_pos[idx]) % n_ports
+        distance = min(distance, n_ports - distance)
+        move_ms = 0.0 if distance == 0 else (self.valve_settle_s + self.valve_step_s * distance) * 1000
+        self._busy_until_ms = self.now_ms + min(move_ms, RHEOLINK_TIMEOUT_MS)
+        if move_ms > RHEOLINK_TIMEOUT_MS:
+            return False
+        self.selector_valves_pos[idx] = pos
+        return True
+
+    def _cmd_clear(self, buffer):
+        self._stop_pump()
+        self.solenoid_valves = 0
+        ok = True
+        start_ms = self.now_ms
+        for idx in range(self.n_selector_valves):
+            if self.selector_valves_max[idx]:
+                ok = self._move_rotary(idx, 1) and ok
+                self.now_ms = self._busy_until_ms
+        self.now_ms = start_ms
+        self._next_tx_ms = self._busy_until_ms + TX_INTERVAL_MS
+        self._next_sensor_ms = self._busy_until_ms + SENSOR_INTERVAL_MS
+        self.state = INTERNAL_STATE.IDLE
+        self.execution_status = COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS if ok else COMMAND_STATUS.CMD_EXECUTION_ERROR
+        self.cmd_uid = 0
+        self.integrate_flowrate = False
+        self.integrated_volume_ul = 0.0
+        self.peak_pressure = 0.0
+        self.pressure_scale = 255
+
+    def _cmd_initialize_disc_pump(self, buffer):
+        self._finish(COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+
+    def _cmd_initialize_pressure_sensor(self, buffer):
+        self._finish(COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+
+    def _cmd_initialize_flow_sensor(self, buffer):
+        if buffer[4] not in MCU_CONSTANTS.MEDIA:
+            self._finish(COMMAND_STATUS.CMD_INVALID)
+            return
+        self.flow_sensor_init = True
+        self._finish(COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+
+    def _cmd_initialize_bubble_sensors(self, buffer):
+        self.bubble_sensors_init = True
+        self.timeout_ms = OPX35_CALIB_TIMEOUT_MS
+        self._start_program(INTERNAL_STATE.CALIB_FLUID)
+
+    def _cmd_initialize_valves(self, buffer):
+        self._finish(COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+
+    def _cmd_initialize_rotary(self, buffer):
+        idx = buffer[3]
+        if idx >= self.n_selector_valves:
+            self._finish(COMMAND_STATUS.CMD_INVALID)
+            return
+        self.selector_valves_max[idx] = buffer[4]
+        self.selector_valves_pos[idx] = 1
+        self._finish(COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+
+    def _cmd_initialize_bang_bang_params(self, buffer):
+        loop_type = buffer[3]
+        if loop_type not in MCU_CONSTANTS.BB_LOOP_TYPES:
+            self._finish(COMMAND_STATUS.CMD_INVALID)
+            return
+        self.bb_thresholds[loop_type] = (_u16(buffer, 4) / MCU_CONSTANTS.SCALE_FACTOR_FLOW,
+                                         _u16(buffer, 6) / MCU_CONSTANTS.SCALE_FACTOR_FLOW)
+        self._finish(COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+
+    def _cmd_initialize_pid_params(self, buffer):
+        if buffer[3] not in MCU_CONSTANTS.PID_LOOP_TYPES:
+            self._finish(COMMAND_STATUS.CMD_INVALID)
+            return
+        self._finish(COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+
+    def _cmd_set_solenoid_valves(self, buffer):
+        self.solenoid_valves = _u16(buffer, 3)
+        self._finish(COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+
+    def _cmd_set_solenoid_valve(self, buffer):
+        if buffer[3]:
+            self.solenoid_valves |= (1 << buffer[4])
+        else:
+            self.solenoid_valves &= ~(1 << buffer[4]) & 0xFFFF
+        self._finish(COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+
+    def _cmd_set_rotary_valve(self, buffer):
+        idx, pos = buffer[3], buffer[4]
+        if idx >= self.n_selector_valves or not (1 <= pos <= self.selector_valves_max[idx]):
+            self._finish(COMMAND_STATUS.CMD_INVALID)
+            return
+        ok = self._move_rotary(idx, pos)
+        self._finish(COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS if ok else COMMAND_STATUS.CMD_EXECUTION_ERROR)
+
+    def _cmd_set_pump_pwr_open_loop(self, buffer):
+        self.closed_loop = None
+        self.pump_power = float(_u16(buffer, 3))
+        self._finish(COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+
+    def _cmd_begin_closed_loop(self, buffer):
+        loop_type = buffer[3]
+        if loop_type not in MCU_CONSTANTS.LOOP_TYPES or loop_type == MCU_CONSTANTS.OPEN_LOOP_CTRL:
+            self._finish(COMMAND_STATUS.CMD_INVALID)
+            return
+        self.closed_loop = loop_type
+        self._finish(COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+
+    def _cmd_stop_closed_loop(self, buffer):
+        self._stop_pump()
+        self._finish(COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+
+    def _cmd_remove_all_medium(self, buffer):
+        self.peak_pressure = 0.0
+        self.timeout_ms = _u16(buffer, 5)
+        # The firmware stores the debounce interval in debounce_time, so the settle
+        # check below keeps using cmd_data from the previous command
+        self.debounce_ms = _u16(buffer, 7)
+        self.pressure_scale = buffer[9]
+        self._stop_pump()
+        self.pump_power = float(_u16(buffer, 3))
+        if self.cmd_rxed == CMD_SET.REMOVE_ALL_MEDIUM:
+            self.solenoid_valves = VALVE_POSITIONS.FLUID_TO_VB1
+            self._start_program(INTERNAL_STATE.REMOVING)
+        else:
+            self.solenoid_valves = VALVE_POSITIONS.FLUID_TO_CHAMBER
+            self._start_program(INTERNAL_STATE.EJECTING)
+
+    _cmd_eject_medium = _cmd_remove_all_medium
+
+    def _cmd_clear_lines(self, buffer):
+        if not (self.bubble_sensors_init and self.flow_sensor_init):
+            self._finish(COMMAND_STATUS.CMD_EXECUTION_ERROR)
+            return
+        self.timeout_ms = _u16(buffer, 5)
+        self.cmd_data = _u16(buffer, 7)
+        self.debounce_ms = DEBOUNCE_TIME_MS
+        self.solenoid_valves = VALVE_POSITIONS.FLUID_CLEAR_LINES
+        self._stop_pump()
+        self.pump_power = float(_u16(buffer, 3))
+        self._start_program(INTERNAL_STATE.CLEARING)
+
+    def _cmd_load_fluid_to_sensor(self, buffer):
+        self.timeout_ms = _u16(buffer, 5)
+        self.debounce_ms = FLOWSENSOR_DB_TIME_MS
+        self.solenoid_valves = VALVE_POSITIONS.FLUID_TO_RESERVOIR
+        self._stop_pump()
+        self.pump_power = float(_u16(buffer, 3))
+        self.integrated_volume_ul = 0.0
+        self.integrate_flowrate = True
+        self._start_program(INTERNAL_STATE.INITIALIZING_MEDIUM)
+
+    def _cmd_vol_integrate_setting(self, buffer):
+        self.integrate_flowrate = bool(buffer[3])
+        if buffer[4]:
+            self.integrated_volume_ul = 0.0
+        self._finish(COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+
+    def _start_volume_transfer(self, buffer, allowed_loops, state, valves):
+        loop_type = buffer[3]
+        if loop_type not in allowed_loops:
+            self._finish(COMMAND_STATUS.CMD_INVALID)
+            return
+        self.timeout_ms = _u16(buffer, 6)
+        self.cmd_data = _u16(buffer, 8)
+        setpoint = _u16(buffer, 4)
+        self._stop_pump()
+        if loop_type == MCU_CONSTANTS.OPEN_LOOP_CTRL:
+            self.pump_power = float(setpoint)
+        else:
+            self.closed_loop = loop_type
+            if loop_type in (MCU_CONSTANTS.PRESSURE_PID, MCU_CONSTANTS.VACUUM_PID):
+                self.pid_setpoint = raw_to_psi(setpoint)
+            elif loop_type == MCU_CONSTANTS.FLUID_OUT_PID:
+                self.pid_setpoint = setpoint * MCU_CONSTANTS.SLF3X_MAX_VAL_uL_MIN / 0xFFFF
+        self.integrate_flowrate = True
+        self.integrated_volume_ul = 0.0
+        self.solenoid_valves = valves
+        self.debounce_ms = DEBOUNCE_TIME_MS
+        self._start_program(state)
+
+    def _cmd_load_fluid_volume(self, buffer):
+        self._start_volume_transfer(
+            buffer, (MCU_CONSTANTS.FLUID_IN_BANG_BANG, MCU_CONSTANTS.VACUUM_PID, MCU_CONSTANTS.OPEN_LOOP_CTRL),
+            INTERNAL_STATE.LOADING_MEDIUM, VALVE_POSITIONS.FLUID_TO_RESERVOIR)
+
+    def _cmd_unload_fluid_volume(self, buffer):
+        self._start_volume_transfer(
+            buffer, (MCU_CONSTANTS.FLUID_OUT_BANG_BANG, MCU_CONSTANTS.FLUID_OUT_PID, MCU_CONSTANTS.PRESSURE_PID, MCU_CONSTANTS.OPEN_LOOP_CTRL),
+            INTERNAL_STATE.UNLOADING, VALVE_POSITIONS.FLUID_TO_CHAMBER)
+
+    def _cmd_vent_vb0(self, buffer):
+        self._stop_pump()
+        self.solenoid_valves = VALVE_POSITIONS.VALVES_VENT_VB0
+        self.cmd_data = _u16(buffer, 3)
+        self.timeout_ms = _u16(buffer, 5)
+        self._start_program(INTERNAL_STATE.VENT_VB0)
+
+    def _cmd_delay_ms(self, buffer):
+        self.timeout_ms = (buffer[3] << 24) + (buffer[4] << 16) + (buffer[5] << 8) + buffer[6]
+        self._start_program(INTERNAL_STATE.DELAYING)
+
+
+_COMMAND_NAMES = {value: name for name, value in vars(CMD_SET).items() if value in _PACKET_SIZES}
+
+
+if __name__ == '__main__':
+    import sys
+    from time import sleep
+
+    emulator = MCUEmulator(time_scale=float(sys.argv[1]) if len(sys.argv) > 1 else 1.0)
+    print(f"Emulated fluidics controller on {emulator.start()} (Ctrl-C to stop)")
+    try:
+        while True:
+            sleep(1)
+    except KeyboardInterrupt:
+        emulator.stop()
@@ -0,0 +1,173 @@
+"""Decoding of the 30-byte MCU -> computer status packet.
+
+#########################################################
+#########   MCU -> Computer message structure   #########
+#########################################################
+byte 0-1    : computer -> MCU CMD counter (UID)
+byte 2      : cmd from host computer (error checking through check sum => no need to transmit back the parameters associated with the command)
+byte 3      : status of the command (see _def.py)
+byte 4      : MCU internal program being executed (see _def.py)
+byte 5      : Bubble sensor state (high and low nibble)
+byte 6-10   : Selector valves status (1,2,3,4,5)
+byte 11-12  : state of valve D1-D16
+byte 13-14  : pump power
+byte 15-16  : pressure sensor 1 reading
+byte 17-18  : pressure sensor 2 reading
+byte 19-20  : pressure sensor 3 reading
+byte 21-22  : pressure sensor 4 reading
+byte 23-24  : flow sensor 1 reading
+byte 25-26  : flow sensor 2 reading
+byte 27     : elapsed time since the start of the last internal program (in seconds)
+byte 28-29  : total volume (ul), range: 0 - 5000
+
+`decode_status` turns one packet into an `MCUStatus` record with a single
+struct unpack. `decode_status_batch` decodes any number of buffered packets at
+once into NumPy columns.
+"""
+
+import struct
+
+import numpy as np
+
+from ._def import MCU_CONSTANTS, MCU_MSG_LENGTH
+
+# Big-endian wire layout, one entry per field in the table above
+STATUS_STRUCT = struct.Struct('>HBBBB5BhH4H2hBh')
+
+STATUS_DTYPE = np.dtype([
+    ('uid', '>u2'),
+    ('cmd', 'u1'),
+    ('status', 'u1'),
+    ('program', 'u1'),
+    ('bubble_sensors', 'u1'),
+    ('selector_valves', 'u1', (5,)),
+    ('solenoid_valves', '>i2'),
+    ('pump_power', '>u2'),
+    ('pressures', '>u2', (4,)),
+    ('flows', '>i2', (2,)),
+    ('cmd_time_elapsed', 'u1'),
+    ('volume', '>i2'),
+])
+
+assert STATUS_STRUCT.size == STATUS_DTYPE.itemsize == MCU_MSG_LENGTH
+
+# Scale factors, computed once
+_PUMP_POWER_SCALE = MCU_CONSTANTS.TTP_MAX_PW / np.iinfo(np.uint16).max
+_PRESSURE_SPAN = MCU_CONSTANTS._p_max - MCU_CONSTANTS._p_min
+_PRESSURE_RAW_SPAN = MCU_CONSTANTS._output_max - MCU_CONSTANTS._output_min
+_VOLUME_SCALE = MCU_CONSTANTS.VOLUME_UL_MAX / np.iinfo(np.int16).max
+
+
+def raw_to_psi(raw_pressure):
+    '''Convert a raw SSCX reading (scalar or array) to psi'''
+    return (raw_pressure - MCU_CONSTANTS._output_min) * _PRESSURE_SPAN / _PRESSURE_RAW_SPAN + MCU_CONSTANTS._p_min
+
+
+class MCUStatus:
+    """
+    One decoded status packet. Field names match the keys of the dict that
+    `FluidController.get_mcu_status` used to return, and item access
+    (status['pressures']) is supported so existing callers keep working.
+    """
+
+    __slots__ = (
+        'MCU_received_command_UID',
+        'MCU_received_command',
+        'MCU_command_execution_status',
+        'MCU_interal_program',
+        'bubble_sensor_states',
+        'MCU_CMD_time_elapsed',
+        'selector_valves_pos',
+        'solenoid_valves',
+        'measurement_pump_power',
+        'pressures',
+        'flowrates',
+        'vol_ul',
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields[name])
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return self.__slots__
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        if not isinstance(other, MCUStatus):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"MCUStatus({self.to_dict()})"
+
+
+def decode_status(msg):
+    '''
+    Decode one status packet (bytes-like, MCU_MSG_LENGTH long) into an MCUStatus
+    '''
+    (uid, cmd, status, program, bubble,
+     sv1, sv2, sv3, sv4, sv5,
+     solenoid_valves, pump_power,
+     p1, p2, p3, p4,
+     f1, f2,
+     time_elapsed, volume) = STATUS_STRUCT.unpack_from(msg)
+    return MCUStatus(
+        MCU_received_command_UID=uid,
+        MCU_received_command=cmd,
+        MCU_command_execution_status=status,
+        MCU_interal_program=program,
+        bubble_sensor_states=(bubble >> 4, bubble & 0x0F),
+        MCU_CMD_time_elapsed=time_elapsed,
+        selector_valves_pos=(sv1, sv2, sv3, sv4, sv5),
+        solenoid_valves=solenoid_valves,
+        measurement_pump_power=pump_power * _PUMP_POWER_SCALE,
+        pressures=(raw_to_psi(p1), raw_to_psi(p2), raw_to_psi(p3), raw_to_psi(p4)),
+        flowrates=(f1 / MCU_CONSTANTS.SCALE_FACTOR_FLOW, f2 / MCU_CONSTANTS.SCALE_FACTOR_FLOW),
+        vol_ul=volume * _VOLUME_SCALE,
+    )
+
+
+def decode_status_batch(frames):
+    '''
+    Decode many status packets at once.
+    Arguments:
+        frames: bytes-like holding back-to-back packets, an iterable of packets, or a uint8 array of shape (n, MCU_MSG_LENGTH)
+    Returns:
+        dict of NumPy arrays with one row per packet, keyed like MCUStatus
+    '''
+    if isinstance(frames, np.ndarray):
+        buffer = np.ascontiguousarray(frames, dtype=np.uint8)
+    elif isinstance(frames, (bytes, bytearray, memoryview)):
+        buffer = frames
+    else:
+        buffer = b''.join(bytes(f) for f in frames)
+    raw = np.frombuffer(buffer, dtype=STATUS_DTYPE)
+    return {
+        'MCU_received_command_UID': raw['uid'].astype(np.uint16),
+        'MCU_received_command': raw['cmd'],
+        'MCU_command_execution_status': raw['status'],
+        'MCU_interal_program': raw['program'],
+        'bubble_sensor_states': np.stack([raw['bubble_sensors'] >> 4, raw['bubble_sensors'] & 0x0F], axis=-1),
+        'MCU_CMD_time_elapsed': raw['cmd_time_elapsed'],
+        'selector_valves_pos': raw['selector_valves'],
+        'solenoid_valves': raw['solenoid_valves'].astype(np.int16),
+        'measurement_pump_power': raw['pump_power'] * _PUMP_POWER_SCALE,
+        'pressures': raw_to_psi(raw['pressures'].astype(np.float64)),
+        'flowrates': raw['flows'] / MCU_CONSTANTS.SCALE_FACTOR_FLOW,
+        'vol_ul': raw['volume'] * _VOLUME_SCALE,
+    }
@@ -1,11 +1,27 @@
+import time
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
 from ._def import CMD_SET
 
 
 class SelectorValve():
-    def __init__(self, fluid_controller, config, valve_id, initial_pos=1):
+    # Weight of the newest measurement in move_time_s
+    MOVE_TIME_ALPHA = 0.3
+
+    def __init__(self, fluid_controller, config, valve_id, initial_pos=1, verbose=True):
         self.fc = fluid_controller
+        # Print initialization and moves to stdout
+        self.verbose = verbose
         self.id = valve_id
         self.position = initial_pos
+        # True only while self.position has been confirmed by the MCU; open() skips moves to a verified position
+        self.position_verified = False
+        # Smoothed time from sending a move to its verification (s), None until a move has been timed
+        self.move_time_s = None
+        # Simulated controllers may run on a virtual clock
+        self._clock = getattr(fluid_controller, 'clock', None) or time
         self.config = config
 
         sv = self.config.reagent_selection.selector_valves
@@ -13,96 +29,271 @@ class SelectorValve():
         self.number_of_ports = sv.number_of_ports[valve_id]
         self.fc.send_command(CMD_SET.INITIALIZE_ROTARY, valve_id, self.number_of_ports)
         self.open(self.position)
-        print(f"Selector valve id = {valve_id} initialized.")
+        if self.verbose:
+            print(f"Selector valve id = {valve_id} initialized.")
 
     def open(self, port):
-        print("open", self.id, port)
+        if self.is_at(port):
+            return
+        if self.verbose:
+            print("open", self.id, port)
+        self.position_verified = False
+        start = self._clock.time()
         self.fc.send_command(CMD_SET.SET_ROTARY_VALVE, self.id, port)
         self.fc.wait_for_completion()
         current_position = self.get_current_position()
         if current_position != port:
             raise RuntimeError(f"current position is {current_position}; expected {port}")
         self.position = port
+        self.position_verified = True
+        elapsed = self._clock.time() - start
+        if self.move_time_s is None:
+            self.move_time_s = elapsed
+        else:
+            self.move_time_s += self.MOVE_TIME_ALPHA * (elapsed - self.move_time_s)
+
+    def is_at(self, port):
+        '''
+        True if the valve is known to be at port without asking the MCU: its verified position is port and, on a
+        hardware controller, the status reader thread is live and its latest snapshot reports port too.
+        Without streaming telemetry a CLEAR, an MCU reset or a manual move could go unnoticed, so nothing is skipped.
+        '''
+        if not self.position_verified or self.position != port:
+            return False
+        reader_running = getattr(self.fc, 'reader_running', None)
+        if reader_running is None:
+            # Simulated controllers hold the valve state themselves
+            return True
+        if not reader_running():
+            return False
+        seq, status = self.fc.get_latest_status()
+        return seq > 0 and status['selector_valves_pos'][self.id] == port
+
+    def invalidate(self):
+        '''Forget the cached position so the next open() always moves the valve'''
+        self.position_verified = False
 
     def get_current_position(self):
         data = self.fc.get_mcu_status()
         return data['selector_valves_pos'][self.id]
 
 
+class PortRoute(NamedTuple):
+    port: int
+    valve_id: int                          # valve the port is on
+    moves: Tuple[Tuple[int, int], ...]     # (valve id, position) for every valve that has to move, upstream first
+    volume_to_valve: int                   # tubing from the port's valve to the sample (ul)
+    volume_to_port: Optional[int]          # tubing from the reagent to the valve port (ul), None if not configured
+    reagent: Optional[str]
+
+
+class PortRoutingTable():
+    """
+    Routes for every global port of a selector valve cascade, computed once from the config.
+    Ports are numbered from 1: all ports of valve 0 except its last (pass-through) one, then valve 1, ...,
+    and every port of the last valve. route(port) is a single lookup; the read-only arrays serve bulk queries,
+    indexed by port (row 0 is unused).
+    """
+
+    def __init__(self, reagent_selection):
+        sv = reagent_selection.selector_valves
+        common = reagent_selection.common_tubing_fluid_amount_ul
+        self.valve_ids = tuple(sv.valve_ids)
+        n_valves = len(self.valve_ids)
+
+        routes = [None]
+        for i, valve_id in enumerate(self.valve_ids):
+            last = i == n_valves - 1
+            n_ports = sv.number_of_ports[valve_id] - (0 if last else 1)
+            upstream = tuple((v, sv.number_of_ports[v]) for v in self.valve_ids[:i])
+            for position in range(1, n_ports + 1):
+                port = len(routes)
+                name = 'port_' + str(port)
+                routes.append(PortRoute(
+                    port=port,
+                    valve_id=valve_id,
+                    moves=upstream + ((valve_id, position),),
+                    volume_to_valve=common + sv.tubing_fluid_amount_to_valve_ul[valve_id],
+                    volume_to_port=sv.tubing_fluid_amount_ul.get(name),
+                    reagent=None if sv.name_mapping is None else sv.name_mapping.get(name)))
+        self._routes = tuple(routes)
+        self.number_of_ports = len(routes) - 1
+
+        # positions[port, i]: target of valve_ids[i] for port, 0 if that valve is not part of the route
+        self.positions = np.zeros((len(routes), n_valves), dtype=np.int16)
+        self.volume_to_valve = np.zeros(len(routes))
+        self.volume_to_port = np.full(len(routes), np.nan)
+        column = {valve_id: i for i, valve_id in enumerate(self.valve_ids)}
+        for route in routes[1:]:
+            for valve_id, position in route.moves:
+                self.positions[route.port, column[valve_id]] = position
+            self.volume_to_valve[route.port] = route.volume_to_valve
+            if route.volume_to_port is not None:
+                self.volume_to_port[route.port] = route.volume_to_port
+        for arr in (self.positions, self.volume_to_valve, self.volume_to_port):
+            arr.flags.writeable = False
+        self.reagents = tuple(route.reagent if route else None for route in routes)
+
+    def __len__(self):
+        return self.number_of_ports
+
+    def __contains__(self, port):
+        return 1 <= port <= self.number_of_ports
+
+    def route(self, port):
+        '''Return the PortRoute for port; raises KeyError if the port does not exist'''
+        if port not in self:
+            raise KeyError(f"No port {port}; ports are 1 to {self.number_of_ports}")
+        return self._routes[port]
+
+    def routes(self):
+        '''Return every PortRoute, ordered by port'''
+        return self._routes[1:]
+
+
 class SelectorValveSystem():
     PORTS_PER_VALVE = 10
 
-    def __init__(self, fluid_controller, config):
+    def __init__(self, fluid_controller, config, parallel_routing=False, verbose=True):
+        '''
+        Arguments:
+            fluid_controller: FluidController (or simulation) driving the valves
+            FluidicsConfig config: reagent selection settings
+            bool parallel_routing: default for open_port; send every valve move at once and verify them together
+            bool verbose: print valve initialization and moves to stdout
+        '''
         self.fc = fluid_controller
+        self.verbose = verbose
+        self.parallel_routing = parallel_routing
         self.config = config
         rs = self.config.reagent_selection
         sv_config = rs.selector_valves
         self.common_tubing_fluid_amount_ul = rs.common_tubing_fluid_amount_ul
         self.valves = [None] * len(sv_config.valve_ids)
-        self.available_port_number = 0
         for i, valve_id in enumerate(sv_config.valve_ids):
-            ports = sv_config.number_of_ports[valve_id]
-            self.valves[i] = SelectorValve(self.fc, self.config, valve_id, 1)
-            self.available_port_number += (ports - 1)
-        self.available_port_number += 1
+            self.valves[i] = SelectorValve(self.fc, self.config, valve_id, 1, verbose=verbose)
+        self._valve_by_id = {valve.id: valve for valve in self.valves}
+        self.routing = PortRoutingTable(rs)
+        self.available_port_number = self.routing.number_of_ports
         self.current_port = 1
+        # Keep the position cache honest when telemetry disagrees with it or the valves are reset (real controller only).
+        # Moves are only skipped while the controller's status reader thread runs (see SelectorValve.is_at)
+        if hasattr(self.fc, 'add_status_listener'):
+            self.fc.add_status_listener(self._on_status)
+        if hasattr(self.fc, 'add_command_listener'):
+            self.fc.add_command_listener(self._on_command)
+
+    def _on_status(self, status):
+        if status is None:
+            self.invalidate_positions()
+            return
+        positions = status['selector_valves_pos']
+        for valve in self.valves:
+            if valve.position_verified and positions[valve.id] != valve.position:
+                valve.invalidate()
+
+    def _on_command(self, command, args):
+        if command == CMD_SET.CLEAR:
+            self.invalidate_positions()
+        elif command == CMD_SET.INITIALIZE_ROTARY and args and args[0] in self._valve_by_id:
+            self._valve_by_id[args[0]].invalidate()
+
+    def close(self):
+        '''
+        Stop following the controller's status packets and commands, e.g. before this system is replaced.
+        The cached positions are forgotten too, since nothing would notice the valves moving any more.
+        '''
+        if hasattr(self.fc, 'remove_status_listener'):
+            self.fc.remove_status_listener(self._on_status)
+        if hasattr(self.fc, 'remove_command_listener'):
+            self.fc.remove_command_listener(self._on_command)
+        self.invalidate_positions()
+
+    def invalidate_positions(self):
+        '''Forget every cached valve position, e.g. after an abort or an error'''
+        for valve in self.valves:
+            valve.invalidate()
+
+    def refresh_positions(self):
+        '''Adopt the valve positions reported in the latest MCU status as verified'''
+        positions = self.fc.get_mcu_status()['selector_valves_pos']
+        for valve in self.valves:
+            valve.position = positions[valve.id]
+            valve.position_verified = True
 
     def port_to_reagent(self, port_index):
-        if port_index > self.available_port_number:
-            return None
-        name_mapping = self.config.reagent_selection.selector_valves.name_mapping
-        if name_mapping is None:
+        if port_index not in self.routing:
             return None
-        return name_mapping.get('port_' + str(port_index))
+        return self.routing.route(port_index).reagent
 
-    def open_port(self, port_index):
-        if port_index > self.available_port_number:
+    def get_route(self, port_index):
+        '''
+        Return the (valve, position) moves that connect port_index to the common line:
+        every upstream valve opens its last (pass-through) port and the port's own valve opens the port.
+        '''
+        return [(self._valve_by_id[valve_id], position) for valve_id, position in self.routing.route(port_index).moves]
+
+    def open_port(self, port_index, parallel=None):
+        '''
+        Route the common line to port_index.
+        Sequential mode moves and verifies one valve at a time. Parallel mode sends every move without waiting,
+        waits for the last one to complete and verifies all positions from a single status packet.
+        parallel defaults to self.parallel_routing. Valves whose verified position already matches are not moved.
+        '''
+        if port_index not in self.routing:
             return
+        if parallel is None:
+            parallel = self.parallel_routing
 
-        ports_processed = 0
-        for valve in self.valves[:-1]:  # Process all valves except the last one
-            ports_in_valve = valve.number_of_ports - 1
-            if port_index > (ports_processed + ports_in_valve):
-                valve.open(ports_in_valve + 1)  # Open the last port
-                ports_processed += ports_in_valve
-            else:
-                valve.open(port_index - ports_processed)
-                self.current_port = port_index
-                return
-
-        # If we get here, it's in the last valve
-        self.valves[-1].open(port_index - ports_processed)
-        self.fc.wait_for_completion()
+        route = self.get_route(port_index)
+        if parallel:
+            self._open_route_parallel(route)
+        else:
+            for valve, position in route:
+                valve.open(position)
         self.current_port = port_index
         return
 
+    def _open_route_parallel(self, route):
+        route = [(valve, position) for valve, position in route if not valve.is_at(position)]
+        if not route:
+            return
+        for valve, _ in route:
+            valve.invalidate()
+        uid = None
+        for valve, position in route:
+            if self.verbose:
+                print("open", valve.id, position)
+            uid = self.fc.send_command(CMD_SET.SET_ROTARY_VALVE, valve.id, position)
+        # The MCU handles commands in order, so the last one completing means all of them were executed
+        self.fc.wait_for_completion(uid)
+        positions = self.fc.get_mcu_status()['selector_valves_pos']
+        for valve, position in route:
+            if positions[valve.id] != position:
+                raise RuntimeError(f"valve {valve.id} position is {positions[valve.id]}; expected {position}")
+            valve.position = position
+            valve.position_verified = True
+
     def get_tubing_fluid_amount_to_valve(self, port_index):
         # Return the tubing fluid amount from selector valve to sample.
         # = common_tubing + per-valve amount (so total volume matches old config)
-        ports_processed = 0
-        for i, valve in enumerate(self.valves[:-1]):
-            ports_in_valve = valve.number_of_ports - 1
-            if port_index > (ports_processed + ports_in_valve):
-                ports_processed += ports_in_valve
-            else:
-                return self.common_tubing_fluid_amount_ul + valve.tubing_fluid_amount_ul
-
-        return self.common_tubing_fluid_amount_ul + self.valves[-1].tubing_fluid_amount_ul
+        # Ports past the end count as the last valve's
+        port_index = min(max(port_index, 1), self.available_port_number)
+        return self.routing.route(port_index).volume_to_valve
 
     def get_tubing_fluid_amount_to_port(self, port_index):
         # Return the tubing fluid amount from reagent to selector valve port.
-        return self.config.reagent_selection.selector_valves.tubing_fluid_amount_ul.get(
-            'port_' + str(port_index))
+        if port_index not in self.routing:
+            return None
+        return self.routing.route(port_index).volume_to_port
 
     def get_port_names(self):
-        names = []
-        name_mapping = self.config.reagent_selection.selector_valves.name_mapping
-        for i in range(1, self.available_port_number + 1):
-            name = ''
-            if name_mapping is not None:
-                name = name_mapping.get('port_' + str(i), '')
-            names.append('Port ' + str(i) + ': ' + name)
-        return names
+        return ['Port ' + str(route.port) + ': ' + (route.reagent or '') for route in self.routing.routes()]
 
     def get_current_port(self):
         return self.current_port
+
+    def get_move_time_s(self):
+        '''Mean measured single-valve move time in seconds, or None if no move has been timed yet'''
+        times = [valve.move_time_s for valve in self.valves if valve.move_time_s is not None]
+        return sum(times) / len(times) if times else None
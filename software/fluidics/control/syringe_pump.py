@@ -1,22 +1,108 @@
 import fluidics.control.tecancavro as tecancavro
 import time
-from serial.tools import list_ports
+from bisect import bisect_left
+from collections import namedtuple
+from functools import lru_cache
+from .device_registry import registry
+
+# Full stroke time (s) of each speed code 0-40
+SPEED_SEC_MAPPING = [1.25, 1.30, 1.39, 1.52, 1.71, 1.97, 2.37, 2.77, 3.03, 3.36, 3.77,
+                     4.30, 5.00, 6.00, 7.50, 10.00, 15.00, 30.00, 31.58, 33.33, 35.29,
+                     37.50, 40.00, 42.86, 46.15, 50.00, 54.55, 60.00, 66.67, 75.00, 85.71,
+                     100.00, 120.00, 150.00, 200.00, 300.00, 333.33, 375.00, 428.57, 500.00, 600.00]
+
+# Result of a flow rate lookup: the speed code, the flow rate it achieves (ul/min) and its
+# relative error against the requested rate ((achieved - requested) / requested)
+SpeedCodeMatch = namedtuple('SpeedCodeMatch', ['speed_code', 'flow_rate', 'error'])
+
+
+class SpeedCodeTable:
+    '''Flow rate of every speed code for one syringe volume, searched with bisect'''
+
+    def __init__(self, syringe_ul, speed_sec_mapping=SPEED_SEC_MAPPING):
+        self.syringe_ul = syringe_ul
+        self.stroke_s = tuple(speed_sec_mapping)
+        self.flow_rates = tuple(syringe_ul * 60 / t for t in self.stroke_s)
+
+    def lookup(self, flow_rate, speed_code_limit=0):
+        '''
+        Closest speed code to flow_rate (ul/min), by stroke time; ties go to the faster code.
+        Rates faster than speed_code_limit are clamped to it, rates slower than the slowest code to that code.
+        Returns:
+            SpeedCodeMatch
+        '''
+        if flow_rate <= 0:
+            raise ValueError(f"Flow rate must be positive, got {flow_rate}")
+        stroke_s = self.stroke_s
+        target_s = self.syringe_ul * 60 / flow_rate
+        if target_s <= stroke_s[speed_code_limit]:
+            code = speed_code_limit
+        else:
+            code = bisect_left(stroke_s, target_s, lo=speed_code_limit)
+            if code == len(stroke_s) or target_s - stroke_s[code - 1] <= stroke_s[code] - target_s:
+                code -= 1
+        achieved = self.flow_rates[code]
+        return SpeedCodeMatch(code, achieved, (achieved - flow_rate) / flow_rate)
+
+    def map_sequences(self, sequences, speed_code_limit=0):
+        '''
+        Look up the flow rates of a whole sequence list, each distinct rate once.
+        Returns:
+            list: a SpeedCodeMatch per sequence, None for sequences without a flow_rate
+        '''
+        matches = {}
+        out = []
+        for seq in sequences:
+            rate = seq.get('flow_rate')
+            if rate is None:
+                out.append(None)
+                continue
+            if rate not in matches:
+                matches[rate] = self.lookup(rate, speed_code_limit)
+            out.append(matches[rate])
+        return out
+
+
+@lru_cache(maxsize=None)
+def speed_code_table(syringe_ul):
+    '''SpeedCodeTable of a syringe volume, built once per volume and shared by all pumps'''
+    return SpeedCodeTable(syringe_ul)
+
 
 class SyringePump:
-    SPEED_SEC_MAPPING = [1.25, 1.30, 1.39, 1.52, 1.71, 1.97, 2.37, 2.77, 3.03, 3.36, 3.77, 
-                        4.30, 5.00, 6.00, 7.50, 10.00, 15.00, 30.00, 31.58, 33.33, 35.29,
-                        37.50, 40.00, 42.86, 46.15, 50.00, 54.55, 60.00, 66.67, 75.00, 85.71,
-                        100.00, 120.00, 150.00, 200.00, 300.00, 333.33, 375.00, 428.57, 500.00, 600.00]
-                        # Maps to speed code 0-40
-
-    def __init__(self, sn, syringe_ul, speed_code_limit, waste_port, num_ports=4, slope=14, debug=False):
-        if sn is not None:
-            for d in list_ports.comports():
-                if d.serial_number == sn:
-                    self.port = d.device
-                    self.com_link = tecancavro.TecanAPISerial(tecan_addr=0, ser_port=self.port, ser_baud=9600)
+    SPEED_SEC_MAPPING = SPEED_SEC_MAPPING
+
+    # Ready-polling after execute(): the first poll goes out POLL_LEAD_S before the predicted
+    # finish, then the interval grows by POLL_BACKOFF from POLL_INTERVAL_MIN_S up to POLL_INTERVAL_MAX_S
+    POLL_LEAD_S = 0.05
+    POLL_INTERVAL_MIN_S = 0.02
+    POLL_INTERVAL_MAX_S = 0.5
+    POLL_BACKOFF = 1.5
+    # Weight of the newest observation in the per-speed-code finish time correction
+    FINISH_ERROR_ALPHA = 0.3
+    # Source of time.time()/time.sleep(); a virtual_clock.VirtualClock for dry runs
+    clock = time
+    # Number of built (speed, extract/dispense) chain fragments kept for reuse
+    CHAIN_CACHE_SIZE = 256
+    # Longest command string the XCalibur accepts in one transaction (its command buffer)
+    COMMAND_BUFFER_LEN = 255
+
+    def __init__(self, sn, syringe_ul, speed_code_limit, waste_port, num_ports=4, slope=14, debug=False, com_link=None,
+                 clock=None, backend=None, verbose=True):
+        # com_link: an already opened Tecan link (e.g. aio.TecanAPIBridge); skips the search by serial number
+        # backend: Tecan driver concurrency backend or its name (see tecancavro.backends), threads by default
+        # verbose: print device discovery and initialization to stdout
+        self.com_link = com_link
+        if clock is not None:
+            self.clock = clock
+        if sn is not None and com_link is None:
+            port = registry.find_device(sn)
+            if port is not None:
+                self.port = port
+                self.com_link = tecancavro.TecanAPISerial(tecan_addr=0, ser_port=self.port, ser_baud=9600,
+                                                          backend=backend)
+                if verbose:
                     print("Syringe pump found.")
-                    break
         self.syringe = tecancavro.models.XCaliburD(com_link=self.com_link,
                             num_ports=num_ports,
                             syringe_ul=syringe_ul,
@@ -24,9 +110,11 @@ class SyringePump:
                             waste_port=waste_port,
                             slope=slope,
                             debug=debug,
-                            debug_log_path='.')
+                            debug_log_path='.',
+                            backend=backend)
         self.volume = syringe_ul
         self.speed_code_limit = speed_code_limit
+        self.speed_table = speed_code_table(syringe_ul)
         self.range = 3000  # Property of the syringe pump
         self.chained_volume = 0
 
@@ -35,7 +123,14 @@ class SyringePump:
         self.is_busy = False
         self.is_aborted = False
 
-        print("Syringe pump initialized.")
+        # Speed code of the chain being built/executed, and the learned
+        # (observed - predicted) finish time in seconds for each speed code
+        self.chain_speed_code = speed_code_limit
+        self.finish_time_error = {}
+        self.chain_cache = tecancavro.ChainCache(self.CHAIN_CACHE_SIZE)
+
+        if verbose:
+            print("Syringe pump initialized.")
 
     def get_plunger_position(self):
         position = self.syringe.getPlungerPos()
@@ -50,6 +145,7 @@ class SyringePump:
 
     def set_speed(self, speed_code):
         self.syringe.setSpeed(speed_code)
+        self.chain_speed_code = speed_code
 
     def set_wait(self, time_s):
         self.syringe.delayExec(time_s * 1000)
@@ -61,32 +157,82 @@ class SyringePump:
     def execute(self, block_pump=False):
         if self.is_aborted:
             return
-        self.is_busy = True
-        t = self.syringe.executeChain(minimal_reset=True)
+        t = self.start_execute()
         if block_pump:
             self.syringe.waitReady()
             self.is_busy = False
+            self.get_plunger_position()
+            self.chained_volume = 0
         else:
-            self.wait_for_stop(t)
+            self.finish_execute(t)
+
+    def start_execute(self):
+        '''
+        Send the chain and return without waiting for it, so other devices can be driven meanwhile.
+        Must be followed by finish_execute().
+        Returns:
+            float t: predicted run time of the chain in seconds (None if aborted)
+        '''
+        if self.is_aborted:
+            return None
+        self.is_busy = True
+        t = self.syringe.executeChain(minimal_reset=True)
+        # Stamped once the chain is sent: executeChain already takes its send/ack time off t
+        self._execute_started = self.clock.time()
+        return t
+
+    def finish_execute(self, t):
+        '''Wait for the chain sent by start_execute(), which predicted it to take t seconds'''
+        if t is None:
+            return
+        self.wait_for_stop(max(t - (self.clock.time() - self._execute_started), 0))
         self.get_plunger_position()
         self.chained_volume = 0
 
+    def execute_chain(self, chain, t, port, speed_code):
+        '''
+        Execute a precompiled command chain (see fluidics.sequence_compiler) predicted to take t seconds.
+        port (None if unknown) and speed_code are the valve port and speed code the chain leaves the pump at.
+        Any chain built with dispense/extract/... is discarded.
+        '''
+        if self.is_aborted:
+            return
+        self.reset_chain()
+        # Let the model track the chain's final port and speed as if it had built the chain itself
+        syringe = self.syringe
+        self.set_speed(speed_code)
+        if port is not None:
+            syringe.changePort(port)
+        syringe.cmd_chain = chain
+        syringe.exec_time = t
+        self.finish_execute(self.start_execute())
+        # The plunger moves were not simulated, so take the plunger position read back from the pump
+        syringe.updateSimState()
+
     def get_time_to_finish(self):
         return self.syringe.exec_time
 
+    def _chain(self, operation, speed_code, build):
+        '''Append set_speed(speed_code) + build(syringe) to the chain, reusing the cached fragment if possible'''
+        def build_with_speed(syringe):
+            syringe.setSpeed(speed_code)
+            build(syringe)
+        self.chain_cache.apply(self.syringe, operation + (speed_code,), build_with_speed)
+        self.chain_speed_code = speed_code
+
     def dispense(self, port, volume, speed_code):
         if self.is_aborted:
             return
-        self.set_speed(max(speed_code, self.speed_code_limit))
-        self.syringe.dispense(port, volume)
+        self._chain(('dispense', port, volume), max(speed_code, self.speed_code_limit),
+                    lambda syringe: syringe.dispense(port, volume))
         self.chained_volume = self.chained_volume - volume
         return self.get_time_to_finish()
 
     def extract(self, port, volume, speed_code):
         if self.is_aborted:
             return
-        self.set_speed(max(speed_code, self.speed_code_limit))
-        self.syringe.extract(port, volume)
+        self._chain(('extract', port, volume), max(speed_code, self.speed_code_limit),
+                    lambda syringe: syringe.extract(port, volume))
         self.chained_volume = self.chained_volume + volume
         return self.get_time_to_finish()
 
@@ -94,10 +240,9 @@ class SyringePump:
         if self.is_aborted:
             return
         if speed_code is None:
-            self.set_speed(self.speed_code_limit)
-        else:
-            self.set_speed(speed_code)
-        self.syringe.dispenseToWaste(retain_port=False)
+            speed_code = self.speed_code_limit
+        self._chain(('dispense_to_waste',), speed_code,
+                    lambda syringe: syringe.dispenseToWaste(retain_port=False))
         self.chained_volume = 0
         return self.get_time_to_finish()
 
@@ -109,15 +254,126 @@ class SyringePump:
         self.is_aborted = False
 
     def wait_for_stop(self, t=0):
-        time.sleep(t)
+        '''
+        Wait until the pump reports ready after a chain predicted to take t seconds.
+        The first poll is scheduled just before the predicted finish, corrected by the error
+        learned for the chain's speed code, and later polls back off geometrically.
+        '''
+        speed_code = self.chain_speed_code
+        start = self.clock.time()
+        expected = max(t + self.finish_time_error.get(speed_code, 0), 0)
+        self.clock.sleep(max(expected - self.POLL_LEAD_S, 0))
+        interval = self.POLL_INTERVAL_MIN_S
+        last_busy = None
         while True:
             if self.is_aborted:
                 self.is_busy = False
                 return
+            polled = self.clock.time() - start
             if self.syringe._checkReady():
                 self.is_busy = False
                 break
-            time.sleep(0.5)
+            last_busy = polled
+            self.clock.sleep(interval)
+            interval = min(interval * self.POLL_BACKOFF, self.POLL_INTERVAL_MAX_S)
+        if t > 0:
+            # The move finished between the last busy poll and the ready one
+            observed = polled if last_busy is None else (last_busy + polled) / 2
+            self._update_finish_time_error(speed_code, observed - t)
+
+    def _update_finish_time_error(self, speed_code, error):
+        previous = self.finish_time_error.get(speed_code)
+        if previous is None:
+            self.finish_time_error[speed_code] = error
+        else:
+            self.finish_time_error[speed_code] = previous + self.FINISH_ERROR_ALPHA * (error - previous)
+
+    # --- Macros: multi-step cycles packed into as few executed chains as the command buffer allows ---
+
+    def _chain_snapshot(self):
+        syringe = self.syringe
+        return (syringe.cmd_chain, syringe.exec_time, dict(syringe.sim_state), syringe.sim_speed_change,
+                self.chained_volume, self.chain_speed_code)
+
+    def _restore_chain(self, snapshot):
+        syringe = self.syringe
+        (syringe.cmd_chain, syringe.exec_time, sim_state, syringe.sim_speed_change,
+         self.chained_volume, self.chain_speed_code) = snapshot
+        syringe.sim_state = sim_state
+
+    def _pack(self, build):
+        '''
+        Append build()'s commands to the chain. If the chain would then overflow the pump's command buffer,
+        the chain built so far is executed first and build() starts a new one.
+        '''
+        snapshot = self._chain_snapshot()
+        build()
+        if len(self.syringe.cmd_chain) <= self.COMMAND_BUFFER_LEN:
+            return
+        if snapshot[0]:
+            self._restore_chain(snapshot)
+            self.execute()
+            if self.is_aborted:
+                return
+            build()
+        if len(self.syringe.cmd_chain) > self.COMMAND_BUFFER_LEN:
+            chain = self.syringe.cmd_chain
+            self.reset_chain()
+            raise ValueError(f"Command chain of {len(chain)} characters exceeds the pump's command buffer")
+
+    def _loop(self, count, build):
+        '''Chain build() to run count times, as a g...Gn loop if count > 1'''
+        if count == 1:
+            build()
+            return
+        syringe = self.syringe
+        time_before = syringe.exec_time
+        syringe.markRepeatStart()
+        build()
+        body_time = syringe.exec_time - time_before
+        syringe.repeatCmdSeq(count)
+        # repeatCmdSeq scales the whole chain's time; only the loop body repeats
+        syringe.exec_time = time_before + body_time * count
+
+    def _steps_to_ul(self, steps):
+        # The syringe truncates volumes to whole steps; aiming mid-step keeps float rounding from losing one
+        return (steps + 0.5) * self.volume / self.range
+
+    def cycle(self, in_port, volume, speed_code, out_port=None, out_speed_code=None):
+        '''
+        Chain: extract `volume` through in_port, then push it out through out_port (to waste if None).
+        Volumes larger than the free syringe space are split into full strokes, written as an XCalibur
+        g...Gn loop so the chain length does not grow with the number of strokes, plus the remainder
+        rounded to whole plunger steps (none if below one step). The chain is executed early only if it
+        would overflow the command buffer.
+        Returns:
+            float: predicted run time of the chain built so far
+        '''
+        if self.is_aborted:
+            return
+        if out_port is None and self.syringe.sim_state['plunger_pos'] > 0:
+            # The first stroke would empty the syringe anyway; doing it first makes every stroke a full one
+            self._pack(lambda: self.dispense_to_waste(out_speed_code))
+        free_steps = self.range - self.syringe.sim_state['plunger_pos']
+        if free_steps <= 0:
+            raise ValueError("Syringe is full; empty it before a cycle")
+        n_full, remainder_steps = divmod(round(volume * self.range / self.volume), free_steps)
+        strokes = [(self._steps_to_ul(steps), n) for steps, n in ((free_steps, n_full), (remainder_steps, 1))
+                   if steps > 0 and n > 0]
+
+        def stroke(v):
+            self.extract(in_port, v, speed_code)
+            if out_port is None:
+                self.dispense_to_waste(out_speed_code)
+            else:
+                self.dispense(out_port, v, speed_code if out_speed_code is None else out_speed_code)
+
+        def build():
+            for v, n in strokes:
+                self._loop(n, lambda v=v: stroke(v))
+
+        self._pack(build)
+        return self.get_time_to_finish()
 
     def get_flow_rate(self, speed_code):
         return round(self.volume * 60 / (self.SPEED_SEC_MAPPING[speed_code] * 1000), 2)
@@ -125,40 +381,19 @@ class SyringePump:
     def flow_rate_to_speed_code(self, target_flow_rate):
         """
         Map any flow rate to the closest speed code of the syringe pump
-        
+
         :param flow_rate: ul/min
         :return: speed code (int)
         """
-        # TODO: move this to utils
-        target_time = self.volume * 60 / target_flow_rate
-
-        left = 0
-        right = len(self.SPEED_SEC_MAPPING) - 1
-
-        # If target is beyond the range, return the closest endpoint
-        if target_time <= self.SPEED_SEC_MAPPING[self.speed_code_limit]:
-            return self.speed_code_limit
-        if target_time >= self.SPEED_SEC_MAPPING[-1]:
-            return len(self.SPEED_SEC_MAPPING) - 1
-
-        # Binary search
-        while left < right:
-            if right - left == 1:
-                if abs(self.SPEED_SEC_MAPPING[left] - target_time) <= abs(self.SPEED_SEC_MAPPING[right] - target_time):
-                    return left
-                return right
-
-            mid = (left + right) // 2
-            mid_value = self.SPEED_SEC_MAPPING[mid]
-
-            if mid_value == target_time:
-                return mid
-            elif mid_value > target_time:
-                right = mid
-            else:
-                left = mid
+        return self.speed_table.lookup(target_flow_rate, self.speed_code_limit).speed_code
+
+    def match_flow_rate(self, target_flow_rate):
+        '''SpeedCodeMatch (code, achieved flow rate, relative error) for a flow rate in ul/min'''
+        return self.speed_table.lookup(target_flow_rate, self.speed_code_limit)
 
-        return left
+    def match_sequence_flow_rates(self, sequences):
+        '''SpeedCodeMatch of each sequence's flow_rate (None where it has none), see SpeedCodeTable.map_sequences'''
+        return self.speed_table.map_sequences(sequences, self.speed_code_limit)
 
     def close(self, to_waste=False):
         if to_waste:
@@ -167,15 +402,17 @@ class SyringePump:
         del self.com_link
 
 class SyringePumpSimulation():
-    SPEED_SEC_MAPPING = [1.25, 1.30, 1.39, 1.52, 1.71, 1.97, 2.37, 2.77, 3.03, 3.36, 3.77, 
-                        4.30, 5.00, 6.00, 7.50, 10.00, 15.00, 30.00, 31.58, 33.33, 35.29,
-                        37.50, 40.00, 42.86, 46.15, 50.00, 54.55, 60.00, 66.67, 75.00, 85.71,
-                        100.00, 120.00, 150.00, 200.00, 300.00, 333.33, 375.00, 428.57, 500.00, 600.00]
-                        # Maps to speed code 0-40
+    SPEED_SEC_MAPPING = SPEED_SEC_MAPPING
 
-    def __init__(self, sn, syringe_ul, speed_code_limit, waste_port, num_ports=4, slope=14):
+    clock = time
+
+    def __init__(self, sn, syringe_ul, speed_code_limit, waste_port, num_ports=4, slope=14, clock=None):
+        if clock is not None:
+            self.clock = clock
         self.syringe = None
         self.volume = syringe_ul
+        self.speed_code_limit = speed_code_limit
+        self.speed_table = speed_code_table(syringe_ul)
         self.range = 3000
         self.is_busy = False
         self.is_aborted = False
@@ -205,6 +442,20 @@ class SyringePumpSimulation():
         self.is_busy = True
         self.wait_for_stop(5)
 
+    def start_execute(self):
+        self.is_busy = True
+        self._execute_started = self.clock.time()
+        return 5
+
+    def finish_execute(self, t):
+        if t is None:
+            return
+        self.wait_for_stop(max(t - (self.clock.time() - self._execute_started), 0))
+
+    def execute_chain(self, chain, t, port, speed_code):
+        self.is_busy = True
+        self.wait_for_stop(t)
+
     def get_time_to_finish(self):
         return 5
 
@@ -217,6 +468,9 @@ class SyringePumpSimulation():
     def dispense_to_waste(self, speed_code=None):
         return 5
 
+    def cycle(self, in_port, volume, speed_code, out_port=None, out_speed_code=None):
+        return 5
+
     def abort(self):
         self.is_aborted = True
 
@@ -224,15 +478,16 @@ class SyringePumpSimulation():
         self.is_aborted = False
 
     def wait_for_stop(self, t=0):
-        time.sleep(t)
+        self.clock.sleep(t)
         self.is_busy = False
         return
 
     def get_flow_rate(self, speed_code):
         return round(self.volume * 60 / (self.SPEED_SEC_MAPPING[speed_code] * 1000), 2)
 
-    def flow_rate_to_speed_code(self, target_flow_rate):
-        return 20
+    flow_rate_to_speed_code = SyringePump.flow_rate_to_speed_code
+    match_flow_rate = SyringePump.match_flow_rate
+    match_sequence_flow_rates = SyringePump.match_sequence_flow_rates
 
     def close(self, to_waste=False):
         pass
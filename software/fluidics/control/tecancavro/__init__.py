@@ -1,4 +1,7 @@
 from .tecanapi import TecanAPI
-from .transport import TecanAPISerial, TecanAPINode, TecanAPITimeout
+from .backends import ThreadBackend, GeventBackend, AsyncioBackend, getBackend, getSyncBackend
+from .transport import TecanAPISerial, TecanAPINode, TecanAPISimulation, TecanAPITimeout
 from .syringe import Syringe, SyringeError, SyringeTimeout
 from .models import XCaliburD
+from .chain_cache import ChainCache
+from .aio_transport import AsyncSerialPort, TecanAPIAsyncSerial, waitReadyAsync
@@ -0,0 +1,314 @@
+"""
+aio_transport.py
+
+Contains asyncio-native counterparts of the blocking serial transport in
+`transport.py`. Frames are still built and parsed by `TecanAPI`; only the
+I/O is different:
+
+`AsyncSerialPort` : Non-blocking reads and writes on a pyserial port. Waits
+                    on the port's file descriptor with `loop.add_reader`
+                    where the event loop supports it (POSIX), and falls
+                    back to polling `in_waiting` otherwise.
+
+`TecanAPIAsyncSerial` : `TecanAPI` subclass whose `sendRcv` is a coroutine.
+                        Devices on the same port (daisy-chaining) share one
+                        `AsyncSerialPort` and take turns through its lock.
+
+`waitReadyAsync` : Coroutine equivalent of `Syringe._waitReady`.
+
+"""
+
+import asyncio
+from time import monotonic
+
+import serial
+
+from .backends import AsyncioBackend, getBackend
+from .tecanapi import TecanAPI, TecanAPITimeout
+from .syringe import SyringeError, SyringeTimeout
+
+
+class AsyncSerialPort(object):
+    """
+    Wraps an open `serial.Serial` for use from coroutines. Reads never block
+    the event loop; each read method takes its own `timeout` (seconds, None
+    to wait forever) and, like pyserial, returns whatever arrived if it
+    expires.
+    """
+
+    # Sleep between polls when the event loop cannot watch the port's fd
+    POLL_INTERVAL_S = 0.001
+
+    def __init__(self, ser):
+        self.ser = ser
+        self.lock = asyncio.Lock()
+        self._buffer = bytearray()
+        try:
+            self._fd = ser.fileno()
+        except (AttributeError, OSError, NotImplementedError):
+            self._fd = None
+
+    def _drain(self):
+        n_waiting = self.ser.in_waiting
+        if n_waiting:
+            self._buffer += self.ser.read(n_waiting)
+
+    async def _waitReadable(self, timeout):
+        loop = asyncio.get_running_loop()
+        if self._fd is not None:
+            ready = loop.create_future()
+            try:
+                loop.add_reader(self._fd, lambda: ready.done() or
+                                ready.set_result(None))
+            except NotImplementedError:
+                # e.g. the Windows proactor loop
+                self._fd = None
+            else:
+                try:
+                    await asyncio.wait_for(ready, timeout)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    loop.remove_reader(self._fd)
+                return
+        poll = self.POLL_INTERVAL_S
+        await asyncio.sleep(poll if timeout is None else min(poll, timeout))
+
+    async def _fill(self, deadline):
+        """
+        Waits for more bytes until `deadline` (monotonic seconds, or None)
+        and moves them into the buffer. Returns False if the deadline passed.
+        """
+        self._drain()
+        while True:
+            if deadline is None:
+                remaining = None
+            else:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    return False
+            await self._waitReadable(remaining)
+            n_buffered = len(self._buffer)
+            self._drain()
+            if len(self._buffer) > n_buffered:
+                return True
+
+    def _take(self, n):
+        out = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        return out
+
+    @staticmethod
+    def _deadline(timeout):
+        return None if timeout is None else monotonic() + timeout
+
+    async def read_until(self, expected, timeout=None):
+        """
+        Returns bytes up to and including `expected`, or what was read so far
+        if `timeout` expires first.
+        """
+        deadline = self._deadline(timeout)
+        self._drain()
+        while True:
+            idx = self._buffer.find(expected)
+            if idx >= 0:
+                return self._take(idx + len(expected))
+            if not await self._fill(deadline):
+                return self._take(len(self._buffer))
+
+    async def read(self, size=1, timeout=None):
+        """
+        Returns `size` bytes, or fewer if `timeout` expires first.
+        """
+        deadline = self._deadline(timeout)
+        self._drain()
+        while len(self._buffer) < size:
+            if not await self._fill(deadline):
+                break
+        return self._take(size)
+
+    async def read_some(self, timeout=None):
+        """
+        Returns everything available, waiting for at least one byte unless
+        `timeout` expires (in which case b'' is returned).
+        """
+        self._drain()
+        if not self._buffer:
+            await self._fill(self._deadline(timeout))
+        return self._take(len(self._buffer))
+
+    def write(self, data):
+        self.ser.write(data)
+
+    def reset_input_buffer(self):
+        self._buffer.clear()
+        self.ser.reset_input_buffer()
+
+    def close(self):
+        self.ser.close()
+
+
+class TecanAPIAsyncSerial(TecanAPI):
+    """
+    Asyncio version of `TecanAPISerial`. `sendRcv` must be awaited from a
+    running event loop. Instances opened on the same port path share one
+    `AsyncSerialPort` through `port_mapping`, and exchanges on a shared port
+    are serialized by its lock.
+    """
+
+    port_mapping = {}
+
+    def __init__(self, tecan_addr, ser_port, ser_baud, ser_timeout=0.1,
+                 max_attempts=5, backend=None):
+
+        super(TecanAPIAsyncSerial, self).__init__(tecan_addr)
+
+        # Must provide an awaitable sleep (see backends.AsyncioBackend)
+        self.backend = AsyncioBackend() if backend is None else getBackend(backend)
+
+        self.ser_port = ser_port
+        self.ser_info = {
+            'baud': ser_baud,
+            'timeout': ser_timeout,
+            'max_attempts': max_attempts
+        }
+        self._registerPort()
+
+    async def sendRcv(self, cmd):
+        attempt_num = 0
+        async with self._port.lock:
+            while attempt_num < self.ser_info['max_attempts']:
+                try:
+                    attempt_num += 1
+                    if attempt_num == 1:
+                        frame_out = self.emitFrame(cmd)
+                    else:
+                        frame_out = self.emitRepeat()
+                    self._sendFrame(frame_out)
+                    frame_in = await self._receiveFrame()
+                    if frame_in:
+                        return frame_in
+                    await self.backend.sleep(0.05 * attempt_num)
+                except serial.SerialException:
+                    await self.backend.sleep(0.2)
+        raise(TecanAPITimeout('Tecan serial communication exceeded max '
+                              'attempts [{0}]'.format(
+                              self.ser_info['max_attempts'])))
+
+    def _sendFrame(self, frame):
+        # Drop anything left over from an earlier, abandoned reply
+        self._port.reset_input_buffer()
+        self._port.write(frame)
+
+    async def _receiveFrame(self):
+        """
+        Reads one response frame (STX, address, status, data, ETX, checksum),
+        returning as soon as the checksum byte arrives, or False if the reply
+        is missing or truncated after `ser_timeout`.
+        """
+        timeout = self.ser_info['timeout']
+        start = bytes([self.START_BYTE])
+        stop = bytes([self.STOP_BYTE])
+        # Skip any noise before the start byte
+        if not (await self._port.read_until(start, timeout)).endswith(start):
+            return False
+        body = await self._port.read_until(stop, timeout)
+        if not body.endswith(stop):
+            return False
+        checksum = await self._port.read(1, timeout)
+        if len(checksum) != 1:
+            return False
+        return self.parseFrame(start + body + checksum)
+
+    def _registerPort(self):
+        """
+        Shares an already opened port if the parameters match, mirroring
+        `TecanAPISerial._registerSer`. Raises `serial.SerialException` on a
+        parameter conflict.
+        """
+        reg = TecanAPIAsyncSerial.port_mapping
+        port = self.ser_port
+        if port not in reg:
+            # timeout=0: reads return immediately, waiting is done in asyncio
+            ser = serial.Serial(port=port, baudrate=self.ser_info['baud'],
+                                timeout=0)
+            reg[port] = {
+                'info': dict(self.ser_info),
+                '_port': AsyncSerialPort(ser),
+                '_devices': 0
+            }
+        elif reg[port]['info'] != self.ser_info:
+            raise serial.SerialException('TecanAPIAsyncSerial conflict: '
+                'another device is already registered to {0} with '
+                'different parameters'.format(port))
+        reg[port]['_devices'] += 1
+        self._port = reg[port]['_port']
+
+    def close(self):
+        """
+        Releases this device's share of the port; the port is closed when the
+        last device on it is closed.
+        """
+        reg = TecanAPIAsyncSerial.port_mapping.get(self.ser_port)
+        if reg is None or self._port is None:
+            return
+        self._port = None
+        reg['_devices'] -= 1
+        if reg['_devices'] == 0:
+            reg['_port'].close()
+            del TecanAPIAsyncSerial.port_mapping[self.ser_port]
+
+
+async def _checkReadyAsync(syringe, com_link):
+    """
+    Coroutine equivalent of `Syringe._checkReady`, querying through the
+    async `com_link` and updating the syringe's status bookkeeping.
+    """
+    if syringe._ready:
+        return True
+    try:
+        response = await com_link.sendRcv('Q')
+        return syringe._checkStatus(response['status_byte'])[0]
+    except SyringeError as e:
+        if syringe._repeat_error:
+            return syringe._ready
+        else:
+            raise e
+
+
+async def waitReadyAsync(syringe, polling_interval=0.3, timeout=10,
+                         delay=None, com_link=None, backend=None):
+    """
+    Waits for `syringe` to be ready to accept a command without blocking the
+    event loop.
+
+    Kwargs:
+        `polling_interval` (float): time between status queries in seconds
+        `timeout` (float): max wait time in seconds
+        `delay` (float): time to wait before the first query in seconds
+        `com_link`: async link to query through; defaults to the syringe's
+                    `com_link.async_link` (set by sync bridges), or to its
+                    `com_link` itself
+        `backend`: async concurrency backend (see backends.py); defaults to
+                   the link's, or to `AsyncioBackend`
+
+    """
+    if com_link is None:
+        com_link = getattr(syringe.com_link, 'async_link', syringe.com_link)
+    if backend is None:
+        backend = getattr(com_link, 'backend', None)
+        if not isinstance(backend, AsyncioBackend):
+            backend = AsyncioBackend()
+    else:
+        backend = getBackend(backend)
+    if delay:
+        await backend.sleep(delay)
+    deadline = backend.time() + timeout
+    while True:
+        if await _checkReadyAsync(syringe, com_link):
+            return
+        if backend.time() >= deadline:
+            break
+        await backend.sleep(polling_interval)
+    raise(SyringeTimeout('Timeout while waiting for syringe to be ready'
+                         ' to accept commands [{}]'.format(timeout)))
@@ -0,0 +1,102 @@
+"""
+backends.py
+
+Concurrency backends for the Tecan driver. A backend supplies the two
+scheduling primitives the driver uses while it waits on a pump: `sleep`
+(retry back-off in `sendRcv`, polling in `Syringe._waitReady`) and `time`
+(a monotonic clock for timeouts and execution time bookkeeping).
+
+`ThreadBackend` : Blocking `time.sleep`; the default. Other threads keep
+                  running while a pump is polled.
+
+`GeventBackend` : Cooperative `gevent.sleep`, for applications that run the
+                  driver in greenlets. gevent is imported when the backend
+                  is constructed, and nothing is monkey-patched: patching is
+                  left to the application.
+
+`AsyncioBackend` : Awaitable `asyncio.sleep`, for the coroutine API in
+                   aio_transport.py (`TecanAPIAsyncSerial`,
+                   `waitReadyAsync`) only. The blocking transports and
+                   syringes reject it (see `getSyncBackend`), since they
+                   would call its `sleep` without awaiting it.
+
+Transports and syringes take a `backend` (an instance, or one of the names in
+`BACKENDS`) at construction; a syringe uses its com link's backend unless
+given one. A custom object with `sleep` and `time` can be passed as well,
+e.g. a virtual clock to benchmark or test waiting behaviour.
+"""
+
+import asyncio
+import time
+
+
+class ThreadBackend(object):
+    name = 'threads'
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def time(self):
+        return time.monotonic()
+
+
+class GeventBackend(object):
+    name = 'gevent'
+
+    def __init__(self):
+        import gevent
+        self._gevent = gevent
+
+    def sleep(self, seconds):
+        self._gevent.sleep(seconds)
+
+    def time(self):
+        return time.monotonic()
+
+
+class AsyncioBackend(object):
+    name = 'asyncio'
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+    def time(self):
+        return time.monotonic()
+
+
+BACKENDS = {
+    'threads': ThreadBackend,
+    'gevent': GeventBackend,
+    'asyncio': AsyncioBackend,
+}
+
+DEFAULT_BACKEND = ThreadBackend()
+
+
+def getBackend(backend=None):
+    """Returns a backend instance for `backend`: None (the default thread
+    backend), a name from `BACKENDS`, or an object with `sleep` and `time`,
+    returned as is.
+    """
+    if backend is None:
+        return DEFAULT_BACKEND
+    if isinstance(backend, str):
+        try:
+            return BACKENDS[backend]()
+        except KeyError:
+            raise ValueError('Unknown concurrency backend {0!r}, expected one '
+                             'of {1}'.format(backend, sorted(BACKENDS)))
+    return backend
+
+
+def getSyncBackend(backend=None):
+    """Like `getBackend`, for the blocking transports and syringes: raises
+    ValueError for a backend whose `sleep` is a coroutine function (e.g.
+    `AsyncioBackend`), which blocking code cannot wait on.
+    """
+    backend = getBackend(backend)
+    if asyncio.iscoroutinefunction(backend.sleep):
+        raise ValueError('Concurrency backend {0!r} is asynchronous; use it with '
+                         'the aio_transport coroutine API only'.format(
+                             getattr(backend, 'name', backend)))
+    return backend
@@ -0,0 +1,96 @@
+"""
+chain_cache.py
+
+Memoized command chain building for `XCaliburD`.
+
+Building a chainable operation (e.g. `setSpeed` + `extract`) validates the
+arguments, formats the command strings, copies simulation state and computes
+the plunger move time with `_calcPlungerMoveTime`. Protocols repeat the same
+(port, volume, speed) operations many times from the same simulated state,
+so `ChainCache` records what an operation appends to the chain the first time
+it is built and replays it afterwards:
+
+    key   : (operation, simulation state before it)
+    value : (command string fragment, execution time added,
+             simulation state after it, whether it changed speed settings)
+
+Replaying an entry leaves `cmd_chain` and `sim_state` exactly as building the
+operation would; `exec_time` matches up to floating point rounding. The least
+recently used entries are evicted beyond `maxsize`.
+"""
+
+from collections import OrderedDict
+
+# Simulation state that chain building reads and writes
+SIM_STATE_KEYS = ('plunger_pos', 'port', 'microstep', 'start_speed',
+                  'top_speed', 'cutoff_speed', 'slope')
+
+
+class ChainCache(object):
+
+    DEFAULT_MAXSIZE = 256
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def apply(self, syringe, operation, build):
+        """
+        Appends `operation` to the command chain of `syringe`.
+
+        Args:
+            `syringe` (XCaliburD) : syringe whose chain is being built
+            `operation` (tuple) : hashable description of the operation,
+                                  e.g. ('extract', port, volume_ul, speed_code)
+            `build` (callable) : build(syringe) issues the chainable calls
+                                 for the operation, without executing them;
+                                 called on a cache miss
+        """
+        sim_state = syringe.sim_state
+        start = tuple(sim_state[k] for k in SIM_STATE_KEYS)
+        # Volume to step conversions read the committed microstep setting
+        key = (operation, start, syringe.state['microstep'])
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            fragment, exec_time, end, speed_change = entry
+            syringe.cmd_chain += fragment
+            syringe.exec_time += exec_time
+            sim_state.update(zip(SIM_STATE_KEYS, end))
+            if speed_change:
+                syringe.sim_speed_change = True
+            return
+
+        self.misses += 1
+        chain_before = syringe.cmd_chain
+        exec_time_before = syringe.exec_time
+        speed_change_before = syringe.sim_speed_change
+        # Cleared so that the build's own speed change can be observed
+        syringe.sim_speed_change = False
+        try:
+            build(syringe)
+        finally:
+            speed_change = syringe.sim_speed_change
+            syringe.sim_speed_change = speed_change or speed_change_before
+        if not syringe.cmd_chain.startswith(chain_before):
+            # The build reset or executed the chain; nothing reusable
+            return
+        self._entries[key] = (
+            syringe.cmd_chain[len(chain_before):],
+            syringe.exec_time - exec_time_before,
+            tuple(syringe.sim_state[k] for k in SIM_STATE_KEYS),
+            speed_change,
+        )
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
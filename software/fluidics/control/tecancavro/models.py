@@ -5,20 +5,12 @@ Contains Tecan Cavro model-specific classes that inherit from the `Syringe`
 class in syringe.py.
 
 """
-import time
 import logging
 
 from math import sqrt
-from time import sleep
 from functools import wraps
 from contextlib import contextmanager
 
-try:
-    from gevent import monkey; monkey.patch_all(thread=False)
-    from gevent import sleep
-except:
-    from time import sleep
-
 from .syringe import Syringe, SyringeError, SyringeTimeout
 
 
@@ -41,7 +33,7 @@ class XCaliburD(Syringe):
 
     def __init__(self, com_link, num_ports=9, syringe_ul=1000, direction='CW',
                  microstep=False, waste_port=9, slope=14, init_force=0,
-                 debug=False, debug_log_path='.'):
+                 debug=False, debug_log_path='.', backend=None):
         """
         Object initialization function.
 
@@ -74,9 +66,11 @@ class XCaliburD(Syringe):
             `debug_log_path` : path to debug log file - only relevant if
                                `debug` == True.
                 [default] - '' (cwd)
+            `backend` : concurrency backend or its name (see backends.py)
+                [default] - the backend of `com_link`, else 'threads'
 
         """
-        super(XCaliburD, self).__init__(com_link)
+        super(XCaliburD, self).__init__(com_link, backend=backend)
         self.num_ports = num_ports
         self.syringe_ul = syringe_ul
         self.direction = direction
@@ -281,11 +275,11 @@ class XCaliburD(Syringe):
         self.logCall('executeChain', locals())
 
         # Compensaate for reset time (tic/toc) prior to returning wait_time
-        tic = time.time()
+        tic = self.backend.time()
         self.sendRcv(self.cmd_chain, execute=True)
         exec_time = self.exec_time
         self.resetChain(on_execute=True, minimal_reset=minimal_reset)
-        toc = time.time()
+        toc = self.backend.time()
         wait_time = exec_time - (toc-tic)
         if wait_time < 0:
             wait_time = 0
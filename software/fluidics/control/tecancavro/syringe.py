@@ -1,10 +1,4 @@
-import time
-
-try:
-    from gevent import monkey; monkey.patch_all(thread=False)
-    from gevent import sleep
-except:
-    from time import sleep
+from .backends import getSyncBackend
 
 
 class SyringeError(Exception):
@@ -54,8 +48,12 @@ class Syringe(object):
         15: 'Command Overflow'
     }
 
-    def __init__(self, com_link):
+    def __init__(self, com_link, backend=None):
         self.com_link = com_link
+        # Concurrency backend (see backends.py); defaults to the com link's
+        if backend is None:
+            backend = getattr(com_link, 'backend', None)
+        self.backend = getSyncBackend(backend)
         self._ready = False
         self._prev_error_code = 0
         self._repeat_error = False
@@ -118,14 +116,15 @@ class Syringe(object):
             `timeout` (int): max wait time in seconds
 
         """
+        backend = self.backend
         if delay:
-            sleep(delay)
-        start = time.time()
-        while (start-time.time()) < (start+timeout):
-            ready = self._checkReady()
-            if not ready:
-                sleep(polling_interval)
-            else:
+            backend.sleep(delay)
+        deadline = backend.time() + timeout
+        while True:
+            if self._checkReady():
                 return
+            if backend.time() >= deadline:
+                break
+            backend.sleep(polling_interval)
         raise(SyringeTimeout('Timeout while waiting for syringe to be ready'
                              ' to accept commands [{}]'.format(timeout)))
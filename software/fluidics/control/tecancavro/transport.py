@@ -11,12 +11,20 @@ which sends a command string (`cmd`) and returns a dictionary containing the
                   on the same RS-232 port (i.e., daisy-chaining) by sharing
                   a single serial port instance.
 
+`TecanAPISimulation` : In-memory XCalibur stand-in with no I/O. Answers
+                       report commands from a simulated pump state and
+                       applies executed command strings to it instantly.
+
+Retry back-off uses the concurrency backend given at construction (see
+backends.py).
+
 """
 
 import glob
+import re
 import sys
 import uuid
-import time
+from concurrent.futures import ThreadPoolExecutor, wait
 
 import serial
 
@@ -30,19 +38,45 @@ try:
 except:
     import json
 
-try:
-    from gevent import monkey; monkey.patch_all(thread=False)
-    from gevent import sleep
-except:
-    from time import sleep
-
+from .backends import getSyncBackend
 from .tecanapi import TecanAPI, TecanAPITimeout
 
+# Ports are opened/probed in parallel by up to this many threads
+PROBE_WORKERS = 16
+
+
+def _probeConcurrently(probe, items, timeout):
+    """Runs `probe(item)` for every item in parallel and returns the results
+    in item order, skipping items that did not finish within `timeout` seconds
+    (None waits for all). Exceptions raised by `probe` propagate.
+    """
+    if not items:
+        return []
+    pool = ThreadPoolExecutor(max_workers=min(PROBE_WORKERS, len(items)))
+    futures = [pool.submit(probe, item) for item in items]
+    wait(futures, timeout=timeout)
+    # Probes stuck in the OS past the timeout are abandoned, not joined
+    pool.shutdown(wait=False, cancel_futures=True)
+    return [f.result() for f in futures if f.done() and not f.cancelled()]
+
+
+def _canOpen(port):
+    try:
+        s = serial.Serial(port)
+        s.close()
+        return True
+    except (OSError, serial.SerialException):
+        return False
+
+
 # From http://stackoverflow.com/questions/12090503/
 #      listing-available-com-ports-with-python
-def listSerialPorts():
+def listSerialPorts(timeout=2.0):
     """Lists serial ports
 
+    The candidate ports are opened in parallel; a port that has not opened
+    within `timeout` seconds is left out.
+
     :raises EnvironmentError:
         On unsupported or unknown platforms
     :returns:
@@ -61,15 +95,8 @@ def listSerialPorts():
     else:
         raise EnvironmentError('Unsupported platform')
 
-    result = []
-    for port in ports:
-        try:
-            s = serial.Serial(port)
-            s.close()
-            result.append(port)
-        except (OSError, serial.SerialException):
-            pass
-    return result
+    available = _probeConcurrently(_canOpen, ports, timeout)
+    return [port for port, ok in zip(ports, available) if ok]
 
 
 class TecanAPISerial(TecanAPI):
@@ -84,36 +111,49 @@ class TecanAPISerial(TecanAPI):
 
     @classmethod
     def findSerialPumps(cls, tecan_addrs=[0], ser_baud=9600, ser_timeout=0.2,
-                        max_attempts=2):
+                        max_attempts=2, timeout=None):
         ''' Find any enumerated syringe pumps on the local com / serial ports.
 
+        All ports are probed in parallel. Each probe is bounded by
+        `ser_timeout` and `max_attempts` per command; a port that has not
+        answered within `timeout` seconds (default: the worst case of those
+        bounds) is skipped.
+
         Returns list of (<ser_port>, <pump_config>, <pump_firmware_version>)
         tuples.
         '''
-        found_devices = []
-        for port_path in listSerialPorts():
+        if timeout is None:
+            # Two commands per address, each up to max_attempts reads with back-off
+            per_command = max_attempts * ser_timeout + 0.05 * max_attempts * (max_attempts + 1) / 2
+            timeout = 2 * per_command * len(tecan_addrs) + 1.0
+
+        def probe(port_path):
+            found = []
             for addr in tecan_addrs:
                 try:
-                    print('1')
                     p = cls(addr, port_path, ser_baud,
                             ser_timeout, max_attempts)
-                    print('2')
                     config = p.sendRcv('?76')['data']
                     fw_version = p.sendRcv('&')['data']
-                    found_devices.append((port_path, config, fw_version))
-                    return found_devices
+                    found.append((port_path, config, fw_version))
                 except OSError as e:
                     if e.errno != 16:  # Resource busy
                         raise
                 except TecanAPITimeout:
                     pass
+            return found
+
+        found_devices = []
+        for found in _probeConcurrently(probe, listSerialPorts(), timeout):
+            found_devices.extend(found)
         return found_devices
 
     def __init__(self, tecan_addr, ser_port, ser_baud, ser_timeout=0.1,
-                 max_attempts=5):
+                 max_attempts=5, backend=None):
 
         super(TecanAPISerial, self).__init__(tecan_addr)
 
+        self.backend = getSyncBackend(backend)
         self.id_ = str(uuid.uuid4())
         self.ser_port = ser_port
         self.ser_info = {
@@ -136,23 +176,37 @@ class TecanAPISerial(TecanAPI):
                 frame_in = self._receiveFrame()
                 if frame_in:
                     return frame_in
-                sleep(0.05 * attempt_num)
+                self.backend.sleep(0.05 * attempt_num)
             except serial.SerialException:
-                sleep(0.2)
+                self.backend.sleep(0.2)
         raise(TecanAPITimeout('Tecan serial communication exceeded max '
                               'attempts [{0}]'.format(
                               self.ser_info['max_attempts'])))
 
     def _sendFrame(self, frame):
+        # Drop anything left over from an earlier, abandoned reply
+        self._ser.reset_input_buffer()
         self._ser.write(frame)
 
     def _receiveFrame(self):
-        raw_data = b''
-        raw_byte = self._ser.read()
-        while raw_byte != b'':
-            raw_data += raw_byte
-            raw_byte = self._ser.read()
-        return self.parseFrame(raw_data)
+        """
+        Reads one response frame (STX, address, status, data, ETX, checksum)
+        and returns as soon as the checksum byte arrives. `ser_timeout` only
+        comes into play if the reply is missing or truncated, in which case
+        False is returned.
+        """
+        start = bytes([self.START_BYTE])
+        stop = bytes([self.STOP_BYTE])
+        # Skip any noise before the start byte
+        if not self._ser.read_until(start).endswith(start):
+            return False
+        body = self._ser.read_until(stop)
+        if not body.endswith(stop):
+            return False
+        checksum = self._ser.read(1)
+        if len(checksum) != 1:
+            return False
+        return self.parseFrame(start + body + checksum)
 
     def _registerSer(self):
         """
@@ -184,15 +238,16 @@ class TecanAPISerial(TecanAPI):
         """
         Cleanup serial port registration on delete
         """
-        port_reg = TecanAPISerial.ser_mapping[self.ser_port]
         try:
+            port_reg = TecanAPISerial.ser_mapping[self.ser_port]
             dev_list = port_reg['_devices']
             ind = dev_list.index(self.id_)
             del dev_list[ind]
             if len(dev_list) == 0:
                 port_reg['_ser'].close()
                 del port_reg, TecanAPISerial.ser_mapping[self.ser_port]
-        except KeyError:
+        except (KeyError, AttributeError):
+            # AttributeError: __init__ failed before the port was registered
             pass
 
 
@@ -203,8 +258,9 @@ class TecanAPINode(TecanAPI):
     """
 
     def __init__(self, tecan_addr, node_addr, response_len=20,
-                 max_attempts=5):
+                 max_attempts=5, backend=None):
         super(TecanAPINode, self).__init__(tecan_addr)
+        self.backend = getSyncBackend(backend)
         self.node_addr = node_addr
         self.response_len = response_len
         self.max_attempts = max_attempts
@@ -224,7 +280,7 @@ class TecanAPINode(TecanAPI):
             frame_in = self._analyzeFrame(raw_in)
             if frame_in:
                 return frame_in
-            sleep(0.2 * attempt_num)
+            self.backend.sleep(0.2 * attempt_num)
         raise(TecanAPITimeout('Tecan HTTP communication exceeded max '
                               'attempts [{0}]'.format(
                               self.max_attempts)))
@@ -290,3 +346,120 @@ class TecanAPINode(TecanAPI):
             return json.loads(data)
         else:
             return None
+
+
+class TecanAPISimulation(TecanAPI):
+    """
+    Simulated XCalibur pump behind the `sendRcv` interface, so that model
+    classes (e.g. `XCaliburD`) can build command chains and predict their
+    timing without hardware. Executed strings ('...R') update the plunger
+    position, valve port and speeds immediately; the pump always reports
+    ready. A plunger move outside [0, `max_steps`] is rejected with error 3
+    (invalid operand), like the real pump, and leaves the state unchanged.
+    """
+
+    # XCalibur factory defaults (pulses/sec) and speed code table
+    DEFAULT_SPEEDS = {'start_speed': 900, 'top_speed': 1400, 'cutoff_speed': 900}
+    SPEED_CODES = {0: 6000, 1: 5600, 2: 5000, 3: 4400, 4: 3800, 5: 3200,
+                   6: 2600, 7: 2200, 8: 2000, 9: 1800, 10: 1600, 11: 1400,
+                   12: 1200, 13: 1000, 14: 800, 15: 600, 16: 400, 17: 200,
+                   18: 190, 19: 180, 20: 170, 21: 160, 22: 150, 23: 140,
+                   24: 130, 25: 120, 26: 110, 27: 100, 28: 90, 29: 80,
+                   30: 70, 31: 60, 32: 50, 33: 40, 34: 30, 35: 20, 36: 18,
+                   37: 16, 38: 14, 39: 12, 40: 10}
+    TOKEN_RE = re.compile(r'([A-Za-z])(\d*(?:,\d+)*)')
+
+    def __init__(self, tecan_addr=0, plunger_pos=0, port=1, max_steps=3000):
+        super(TecanAPISimulation, self).__init__(tecan_addr)
+        self.max_steps = max_steps
+        self.state = dict(self.DEFAULT_SPEEDS, plunger_pos=plunger_pos,
+                          port=port, microstep=0, slope=14)
+        self.history = []
+        # Called as move_callback(port, steps) for every plunger move of an
+        # executed string (steps > 0 aspirates through `port`)
+        self.move_callback = None
+
+    def sendRcv(self, cmd):
+        self.history.append(cmd)
+        if cmd.startswith('?'):
+            return self._reply(self._report(cmd[1:]))
+        if cmd == '&':
+            return self._reply(b'SIM')
+        if cmd.endswith('R'):
+            if not self._execute(cmd[:-1]):
+                return self._reply(error_code=3)
+        return self._reply()
+
+    def _reply(self, data=None, error_code=0):
+        return {'status_byte': '0110{:04b}'.format(error_code), 'data': data}
+
+    def _report(self, query):
+        value = {
+            '': self.state['plunger_pos'],
+            '1': self.state['start_speed'],
+            '2': self.state['top_speed'],
+            '3': self.state['cutoff_speed'],
+            '4': self.state['plunger_pos'],
+            '6': self.state['port'],
+            '10': 0,
+        }.get(query, 0)
+        return str(value).encode()
+
+    def _expand(self, cmd):
+        """Returns the (command, operand) tokens of `cmd` with g...Gn loops unrolled"""
+        out = []
+        loop_starts = []
+        for name, operand in self.TOKEN_RE.findall(cmd):
+            if name == 'g':
+                loop_starts.append(len(out))
+            elif name == 'G':
+                start = loop_starts.pop() if loop_starts else 0
+                body = out[start:]
+                out.extend(body * (max(int(operand or 0), 1) - 1))
+            else:
+                out.append((name, operand))
+        return out
+
+    def _execute(self, cmd):
+        """Applies an executed command string. Returns False if it is rejected."""
+        state = dict(self.state)
+        moves = []
+        for name, operand in self._expand(cmd):
+            value = int(operand.split(',')[0]) if operand else 0
+            if name in 'IOBE':
+                state['port'] = value
+            elif name in 'ZYW':
+                moves.append((state['port'], -state['plunger_pos']))
+                state['plunger_pos'] = 0
+            elif name in 'APD':
+                if name == 'A':
+                    pos = value
+                elif name == 'P':
+                    pos = state['plunger_pos'] + value
+                else:
+                    pos = state['plunger_pos'] - value
+                if not 0 <= pos <= self.max_steps:
+                    return False
+                moves.append((state['port'], pos - state['plunger_pos']))
+                state['plunger_pos'] = pos
+            elif name == 'S':
+                top_speed = self.SPEED_CODES[value]
+                state['top_speed'] = top_speed
+                state['start_speed'] = min(state['start_speed'], top_speed)
+                state['cutoff_speed'] = min(state['cutoff_speed'], top_speed)
+            elif name == 'v':
+                state['start_speed'] = value
+            elif name == 'V':
+                state['top_speed'] = value
+            elif name == 'c':
+                state['cutoff_speed'] = value
+            elif name == 'L':
+                state['slope'] = value
+            elif name == 'N':
+                state['microstep'] = value
+        self.state = state
+        if self.move_callback is not None:
+            for port, steps in moves:
+                if steps:
+                    self.move_callback(port, steps)
+        return True
@@ -0,0 +1,159 @@
+"""Binary telemetry log of raw MCU status packets.
+
+`TelemetryWriter` appends each 30-byte status frame with a monotonic
+timestamp to a preallocated, memory-mapped file. Nothing is decoded or
+formatted on the hot path; `read_telemetry` and `export_columns` decode the
+log offline (see convert_telemetry.py).
+
+File layout (little-endian):
+    header, HEADER_SIZE bytes:
+        8s  magic (TELEMETRY_MAGIC)
+        H   format version
+        H   frame length
+        I   record size
+        d   wall-clock time at start (seconds since epoch)
+        d   monotonic clock at start
+        Q   number of records written
+    records, RECORD_DTYPE each:
+        <f8 monotonic timestamp
+        u1[frame length] raw frame
+"""
+
+import os
+import struct
+from time import time, monotonic
+
+import numpy as np
+
+from ._def import MCU_MSG_LENGTH
+from .mcu_status import decode_status_batch
+
+TELEMETRY_MAGIC = b'FLDTLM\x00\x00'
+TELEMETRY_VERSION = 1
+HEADER_STRUCT = struct.Struct('<8sHHIddQ')
+HEADER_SIZE = 64
+_COUNT_OFFSET = HEADER_STRUCT.size - 8
+
+RECORD_DTYPE = np.dtype([('t', '<f8'), ('frame', 'u1', (MCU_MSG_LENGTH,))])
+
+
+class TelemetryWriter:
+    """Append-only, memory-mapped log of (timestamp, raw frame) records."""
+
+    def __init__(self, path, capacity=1 << 18):
+        '''
+        Arguments:
+            str path: file to create (overwritten if it exists)
+            int capacity: number of records to preallocate; the file grows by the same amount when full
+        '''
+        self.path = path
+        self.chunk = capacity
+        self.capacity = 0
+        self.count = 0
+        self._mm = None
+        self.start_time = time()
+        self.start_monotonic = monotonic()
+        with open(self.path, 'wb') as f:
+            f.write(HEADER_STRUCT.pack(TELEMETRY_MAGIC, TELEMETRY_VERSION, MCU_MSG_LENGTH,
+                                       RECORD_DTYPE.itemsize, self.start_time, self.start_monotonic, 0))
+        self._grow()
+
+    def _grow(self):
+        '''Extend the file by one chunk of zeroed records and remap it'''
+        self._unmap()
+        self.capacity += self.chunk
+        with open(self.path, 'r+b') as f:
+            f.truncate(HEADER_SIZE + self.capacity * RECORD_DTYPE.itemsize)
+        self._mm = np.memmap(self.path, dtype=np.uint8, mode='r+')
+        self._records = self._mm[HEADER_SIZE:].view(RECORD_DTYPE)
+        self._count = self._mm[_COUNT_OFFSET:_COUNT_OFFSET + 8].view('<u8')
+
+    def _unmap(self):
+        if self._mm is not None:
+            self._mm.flush()
+            del self._records, self._count
+            self._mm = None
+
+    def append(self, frame, t=None):
+        '''Record one raw frame, timestamped with time.monotonic() unless `t` is given'''
+        if self.count == self.capacity:
+            self._grow()
+        record = self._records[self.count]
+        record['t'] = monotonic() if t is None else t
+        record['frame'] = np.frombuffer(frame, dtype=np.uint8)
+        self.count += 1
+        self._count[0] = self.count
+
+    def flush(self):
+        '''Push written records to disk'''
+        if self._mm is not None:
+            self._mm.flush()
+
+    def close(self):
+        '''Flush, unmap and trim the unused preallocated space'''
+        if self._mm is None:
+            return
+        self._unmap()
+        with open(self.path, 'r+b') as f:
+            f.truncate(HEADER_SIZE + self.count * RECORD_DTYPE.itemsize)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_header(path):
+    '''Return the header fields of a telemetry file as a dict'''
+    with open(path, 'rb') as f:
+        raw = f.read(HEADER_STRUCT.size)
+    magic, version, frame_len, record_size, start_time, start_monotonic, count = HEADER_STRUCT.unpack(raw)
+    if magic != TELEMETRY_MAGIC:
+        raise ValueError(f"{path} is not a telemetry file")
+    if version != TELEMETRY_VERSION or frame_len != MCU_MSG_LENGTH or record_size != RECORD_DTYPE.itemsize:
+        raise ValueError(f"Unsupported telemetry format in {path}: version {version}, frame length {frame_len}")
+    return {
+        'version': version,
+        'start_time': start_time,
+        'start_monotonic': start_monotonic,
+        'count': count,
+    }
+
+
+def read_telemetry(path):
+    '''
+    Map a telemetry file without copying it.
+    Returns:
+        (timestamps, frames): wall-clock seconds since epoch (float64, shape (n,)) and raw frames (uint8, shape (n, frame length))
+    Records written after the last header update (e.g. after a crash) are recovered up to the first unused slot.
+    '''
+    header = read_header(path)
+    n_slots = (os.path.getsize(path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+    if n_slots == 0:
+        return np.empty(0), np.empty((0, MCU_MSG_LENGTH), dtype=np.uint8)
+    records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE, shape=(n_slots,))
+    count = min(header['count'], n_slots)
+    unused = np.flatnonzero(records['t'][count:] == 0)
+    count += unused[0] if len(unused) else n_slots - count
+    records = records[:count]
+    timestamps = header['start_time'] + (records['t'] - header['start_monotonic'])
+    return timestamps, records['frame']
+
+
+def export_columns(path, out_dir):
+    '''
+    Decode a telemetry file and save one .npy file per column into `out_dir`.
+    Columns are 'timestamp' plus the fields of mcu_status.MCUStatus.
+    Returns the list of written file paths.
+    '''
+    timestamps, frames = read_telemetry(path)
+    columns = {'timestamp': timestamps}
+    columns.update(decode_status_batch(frames))
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    for name, values in columns.items():
+        out_path = os.path.join(out_dir, name + '.npy')
+        np.save(out_path, np.asarray(values))
+        written.append(out_path)
+    return written
@@ -2,7 +2,8 @@ import threading
 import time
 
 import serial
-from serial.tools import list_ports
+
+from .device_registry import registry
 
 
 class TCMController:
@@ -14,11 +15,15 @@ class TCMController:
     """
 
     def __init__(self, sn, channels=2, tolerance_celsius=1.0,
-                 stabilization_timeout_seconds=300, baud_rate=57600, timeout=0.5):
+                 stabilization_timeout_seconds=300, baud_rate=57600, timeout=0.5, port=None):
+        # port: serial device to open instead of searching by serial number
         if channels not in (1, 2):
             raise ValueError(f"channels must be 1 or 2, got {channels}")
 
-        port = [p.device for p in list_ports.comports() if sn == p.serial_number]
+        if port is not None:
+            port = [port]
+        else:
+            port = [p for p in [registry.find_device(sn)] if p is not None]
         if not port:
             raise ValueError(f"No device found with serial number: {sn}")
 
@@ -140,11 +145,15 @@ class TCMController:
 class TCMControllerSimulation:
     """Simulation counterpart. set_target_temperature immediately updates
     the corresponding actual reading, so the stabilization loop terminates
-    on the first poll.
+    on the first poll. Given a `clock` (virtual_clock.VirtualClock), the
+    actual reading instead ramps towards the target at RAMP_CELSIUS_PER_S
+    in that clock's time.
     """
 
+    RAMP_CELSIUS_PER_S = 0.5
+
     def __init__(self, sn=None, channels=2, tolerance_celsius=1.0,
-                 stabilization_timeout_seconds=300, baud_rate=57600, timeout=0.5):
+                 stabilization_timeout_seconds=300, baud_rate=57600, timeout=0.5, clock=None):
         if channels not in (1, 2):
             raise ValueError(f"channels must be 1 or 2, got {channels}")
 
@@ -153,7 +162,10 @@ class TCMControllerSimulation:
         self.stabilization_timeout_seconds = stabilization_timeout_seconds
 
         self.target_temperatures = [10.0] * channels
+        # With a clock: the reading each channel's ramp started from, at _ramp_start_times
         self.actual_temperatures = [10.0] * channels
+        self.clock = clock
+        self._ramp_start_times = [0.0] * channels
         self.output_enabled = [False] * channels
 
         self.temperature_updating_callback = None
@@ -181,8 +193,12 @@ class TCMControllerSimulation:
 
     def set_target_temperature(self, channel, t):
         self._check_channel(channel)
+        if self.clock is None:
+            self.actual_temperatures[channel - 1] = t
+        else:
+            self.actual_temperatures[channel - 1] = self.get_actual_temperature(channel)
+            self._ramp_start_times[channel - 1] = self.clock.time()
         self.target_temperatures[channel - 1] = t
-        self.actual_temperatures[channel - 1] = t
 
     def save_target_temperature(self, channel):
         self._check_channel(channel)
@@ -197,14 +213,20 @@ class TCMControllerSimulation:
 
     def get_actual_temperature(self, channel):
         self._check_channel(channel)
-        return self.actual_temperatures[channel - 1]
+        i = channel - 1
+        if self.clock is None:
+            return self.actual_temperatures[i]
+        start, target = self.actual_temperatures[i], self.target_temperatures[i]
+        change = self.RAMP_CELSIUS_PER_S * (self.clock.time() - self._ramp_start_times[i])
+        return min(start + change, target) if target >= start else max(start - change, target)
 
     def _update_loop(self):
         while not self.terminate_temperature_updating_thread:
             time.sleep(1)
             if self.temperature_updating_callback is not None:
                 try:
-                    self.temperature_updating_callback(list(self.actual_temperatures))
+                    self.temperature_updating_callback(
+                        [self.get_actual_temperature(c) for c in range(1, self.channels + 1)])
                 except TypeError:
                     print("Temperature read callback failed")
 
@@ -0,0 +1,30 @@
+"""Virtual time for dry runs.
+
+`VirtualClock` has the `time()` / `sleep()` interface of the `time` module,
+so simulated devices given a clock wait in simulated time: `sleep` advances
+the clock and returns at once. All devices of a dry run share one clock, so
+the simulated experiment takes as long in virtual time as on the instrument
+while finishing in a fraction of a second of wall-clock time.
+"""
+
+
+class VirtualClock:
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.now += seconds
+
+    def wait(self, event, timeout=None):
+        '''
+        Virtual-time counterpart of event.wait(timeout): advance by timeout unless event is already set.
+        Returns:
+            bool: whether event is set
+        '''
+        if not event.is_set() and timeout is not None:
+            self.sleep(timeout)
+        return event.is_set()
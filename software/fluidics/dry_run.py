@@ -0,0 +1,141 @@
+"""Time-accelerated dry run of a full experiment.
+
+`dry_run` runs the real ExperimentWorker and operations classes on simulated
+devices that share one `VirtualClock`: the MCU (FluidControllerSimulation),
+an XCaliburD syringe model on a `TecanAPISimulation` link, the disc pump and
+the temperature controller. Every wait - syringe moves, valve moves, disc pump
+aspiration, temperature ramps, incubations - advances the virtual clock
+instead of sleeping, so a protocol that takes hours on the instrument is
+validated in seconds. The result holds the timeline, the reagent drawn from
+each selector valve port, and syringe and waste volume traces.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import io
+from typing import NamedTuple, Tuple
+
+from .control.controller import FluidControllerSimulation
+from .control.disc_pump import DiscPump
+from .control.selector_valve import SelectorValveSystem
+from .control.syringe_pump import SyringePump
+from .control.tecancavro import TecanAPISimulation
+from .control.temperature_controller import TCMControllerSimulation
+from .control.virtual_clock import VirtualClock
+from .experiment_worker import ExperimentWorker
+
+
+class DryRunResult(NamedTuple):
+    duration_s: float                               # virtual run time
+    estimated_s: float                              # ExperimentWorker's estimate before the run
+    timeline: Tuple[Tuple[float, int, int, str], ...]  # (t, sequence index, sequence number, status)
+    consumption_ul: dict                            # selector valve port -> volume drawn through it
+    dispensed_ul: dict                              # syringe port (other than waste) -> volume pushed out
+    syringe_trace: Tuple[Tuple[float, float], ...]  # (t, syringe contents)
+    waste_trace: Tuple[Tuple[float, float], ...]    # (t, total volume sent to waste)
+    errors: Tuple[str, ...]
+
+    @property
+    def waste_ul(self) -> float:
+        return self.waste_trace[-1][1] if self.waste_trace else 0.0
+
+    def describe(self) -> list[str]:
+        """Human-readable summary."""
+        lines = [f"Run time: {self.duration_s:.0f} s (estimated {self.estimated_s:.0f} s)"]
+        for t, index, sequence_num, status in self.timeline:
+            lines.append(f"  {t:9.1f} s  sequence {index} ({sequence_num}): {status}")
+        lines.append("Reagent drawn per port:")
+        for port, volume in sorted(self.consumption_ul.items()):
+            lines.append(f"  port {port}: {volume:.0f} ul")
+        for port, volume in sorted(self.dispensed_ul.items()):
+            lines.append(f"Dispensed through syringe port {port}: {volume:.0f} ul")
+        lines.append(f"Waste: {self.waste_ul:.0f} ul")
+        lines.extend(f"Error: {e}" for e in self.errors)
+        return lines
+
+
+def dry_run(sequences: list[dict], config, initial_volume_ul: float = 0,
+            overlap_valve_moves: bool = False, prefetch: bool = False) -> DryRunResult:
+    """Run sequences (validated dicts, see fluidics.sequences) on simulated devices in virtual time.
+
+    Args:
+        sequences: sequences to run, in order (typically get_included_sequences output)
+        config: FluidicsConfig of the instrument
+        initial_volume_ul: syringe contents when the run starts
+        overlap_valve_moves: passed to the operations class
+        prefetch: passed to ExperimentWorker
+
+    Errors raised by a sequence end the run as they would on the instrument; they are
+    returned in `errors` rather than raised.
+    """
+    # Imported here: the operations modules import the experiment worker's siblings
+    from .merfish_operations import MERFISHOperations
+    from .open_chamber_operations import OpenChamberOperations
+
+    sp_cfg = config.syringe_pump
+    ul_per_step = sp_cfg.volume_ul / 3000
+    clock = VirtualClock()
+    link = TecanAPISimulation(plunger_pos=round(initial_volume_ul / ul_per_step))
+
+    timeline, errors = [], []
+    consumption, dispensed = {}, {}
+    syringe_trace, waste_trace = [], []
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        fc = FluidControllerSimulation(None, clock=clock)
+        sp = SyringePump(None, sp_cfg.volume_ul, sp_cfg.speed_code_limit, sp_cfg.waste_port,
+                         com_link=link, clock=clock)
+        sv = SelectorValveSystem(fc, config)
+        tc = None
+        if config.temperature_controller is not None:
+            tc_cfg = config.temperature_controller
+            tc = TCMControllerSimulation(
+                channels=tc_cfg.channels,
+                tolerance_celsius=tc_cfg.tolerance_celsius,
+                stabilization_timeout_seconds=tc_cfg.stabilization_timeout_seconds,
+                clock=clock)
+        if config.application == "Open Chamber":
+            ops = OpenChamberOperations(config, sp, sv, DiscPump(fc, clock=clock), tc,
+                                        overlap_valve_moves=overlap_valve_moves, clock=clock)
+        else:
+            ops = MERFISHOperations(config, sp, sv, tc, overlap_valve_moves=overlap_valve_moves, clock=clock)
+
+        start = clock.time()
+        level = [link.state['plunger_pos']]
+        syringe_trace.append((0.0, level[0] * ul_per_step))
+
+        def on_move(port, steps):
+            # Moves are reported when the chain is sent, so they are stamped with its start time
+            t = clock.time() - start
+            level[0] += steps
+            volume = abs(steps) * ul_per_step
+            if steps > 0:
+                if port == sp_cfg.extract_port:
+                    reagent_port = sv.get_current_port()
+                    consumption[reagent_port] = consumption.get(reagent_port, 0) + volume
+            elif port == sp_cfg.waste_port:
+                waste_trace.append((t, (waste_trace[-1][1] if waste_trace else 0) + volume))
+            else:
+                dispensed[port] = dispensed.get(port, 0) + volume
+            syringe_trace.append((t, level[0] * ul_per_step))
+
+        link.move_callback = on_move
+        callbacks = {
+            'update_progress': lambda index, num, status: timeline.append((clock.time() - start, index, num, status)),
+            'on_error': errors.append,
+        }
+        worker = ExperimentWorker(ops, sequences, config, callbacks, clock=clock, prefetch=prefetch)
+        estimated, _ = worker.estimate()
+        worker.run()
+
+    return DryRunResult(
+        duration_s=clock.time() - start,
+        estimated_s=estimated,
+        timeline=tuple(timeline),
+        consumption_ul=consumption,
+        dispensed_ul=dispensed,
+        syringe_trace=tuple(syringe_trace),
+        waste_trace=tuple(waste_trace),
+        errors=tuple(errors),
+    )
@@ -2,7 +2,7 @@ import time
 import threading
 
 class ExperimentWorker:
-    def __init__(self, experiment_ops, sequences, config, callbacks=None):
+    def __init__(self, experiment_ops, sequences, config, callbacks=None, clock=None, prefetch=False):
         """
         Initialize ExperimentWorker with callbacks instead of signals.
 
@@ -14,18 +14,46 @@ class ExperimentWorker:
                 - 'update_progress': fn(index, sequence_num, status)
                 - 'on_error': fn(error_message)
                 - 'on_finished': fn()
-                - 'on_estimate': fn(time_to_finish, n_sequences)
+                - 'on_estimate': fn(time_to_finish, n_sequences), called when run() starts (see estimate)
+                  and again with the revised total run time after each sequence
+            clock: virtual_clock.VirtualClock for incubations and timing (dry runs); real time if None
+            prefetch: during each incubation, let experiment_ops.prepare_sequence (if it has one)
+                do the next sequence's safe preparatory steps
         """
 
         self.experiment_ops = experiment_ops
         self.sequences = sequences
         self.config = config
         self.callbacks = callbacks or {}
+        self.clock = clock
+        self.prefetch = prefetch
         self._abort_event = threading.Event()
         self._abort_event.clear()
 
-        self.time_to_finish, self.n_sequences = self.get_time_to_finish()
-        self._call_callback('on_estimate', self.time_to_finish, self.n_sequences)
+        # Built by estimate(): compiling the plan is too slow for the thread constructing the worker (GUI)
+        self.estimator = None
+        self.time_to_finish = None
+        self.n_sequences = None
+
+    def estimate(self):
+        """Build the run time estimate once and report it through on_estimate; returns (time_to_finish, n_sequences)."""
+        if self.n_sequences is None:
+            self.estimator = self._make_estimator()
+            self.time_to_finish, self.n_sequences = self.get_time_to_finish()
+            self._call_callback('on_estimate', self.time_to_finish, self.n_sequences)
+        return self.time_to_finish, self.n_sequences
+
+    def _make_estimator(self):
+        """Plan-based RunTimeEstimator, or None to fall back to the flow rate estimate."""
+        # Imported here: the compiler imports this module
+        from .run_time_estimator import RunTimeEstimator
+        sv = getattr(self.experiment_ops, 'sv', None)
+        valve_move_s = sv.get_move_time_s() if hasattr(sv, 'get_move_time_s') else None
+        try:
+            return RunTimeEstimator(self.sequences, self.config, valve_move_s)
+        except Exception as e:
+            print(f"Run time estimate falls back to flow rates: {e}")
+            return None
 
     def _call_callback(self, name, *args):
         """Safely call a callback if it exists."""
@@ -33,6 +61,8 @@ class ExperimentWorker:
             self.callbacks[name](*args)
 
     def get_time_to_finish(self):
+        if self.estimator is not None:
+            return self.estimator.total_s(), len(self.estimator)
         total_time = 0
         total_sequences = 0
         for seq in self.sequences:
@@ -51,36 +81,90 @@ class ExperimentWorker:
             total_sequences += repeat
         return total_time, total_sequences
 
-    def wait_for_incubation(self, time_minutes):
+    def wait_for_incubation(self, time_minutes, next_sequence=None):
         total_seconds = time_minutes * 60  # Convert minutes to seconds
-        if self._abort_event.wait(total_seconds):
+        if next_sequence is not None:
+            start = self._now()
+            self.experiment_ops.prepare_sequence(next_sequence)
+            if self._abort_event.is_set():
+                raise AbortRequested()
+            total_seconds = max(total_seconds - (self._now() - start), 0)
+        if self.clock is None:
+            aborted = self._abort_event.wait(total_seconds)
+        else:
+            aborted = self.clock.wait(self._abort_event, total_seconds)
+        if aborted:
             raise AbortRequested()
 
+    def _prefetch_target(self, index, r):
+        """The sequence that follows repeat r of sequence index, if it should be prepared during the incubation."""
+        if not self.prefetch or not hasattr(self.experiment_ops, 'prepare_sequence'):
+            return None
+        seq = self.sequences[index]
+        if r + 1 < seq.get('repeat', 1):
+            return seq
+        if index + 1 < len(self.sequences):
+            return self.sequences[index + 1]
+        return None
+
+    def _now(self):
+        return time.time() if self.clock is None else self.clock.time()
+
     def abort(self):
         self._abort_event.set()
+        self._invalidate_valve_positions()
+
+    def _invalidate_valve_positions(self):
+        """Valves may have been left mid-route, so the next move re-verifies them."""
+        sv = getattr(self.experiment_ops, 'sv', None)
+        if hasattr(sv, 'invalidate_positions'):
+            sv.invalidate_positions()
+
+    def get_estimate_breakdown(self):
+        """Per sequence repeat estimates (see RunTimeEstimator.breakdown), or None without a plan-based estimate."""
+        if self.estimator is None:
+            return None
+        return self.estimator.breakdown()
+
+    def _update_estimate(self, k, run_start, sequence_start):
+        """Record the duration of run step k and report the revised total run time."""
+        if self.estimator is None:
+            return
+        now = self._now()
+        self.estimator.record(k, now - sequence_start)
+        # Time so far + what is left (this step's incubation and later steps), so the GUI's
+        # countdown from the first estimate stays consistent
+        left = self.estimator.entries[k]['incubation_s'] + self.estimator.remaining_s(k + 1)
+        self.time_to_finish = (now - run_start) + left
+        self._call_callback('on_estimate', self.time_to_finish, self.n_sequences)
 
     def run(self):
         current_sequence = 0
         try:
+            self.estimate()
+            run_start = self._now()
             for index, seq in enumerate(self.sequences):
                 for r in range(seq.get('repeat', 1)):
                     try:
                         current_sequence += 1
                         self._call_callback('update_progress', index, current_sequence, "Started")
+                        sequence_start = self._now()
                         self.experiment_ops.process_sequence(seq)
                         if self._abort_event.is_set():
                             raise AbortRequested()
+                        self._update_estimate(current_sequence - 1, run_start, sequence_start)
 
                         incubation_time = seq.get('incubation_time', 0)
                         if incubation_time > 0:
                             self._call_callback('update_progress', index, current_sequence, "Incubating")
-                            self.wait_for_incubation(incubation_time)
+                            self.wait_for_incubation(incubation_time, self._prefetch_target(index, r))
                         self._call_callback('update_progress', index, current_sequence, "Completed")
 
                     except AbortRequested:
                         self._call_callback('on_error', "Operation aborted by user")
                         return
                     except Exception as e:
+                        self._invalidate_valve_positions()
                         self._call_callback('on_error',
                             f"Error processing sequence {index} (repeat {r + 1}): {str(e)}")
                         return
@@ -4,16 +4,24 @@ from . import sequence_utils
 
 
 class MERFISHOperations():
-    def __init__(self, config, syringe_pump, selector_valves, temperature_controller=None):
+    def __init__(self, config, syringe_pump, selector_valves, temperature_controller=None, overlap_valve_moves=False,
+                 clock=None, verbose=True):
         self.config = config
         self.sp = syringe_pump
         self.sv = selector_valves
         self.tc = temperature_controller
+        # Move the selector valves while the syringe dispenses to waste (see _dispense_to_waste_and_open_port)
+        self.overlap_valve_moves = overlap_valve_moves
+        # Settling waits use this virtual_clock.VirtualClock instead of real time (dry runs)
+        self.clock = clock
+        # Print each sequence as it is processed
+        self.verbose = verbose
         self.extract_port = self.config.syringe_pump.extract_port
         self.speed_code_limit = self.config.syringe_pump.speed_code_limit
 
     def process_sequence(self, sequence):
-        print(sequence)
+        if self.verbose:
+            print(sequence)
         seq_type = sequence['type']
 
         if seq_type == "flow_reagent":
@@ -33,13 +41,67 @@ class MERFISHOperations():
         else:
             raise ValueError(f"Unknown sequence type: {seq_type}")
 
-    def _empty_syringe_pump_on_full(self, volume):
+    def _sleep(self, seconds):
+        # Fixed settling waits go through here so the sequence compiler can record them
+        if self.clock is None:
+            sleep(seconds)
+        else:
+            self.clock.sleep(seconds)
+
+    def _dispense_to_waste_and_open_port(self, port, speed_code=None):
+        """
+        Empty the syringe into waste, then route the selector valves to {port} (if not None).
+        With overlap_valve_moves the valves move while the syringe dispenses: the syringe valve stays on the waste
+        port for the whole chain, so the selector valve path is isolated from it.
+        """
+        self.sp.dispense_to_waste(speed_code)
+        if self.sp.is_aborted:
+            return
+        if self.overlap_valve_moves and port is not None:
+            t = self.sp.start_execute()
+            try:
+                self.sv.open_port(port)
+            finally:
+                self.sp.finish_execute(t)
+        else:
+            self.sp.execute()
+            if port is not None and not self.sp.is_aborted:
+                self.sv.open_port(port)
+
+    def _empty_syringe_pump_on_full(self, volume, next_port=None):
         if self.sp.get_current_volume() + self.sp.get_chained_volume() + volume > 0.95 * self.config.syringe_pump.volume_ul:
             try:
-                self.sp.dispense_to_waste()
-                self.sp.execute()
+                self._dispense_to_waste_and_open_port(next_port)
             except Exception as e:
                 raise OperationError(f"Failed to empty syringe pump: {str(e)}")
+        elif next_port is not None:
+            self.sv.open_port(next_port)
+
+    def prepare_sequence(self, sequence):
+        """
+        Safe preparatory steps for {sequence}, run while the previous sequence incubates (see ExperimentWorker prefetch):
+        empty the syringe to waste if the sequence's first draw would not fit, and route the selector valves to the
+        first port it draws from. Nothing moves through the flow cell: the syringe valve is on the waste port while
+        emptying and rotating the selector valves draws no liquid. Drawing the reagent itself would pull it through
+        the flow cell, so that is left to the sequence.
+        """
+        seq_type = sequence['type']
+        if seq_type == "flow_reagent":
+            port, volume = sequence['fluidic_port'], sequence['volume']
+        elif seq_type in ("priming", "clean_up"):
+            # Priming starts by emptying the syringe, then draws from every port that has tubing to fill
+            use_ports = sequence.get('use_ports')
+            ports = [i for i in range(1, self.sv.available_port_number + 1)
+                     if (use_ports is None or i in use_ports) and self.sv.get_tubing_fluid_amount_to_port(i)]
+            port = ports[0] if ports else sequence['fluidic_port']
+            volume = self.config.syringe_pump.volume_ul
+        else:
+            return
+        try:
+            self.sp.reset_chain()
+            self._empty_syringe_pump_on_full(volume, next_port=port)
+        except Exception as e:
+            raise OperationError(f"Error preparing {seq_type} from port: {port}: {str(e)}")
 
     def flow_reagent(self, port, flow_rate, volume, fill_tubing_with_port):
         """
@@ -49,8 +111,7 @@ class MERFISHOperations():
         speed_code = self.sp.flow_rate_to_speed_code(flow_rate)
         try:
             self.sp.reset_chain()
-            self._empty_syringe_pump_on_full(volume)
-            self.sv.open_port(port)
+            self._empty_syringe_pump_on_full(volume, next_port=port)
             self.sp.extract(self.extract_port, volume, speed_code)
             if self.sp.is_aborted:
                 return
@@ -58,8 +119,8 @@ class MERFISHOperations():
             if self.sp.is_aborted:
                 return
             if fill_tubing_with_port:
-                self.sv.open_port(int(fill_tubing_with_port))
-                self._empty_syringe_pump_on_full(self.sv.get_tubing_fluid_amount_to_valve(fill_tubing_with_port))
+                self._empty_syringe_pump_on_full(self.sv.get_tubing_fluid_amount_to_valve(fill_tubing_with_port),
+                                                 next_port=int(fill_tubing_with_port))
                 self.sp.extract(self.extract_port, self.sv.get_tubing_fluid_amount_to_valve(fill_tubing_with_port), speed_code)
                 if self.sp.is_aborted:
                     return
@@ -78,10 +139,9 @@ class MERFISHOperations():
         speed_code = self.sp.flow_rate_to_speed_code(flow_rate)
         try:
             self.sp.reset_chain()
+            # Emptying the syringe is chained with the first port's cycle (or the final extract): the
+            # selector valves can switch before it runs, since it goes out through the waste port
             self.sp.dispense_to_waste()
-            if self.sp.is_aborted:
-                return
-            self.sp.execute()
             if self.sp.is_aborted:
                 return
             for i in range(1, self.sv.available_port_number + 1):
@@ -90,14 +150,13 @@ class MERFISHOperations():
                 volume_to_port = self.sv.get_tubing_fluid_amount_to_port(i)
                 if volume_to_port:
                     self.sv.open_port(i)
-                    self.sp.extract(self.extract_port, volume_to_port, speed_code)
-                    self.sp.dispense_to_waste()
+                    self.sp.cycle(self.extract_port, volume_to_port, speed_code)
                     if self.sp.is_aborted:
                         return
                     self.sp.execute()
                     # There could be a lot of air in a flow cell system, which may delay the stabilization of the liquid flow.
                     # So we sleep for 1 second here to wait for the flow to stabilize.
-                    sleep(1)
+                    self._sleep(1)
                     if self.sp.is_aborted:
                         return
 
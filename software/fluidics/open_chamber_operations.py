@@ -3,12 +3,19 @@ from .experiment_worker import AbortRequested, OperationError
 from . import sequence_utils
 
 class OpenChamberOperations():
-    def __init__(self, config, syringe_pump, selector_valves, disc_pump, temperature_controller=None):
+    def __init__(self, config, syringe_pump, selector_valves, disc_pump, temperature_controller=None, overlap_valve_moves=False,
+                 clock=None, verbose=True):
         self.config = config
         self.sp = syringe_pump
         self.sv = selector_valves
         self.dp = disc_pump
         self.tc = temperature_controller
+        # Move the selector valves while the syringe dispenses to waste (see _dispense_to_waste_and_open_port)
+        self.overlap_valve_moves = overlap_valve_moves
+        # Settling waits use this virtual_clock.VirtualClock instead of real time (dry runs)
+        self.clock = clock
+        # Print each sequence as it is processed
+        self.verbose = verbose
 
         # Cache frequently used config values
         sp = self.config.syringe_pump
@@ -22,7 +29,8 @@ class OpenChamberOperations():
         self.chamber_volume_ul = self.config.samples.chamber_volume_ul
 
     def process_sequence(self, sequence):
-        print(sequence)
+        if self.verbose:
+            print(sequence)
         seq_type = sequence['type']
 
         if seq_type == "add_reagent":
@@ -59,6 +67,33 @@ class OpenChamberOperations():
         else:
             raise ValueError(f"Unknown sequence type: {seq_type}")
 
+    def _sleep(self, seconds):
+        # Fixed settling waits go through here so the sequence compiler can record them
+        if self.clock is None:
+            sleep(seconds)
+        else:
+            self.clock.sleep(seconds)
+
+    def _dispense_to_waste_and_open_port(self, port, speed_code=None):
+        """
+        Empty the syringe into waste, then route the selector valves to {port} (if not None).
+        With overlap_valve_moves the valves move while the syringe dispenses: the syringe valve stays on the waste
+        port for the whole chain, so the selector valve path is isolated from it.
+        """
+        self.sp.dispense_to_waste(speed_code)
+        if self.sp.is_aborted:
+            return
+        if self.overlap_valve_moves and port is not None:
+            t = self.sp.start_execute()
+            try:
+                self.sv.open_port(port)
+            finally:
+                self.sp.finish_execute(t)
+        else:
+            self.sp.execute()
+            if port is not None and not self.sp.is_aborted:
+                self.sv.open_port(port)
+
     def _empty_syringe_pump_on_full(self, volume):
         if self.sp.get_current_volume() + self.sp.get_chained_volume() + volume > 0.95 * self.syringe_volume_ul:
             try:
@@ -76,13 +111,9 @@ class OpenChamberOperations():
         volume = min(self.chamber_volume_ul, volume)
         try:
             self.sp.reset_chain()
-            self.sp.dispense_to_waste(self.speed_code_limit)
-            if self.sp.is_aborted:
-                return
-            self.sp.execute()
+            self._dispense_to_waste_and_open_port(port, self.speed_code_limit)
             if self.sp.is_aborted:
                 return
-            self.sv.open_port(port)
             # Clear previous buffer in tubings (selector valve to syringe pump)
             self.sp.extract(self.extract_port, self.tubing_sv_to_sp, self.speed_code_limit)
             self.sp.dispense_to_waste(self.speed_code_limit)
@@ -130,10 +161,7 @@ class OpenChamberOperations():
         volume = min(self.chamber_volume_ul, volume)
         try:
             self.sp.reset_chain()
-            self.sp.dispense_to_waste(self.speed_code_limit)
-            if self.sp.is_aborted:
-                return
-            self.sp.execute()
+            self._dispense_to_waste_and_open_port(port, self.speed_code_limit)
             if self.sp.is_aborted:
                 return
             # Assume syringe_volume > (sp_to_oc + sv_to_sp) > sp_to_oc > sv_to_sp > overflow (sp_to_oc + sv_to_sp - chamber_volume)
@@ -141,7 +169,6 @@ class OpenChamberOperations():
             # TODO: Make sure if this assumption is true in most cases. If not, we may need to update the sequence logic
             syringe_vol = 0
             if fill_tubing_with_port:
-                self.sv.open_port(port)
                 syringe_vol += max(volume - self.tubing_sp_to_oc - self.tubing_sv_to_sp, 0)
                 self.sp.extract(self.extract_port, syringe_vol, self.speed_code_limit)
                 if self.sp.is_aborted:
@@ -164,7 +191,6 @@ class OpenChamberOperations():
                     if self.sp.is_aborted:
                         return
             else:
-                self.sv.open_port(port)
                 # Draw the amount needed into syringe (volume - sp_to_oc)
                 syringe_vol = volume - self.tubing_sp_to_oc
                 self.sp.extract(self.extract_port, syringe_vol, self.speed_code_limit)
@@ -193,13 +219,9 @@ class OpenChamberOperations():
         volume = min(self.syringe_volume_ul, volume)
         try:
             self.sp.reset_chain()
-            self.sp.dispense_to_waste(self.speed_code_limit)
-            if self.sp.is_aborted:
-                return
-            self.sp.execute()
+            self._dispense_to_waste_and_open_port(port, self.speed_code_limit)
             if self.sp.is_aborted:
                 return
-            self.sv.open_port(port)
             # No need to clear previous liquid in tubings (sv_to_sp)
             self.sp.extract(self.extract_port, volume - self.tubing_sv_to_sp, self.speed_code_limit)
             if self.sp.is_aborted:
@@ -226,7 +248,7 @@ class OpenChamberOperations():
                 self.dp.start(0.3)
                 self.sp.execute()
                 self.dp.stop()
-            sleep(1)
+            self._sleep(1)
         except Exception as e:
             raise OperationError(f"Error in wash_with_constant_flow from port: {port}: {str(e)}")
 
@@ -242,10 +264,9 @@ class OpenChamberOperations():
         priming_speed_code_limit = self.sp.flow_rate_to_speed_code(8000)
         try:
             self.sp.reset_chain()
+            # Emptying the syringe is chained with the first port's cycle (or the final extract): the
+            # selector valves can switch before it runs, since it goes out through the waste port
             self.sp.dispense_to_waste()
-            if self.sp.is_aborted:
-                return
-            self.sp.execute()  # TODO: needs some refactoring here
             if self.sp.is_aborted:
                 return
             for i in range(1, self.sv.available_port_number + 1):
@@ -254,8 +275,7 @@ class OpenChamberOperations():
                 volume_to_port = self.sv.get_tubing_fluid_amount_to_port(i)
                 if volume_to_port:
                     self.sv.open_port(i)
-                    self.sp.extract(self.extract_port, volume_to_port, priming_speed_code_limit)
-                    self.sp.dispense_to_waste()
+                    self.sp.cycle(self.extract_port, volume_to_port, priming_speed_code_limit)
                     if self.sp.is_aborted:
                         return
                     self.sp.execute()
@@ -0,0 +1,71 @@
+"""Run time estimates for ExperimentWorker, built from the compiled device plan.
+
+The estimate of each sequence repeat is the duration of its compiled plan
+(see fluidics.sequence_compiler): syringe chain times from the XCaliburD
+timing model at the quantized speed codes, dispense-to-waste refills, valve
+moves, priming loops and disc pump waits, plus the incubation time. As the run
+progresses, `record` takes the measured duration of each finished sequence and
+the remaining fluidic estimates are scaled by the observed/predicted ratio.
+"""
+
+from __future__ import annotations
+
+from .sequence_compiler import VALVE_MOVE_S, compile_sequences
+
+
+class RunTimeEstimator:
+    # Weight of the newest sequence in the observed/predicted correction
+    CORRECTION_ALPHA = 0.5
+
+    def __init__(self, sequences: list[dict], config, valve_move_s: float | None = None):
+        """
+        Args:
+            sequences: sequences to run, in order
+            config: FluidicsConfig of the instrument
+            valve_move_s: measured time per valve move (SelectorValveSystem.get_move_time_s()),
+                defaults to the compiler's VALVE_MOVE_S
+
+        Raises OperationError if the sequences cannot be compiled.
+        """
+        plan = compile_sequences(sequences, config,
+                                 valve_move_s=VALVE_MOVE_S if valve_move_s is None else valve_move_s)
+        self.entries = [{
+            'index': p.index,
+            'repeat': p.repeat,
+            'type': p.sequence['type'],
+            'fluidics_s': p.duration_s,
+            'incubation_s': p.incubation_s,
+            'actual_s': None,
+        } for p in plan.sequences]
+        # Observed/predicted ratio of the fluidic time, learned from finished sequences
+        self.correction = 1.0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _scaled(self, entry):
+        # Temperature settling is not a fluidic step, so the fluidic correction does not apply to it
+        if entry['type'] == "set_temperature":
+            return entry['fluidics_s']
+        return entry['fluidics_s'] * self.correction
+
+    def record(self, k: int, actual_s: float):
+        """Record the measured duration of run step k (the k-th sequence repeat), excluding incubation."""
+        entry = self.entries[k]
+        entry['actual_s'] = actual_s
+        if entry['type'] != "set_temperature" and entry['fluidics_s'] > 0:
+            ratio = actual_s / entry['fluidics_s']
+            self.correction += self.CORRECTION_ALPHA * (ratio - self.correction)
+
+    def remaining_s(self, k: int) -> float:
+        """Estimated time for run steps k onwards, including their incubations."""
+        return sum(self._scaled(e) + e['incubation_s'] for e in self.entries[k:])
+
+    def total_s(self) -> float:
+        """Estimated run time: measured durations where known, corrected estimates elsewhere."""
+        return sum((self._scaled(e) if e['actual_s'] is None else e['actual_s']) + e['incubation_s']
+                   for e in self.entries)
+
+    def breakdown(self) -> list[dict]:
+        """One dict per run step: index, repeat, type, fluidics_s, incubation_s, actual_s and estimate_s."""
+        return [dict(e, estimate_s=self._scaled(e) + e['incubation_s']) for e in self.entries]
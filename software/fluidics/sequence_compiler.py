@@ -0,0 +1,300 @@
+"""Compile a sequence list into a flat device command plan, and replay it.
+
+`compile_sequences` runs the application's operations class (MERFISHOperations
+or OpenChamberOperations) against recording stand-ins instead of hardware:
+a real `XCaliburD` model on a `TecanAPISimulation` link builds the exact
+syringe command strings and their predicted durations, a real
+`SelectorValveSystem` on an instant controller resolves valve routes, and
+disc pump actions and fixed waits are captured as they are issued. Every
+sequence repeat becomes one `PlannedSequence` of typed steps, so errors such
+as a plunger overrun surface before anything moves.
+
+`PlanExecutor` replays a plan on the real devices. It exposes
+`process_sequence`, so it can stand in for the operations object given to
+`ExperimentWorker`.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import NamedTuple, Optional, Tuple
+
+from .control._def import COMMAND_STATUS, CMD_SET
+from .control.selector_valve import SelectorValveSystem
+from .control.syringe_pump import SyringePump
+from .control.tecancavro import TecanAPISimulation
+from .experiment_worker import OperationError
+from . import sequence_utils
+
+# Predicted time for one rotary valve move, including the MCU round trip and verification
+VALVE_MOVE_S = 1.0
+# Predicted time for a temperature setpoint to settle (same allowance as ExperimentWorker)
+SET_TEMPERATURE_S = 60.0
+
+
+# --- Plan steps ---
+
+
+class ValveRoute(NamedTuple):
+    port: int
+    moves: Tuple[Tuple[int, int], ...]  # (valve id, position) of the valves that actually move
+    duration_s: float
+
+
+class SyringeChain(NamedTuple):
+    chain: str                          # XCalibur command string, without the trailing 'R'
+    duration_s: float
+    start_volume_ul: float              # syringe contents before and after the chain
+    end_volume_ul: float
+    port: Optional[int]                 # valve port and speed code the chain leaves the pump at
+    speed_code: int
+
+
+class DiscPumpPower(NamedTuple):
+    power: float                        # fraction of full power, 0 turns the pump off
+    duration_s: float = 0.0
+
+
+class Wait(NamedTuple):
+    duration_s: float
+
+
+class SetTemperature(NamedTuple):
+    temperature: float
+    duration_s: float = SET_TEMPERATURE_S
+
+
+class PlannedSequence(NamedTuple):
+    index: int                          # position in the sequence list
+    repeat: int                         # 0-based repeat number
+    sequence: dict
+    steps: Tuple[NamedTuple, ...]
+
+    @property
+    def duration_s(self) -> float:
+        return sum(step.duration_s for step in self.steps)
+
+    @property
+    def incubation_s(self) -> float:
+        return self.sequence.get('incubation_time', 0) * 60
+
+
+class Plan(NamedTuple):
+    sequences: Tuple[PlannedSequence, ...]
+
+    def steps(self):
+        """Iterate over every step of every planned sequence, in execution order."""
+        for planned in self.sequences:
+            yield from planned.steps
+
+    @property
+    def duration_s(self) -> float:
+        """Predicted run time, including incubations."""
+        return sum(p.duration_s + p.incubation_s for p in self.sequences)
+
+    def describe(self) -> list[str]:
+        """Human-readable listing, one line per sequence and per step."""
+        lines = []
+        for p in self.sequences:
+            lines.append(f"[{p.index}.{p.repeat + 1}] {p.sequence['type']} "
+                         f"({p.duration_s:.1f} s + {p.incubation_s:.0f} s incubation)")
+            for step in p.steps:
+                lines.append(f"    {step}")
+        return lines
+
+
+# --- Recording stand-ins ---
+
+
+class _InstantController:
+    """Controller that completes every command immediately and tracks valve positions."""
+
+    def __init__(self):
+        self.uid = 0
+        self.data = {'selector_valves_pos': {i: 1 for i in range(5)}}
+
+    def send_command(self, command, *args):
+        self.uid += 1
+        if command == CMD_SET.SET_ROTARY_VALVE:
+            self.data['selector_valves_pos'][args[0]] = args[1]
+        return self.uid
+
+    def wait_for_completion(self, uid=None, timeout=None):
+        return COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS
+
+    def get_mcu_status(self):
+        return self.data
+
+
+class _RecordingValves(SelectorValveSystem):
+    def __init__(self, config, steps, valve_move_s):
+        super().__init__(_InstantController(), config, verbose=False)
+        self._steps = steps
+        self._valve_move_s = valve_move_s
+
+    def open_port(self, port_index, parallel=None):
+        if port_index not in self.routing:
+            return
+        moves = tuple((valve.id, position) for valve, position in self.get_route(port_index)
+                      if not valve.is_at(position))
+        super().open_port(port_index, parallel)
+        self._steps.append(ValveRoute(port_index, moves, self._valve_move_s * len(moves)))
+
+
+class _RecordingSyringePump(SyringePump):
+    def __init__(self, config, steps, initial_volume_ul):
+        sp = config.syringe_pump
+        plunger_pos = round(initial_volume_ul * 3000 / sp.volume_ul)
+        super().__init__(None, sp.volume_ul, sp.speed_code_limit, sp.waste_port,
+                         com_link=TecanAPISimulation(plunger_pos=plunger_pos), verbose=False)
+        self._steps = steps
+
+    def execute(self, block_pump=False):
+        if self.is_aborted:
+            return
+        chain = self.syringe.cmd_chain
+        duration = self.syringe.exec_time
+        start_volume = self.get_current_volume()
+        self.syringe.executeChain(minimal_reset=True)
+        self.get_plunger_position()
+        self.chained_volume = 0
+        if chain:
+            self._steps.append(SyringeChain(chain, duration, start_volume, self.get_current_volume(),
+                                            self.syringe.state['port'], self.chain_speed_code))
+
+
+class _RecordingDiscPump:
+    def __init__(self, steps):
+        self._steps = steps
+
+    def aspirate(self, time_s):
+        self._steps.extend([DiscPumpPower(1.0), Wait(time_s), DiscPumpPower(0.0)])
+
+    def start(self, power_percentage):
+        self._steps.append(DiscPumpPower(power_percentage))
+
+    def stop(self):
+        self._steps.append(DiscPumpPower(0.0))
+
+    def abort(self):
+        pass
+
+    def reset_abort(self):
+        pass
+
+
+# --- Compiler ---
+
+
+def compile_sequences(sequences: list[dict], config, initial_volume_ul: float = 0,
+                      valve_move_s: float = VALVE_MOVE_S) -> Plan:
+    """Compile validated sequence dicts (see fluidics.sequences.load_sequences) into a Plan.
+
+    Args:
+        sequences: sequences to run, in order (typically get_included_sequences output)
+        config: FluidicsConfig of the instrument
+        initial_volume_ul: syringe contents when the run starts
+        valve_move_s: time charged per rotary valve move (e.g. SelectorValveSystem.get_move_time_s())
+
+    Raises OperationError naming the sequence if any step would fail on the
+    instrument model (e.g. a plunger move out of range).
+    """
+    # Imported here: the operations modules import this package's siblings
+    from .merfish_operations import MERFISHOperations
+    from .open_chamber_operations import OpenChamberOperations
+
+    steps = []
+    sp = _RecordingSyringePump(config, steps, initial_volume_ul)
+    sv = _RecordingValves(config, steps, valve_move_s)
+    if config.application == "Open Chamber":
+        ops = OpenChamberOperations(config, sp, sv, _RecordingDiscPump(steps), verbose=False)
+    else:
+        ops = MERFISHOperations(config, sp, sv, verbose=False)
+    ops._sleep = lambda seconds: steps.append(Wait(seconds))
+
+    planned = []
+    for index, seq in enumerate(sequences):
+        for r in range(seq.get('repeat', 1)):
+            steps.clear()
+            try:
+                if seq['type'] == "set_temperature":
+                    steps.append(SetTemperature(seq['temperature']))
+                else:
+                    ops.process_sequence(seq)
+            except Exception as e:
+                raise OperationError(
+                    f"Sequence {index} ({seq['type']}, repeat {r + 1}) cannot run: {e}") from e
+            planned.append(PlannedSequence(index, r, seq, tuple(steps)))
+    return Plan(tuple(planned))
+
+
+# --- Executor ---
+
+
+class PlanExecutor:
+    """Replays a compiled Plan on the instrument, one planned sequence per process_sequence call."""
+
+    # Allowed mismatch between the planned and the actual syringe contents, in plunger steps
+    VOLUME_TOLERANCE_STEPS = 1
+    # Granularity of abort checks during waits
+    WAIT_POLL_S = 0.1
+
+    def __init__(self, plan: Plan, syringe_pump, selector_valves, disc_pump=None, temperature_controller=None):
+        self.plan = plan
+        self.sp = syringe_pump
+        self.sv = selector_valves
+        self.dp = disc_pump
+        self.tc = temperature_controller
+        self._next = 0
+
+    def process_sequence(self, sequence):
+        """Execute the next planned sequence; `sequence` must be the one it was compiled from."""
+        if self._next >= len(self.plan.sequences):
+            raise OperationError("Plan has no more sequences")
+        planned = self.plan.sequences[self._next]
+        if planned.sequence != sequence:
+            raise OperationError(f"Plan is out of step: expected sequence {planned.index} ({planned.sequence['type']})")
+        self._next += 1
+        try:
+            for step in planned.steps:
+                if self.sp.is_aborted:
+                    return
+                self._run_step(step)
+        except OperationError:
+            raise
+        except Exception as e:
+            raise OperationError(f"Error in {sequence['type']} from plan step {step}: {str(e)}")
+
+    def _run_step(self, step):
+        if isinstance(step, ValveRoute):
+            self.sv.open_port(step.port)
+        elif isinstance(step, SyringeChain):
+            # SyringePumpSimulation has no plunger model to check against
+            if self.sp.syringe is not None:
+                self._check_volume(step.start_volume_ul)
+            self.sp.execute_chain(step.chain, step.duration_s, step.port, step.speed_code)
+        elif isinstance(step, DiscPumpPower):
+            if step.power > 0:
+                self.dp.start(step.power)
+            else:
+                self.dp.stop()
+        elif isinstance(step, Wait):
+            self._wait(step.duration_s)
+        elif isinstance(step, SetTemperature):
+            sequence_utils.set_temperature(self.tc, step.temperature)
+        else:
+            raise OperationError(f"Unknown plan step: {step!r}")
+
+    def _check_volume(self, expected_ul):
+        tolerance = self.VOLUME_TOLERANCE_STEPS * self.sp.volume / self.sp.range
+        actual = self.sp.get_current_volume()
+        if abs(actual - expected_ul) > tolerance:
+            raise OperationError(f"Syringe holds {actual:.0f} ul but the plan expects {expected_ul:.0f} ul")
+
+    def _wait(self, duration_s):
+        end = time.time() + duration_s
+        while not self.sp.is_aborted:
+            remaining = end - time.time()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, self.WAIT_POLL_S))
@@ -10,7 +10,8 @@ def set_temperature(tc, target):
     are within tolerance, abort is requested, or timeout fires.
 
     On timeout, raises OperationError so the experiment worker stops.
-    If `tc` is None, prints a warning and returns.
+    If `tc` is None, prints a warning and returns. Waits in `tc.clock` time
+    if the controller has one (simulation dry runs).
     """
     if tc is None:
         print("No temperature controller found. Skipping temperature control sequence.")
@@ -19,15 +20,17 @@ def set_temperature(tc, target):
     for channel in range(1, tc.channels + 1):
         tc.set_target_temperature(channel, target)
 
-    start_time = time()
+    clock = getattr(tc, 'clock', None)
+    now, wait = (time, sleep) if clock is None else (clock.time, clock.sleep)
+    start_time = now()
     while True:
-        sleep(1)
+        wait(1)
         if tc.is_aborted:
             return
         actuals = [tc.get_actual_temperature(c) for c in range(1, tc.channels + 1)]
         if all(abs(t - target) <= tc.tolerance_celsius for t in actuals):
             return
-        if time() - start_time > tc.stabilization_timeout_seconds:
+        if now() - start_time > tc.stabilization_timeout_seconds:
             raise OperationError(
                 f"Temperature failed to stabilize within "
                 f"{tc.stabilization_timeout_seconds}s "
@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+import csv
 import re
 from typing import Annotated, Literal, Optional, Union, get_args
 
@@ -145,13 +146,21 @@ def _load_yaml(path: str) -> list[dict]:
     return [seq.model_dump() for seq in validated]
 
 
+def _csv_number(row: dict, column: str) -> float | None:
+    """Numeric value of a CSV cell, or None if the column is missing or the cell is empty."""
+    value = row.get(column)
+    if value is None or value.strip().lower() in ("", "nan"):
+        return None
+    return float(value)
+
+
 def _load_csv(path: str) -> list[dict]:
     """Load sequences from a legacy CSV file, map to typed dicts, validate, and return."""
-    import pandas as pd
-    df = pd.read_csv(path)
+    with open(path, "r", newline="") as f:
+        rows = list(csv.DictReader(f))
     sequences = []
-    for _, row in df.iterrows():
-        seq_name = row["sequence_name"]
+    for row in rows:
+        seq_name = row["sequence_name"].strip()
 
         # Handle "Set Temperature XX" pattern
         temp_match = re.match(r"^Set Temperature\s+([\d.]+)$", seq_name)
@@ -169,32 +178,29 @@ def _load_csv(path: str) -> list[dict]:
                 )
             seq_dict = {
                 "type": seq_type,
-                "fluidic_port": int(row["fluidic_port"]),
-                "flow_rate": int(row["flow_rate"]),
-                "volume": int(row["volume"]),
+                "fluidic_port": int(_csv_number(row, "fluidic_port")),
+                "flow_rate": int(_csv_number(row, "flow_rate")),
+                "volume": int(_csv_number(row, "volume")),
             }
             # Only add fill_tubing_with if the target model supports it
             model = SEQUENCE_TYPES[seq_type]
             if "fill_tubing_with" in model.model_fields:
-                raw_val = row.get("fill_tubing_with")
-                if pd.notna(raw_val) and int(raw_val) != 0:
+                raw_val = _csv_number(row, "fill_tubing_with")
+                if raw_val is not None and int(raw_val) != 0:
                     seq_dict["fill_tubing_with"] = int(raw_val)
 
         # Common fields
-        if "incubation_time" in row and pd.notna(row["incubation_time"]):
-            val = float(row["incubation_time"])
-            if val != 0:
-                seq_dict["incubation_time"] = val
-
-        if "repeat" in row and pd.notna(row["repeat"]):
-            val = int(row["repeat"])
-            if val != 1:
-                seq_dict["repeat"] = val
-
-        if "include" in row and pd.notna(row["include"]):
-            val = bool(int(row["include"]))
-            if not val:
-                seq_dict["include"] = val
+        val = _csv_number(row, "incubation_time")
+        if val is not None and val != 0:
+            seq_dict["incubation_time"] = val
+
+        val = _csv_number(row, "repeat")
+        if val is not None and int(val) != 1:
+            seq_dict["repeat"] = int(val)
+
+        val = _csv_number(row, "include")
+        if val is not None and not bool(int(val)):
+            seq_dict["include"] = False
 
         sequences.append(seq_dict)
 
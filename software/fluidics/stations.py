@@ -0,0 +1,294 @@
+"""Run several fluidics stations from one process.
+
+A `Station` is one instrument: its FluidicsConfig, the sequences to run on it
+and its own devices (MCU, syringe pump, selector valves, disc pump,
+temperature controller). `StationManager` enumerates the serial ports once
+into the shared device registry, opens all stations' devices concurrently
+from that scan, then runs one ExperimentWorker per station on its own thread.
+Stations share no device objects, so a slow or failing instrument only stalls
+its own thread. Progress, errors and the finish of each station are reported
+through the `fluidics.stations.<name>` logger and the manager's callbacks, all
+tagged with the station name.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .control._def import CMD_SET
+from .control.controller import FluidController, FluidControllerSimulation
+from .control.device_registry import registry
+from .control.disc_pump import DiscPump
+from .control.selector_valve import SelectorValveSystem
+from .control.syringe_pump import SyringePump, SyringePumpSimulation
+from .control.tecancavro import TecanAPISerial
+from .control.temperature_controller import TCMController, TCMControllerSimulation
+from .experiment_worker import ExperimentWorker
+
+
+def _find_port(serial_number, device):
+    port = registry.find_device(serial_number)
+    if port is None:
+        raise ValueError(f"No {device} found with serial number: {serial_number}")
+    return port
+
+
+class Station:
+    """One instrument and the experiment to run on it."""
+
+    def __init__(self, name: str, config, sequences: list[dict], simulation: bool = False,
+                 overlap_valve_moves: bool = False, prefetch: bool = False, use_reader_thread: bool = False):
+        """
+        Args:
+            name: unique station name, used in logs and callbacks
+            config: FluidicsConfig of the instrument
+            sequences: sequences to run, in order (typically get_included_sequences output)
+            simulation: use simulated devices instead of hardware
+            overlap_valve_moves: passed to the operations class
+            prefetch: passed to ExperimentWorker
+            use_reader_thread: passed to FluidController; lets the valves skip moves confirmed by live telemetry
+        """
+        self.name = name
+        self.config = config
+        self.sequences = sequences
+        self.simulation = simulation
+        self.overlap_valve_moves = overlap_valve_moves
+        self.prefetch = prefetch
+        self.use_reader_thread = use_reader_thread
+        self.log = logging.getLogger(f"fluidics.stations.{name}")
+
+        self.controller = None
+        self.syringe_pump = None
+        self.selector_valves = None
+        self.disc_pump = None
+        self.temperature_controller = None
+        self.experiment_ops = None
+        self.worker = None
+        self.thread = None
+
+        # 'created' -> 'ready' -> 'running' -> 'finished' / 'failed' / 'aborted'
+        self.state = 'created'
+        self.progress = None            # (index, sequence_num, status) of the latest update
+        self.time_to_finish = None
+        self.n_sequences = None
+        self.errors = []
+
+    def initialize(self):
+        """Open and reset the station's devices."""
+        config = self.config
+        sp_cfg = config.syringe_pump
+        tc_cfg = config.temperature_controller
+        if self.simulation:
+            self.controller = FluidControllerSimulation(config.microcontroller.serial_number)
+            self.syringe_pump = SyringePumpSimulation(sp_cfg.serial_number, sp_cfg.volume_ul,
+                                                      sp_cfg.speed_code_limit, sp_cfg.waste_port)
+            if tc_cfg is not None:
+                self.temperature_controller = TCMControllerSimulation(
+                    sn=tc_cfg.serial_number,
+                    channels=tc_cfg.channels,
+                    tolerance_celsius=tc_cfg.tolerance_celsius,
+                    stabilization_timeout_seconds=tc_cfg.stabilization_timeout_seconds)
+        else:
+            self.controller = FluidController(
+                config.microcontroller.serial_number,
+                port=_find_port(config.microcontroller.serial_number, "microcontroller"),
+                use_reader_thread=self.use_reader_thread)
+            link = TecanAPISerial(tecan_addr=0, ser_port=_find_port(sp_cfg.serial_number, "syringe pump"),
+                                  ser_baud=9600)
+            self.syringe_pump = SyringePump(sp_cfg.serial_number, sp_cfg.volume_ul, sp_cfg.speed_code_limit,
+                                            sp_cfg.waste_port, com_link=link)
+            if tc_cfg is not None:
+                self.temperature_controller = TCMController(
+                    sn=tc_cfg.serial_number,
+                    channels=tc_cfg.channels,
+                    tolerance_celsius=tc_cfg.tolerance_celsius,
+                    stabilization_timeout_seconds=tc_cfg.stabilization_timeout_seconds,
+                    port=_find_port(tc_cfg.serial_number, "temperature controller"))
+
+        self.controller.begin()
+        # The system of a previous initialization stops listening; its cached positions cannot be trusted after the CLEAR
+        if self.selector_valves is not None:
+            self.selector_valves.close()
+        self.controller.send_command(CMD_SET.CLEAR)
+        # The valve and pump set-up below must not reach the MCU before the CLEAR has completed
+        self.controller.wait_for_completion()
+        self.selector_valves = SelectorValveSystem(self.controller, config)
+
+        # Imported here: the operations modules import the experiment worker's siblings
+        from .merfish_operations import MERFISHOperations
+        from .open_chamber_operations import OpenChamberOperations
+        if config.application == "Flow Cell":
+            self.experiment_ops = MERFISHOperations(config, self.syringe_pump, self.selector_valves,
+                                                    self.temperature_controller,
+                                                    overlap_valve_moves=self.overlap_valve_moves)
+        elif config.application == "Open Chamber":
+            self.disc_pump = DiscPump(self.controller)
+            self.experiment_ops = OpenChamberOperations(config, self.syringe_pump, self.selector_valves,
+                                                        self.disc_pump, self.temperature_controller,
+                                                        overlap_valve_moves=self.overlap_valve_moves)
+        else:
+            raise ValueError(f"Unsupported application: {config.application!r}")
+        self.state = 'ready'
+        self.log.info("Initialized")
+
+    def start(self, callbacks: dict | None = None):
+        """
+        Start the experiment on a thread of its own.
+        Args:
+            callbacks: ExperimentWorker callbacks; each is called with the station name first
+        """
+        if self.state != 'ready':
+            raise RuntimeError(f"Station {self.name} cannot start from state {self.state!r}")
+        callbacks = callbacks or {}
+
+        def relay(name, handler):
+            def call(*args):
+                handler(*args)
+                if callbacks.get(name):
+                    callbacks[name](self.name, *args)
+            return call
+
+        self.errors = []
+        self.worker = ExperimentWorker(self.experiment_ops, self.sequences, self.config, {
+            'update_progress': relay('update_progress', self._on_progress),
+            'on_error': relay('on_error', self._on_error),
+            'on_finished': relay('on_finished', self._on_finished),
+            'on_estimate': relay('on_estimate', self._on_estimate),
+        }, prefetch=self.prefetch)
+        self.state = 'running'
+        self.thread = threading.Thread(target=self.worker.run, name=f"Station-{self.name}")
+        self.thread.start()
+
+    def _on_progress(self, index, sequence_num, status):
+        self.progress = (index, sequence_num, status)
+        self.log.info("Sequence %d (%d): %s", index, sequence_num, status)
+
+    def _on_error(self, message):
+        self.errors.append(message)
+        self.log.error(message)
+
+    def _on_finished(self):
+        if self.state == 'running':
+            self.state = 'failed' if self.errors else 'finished'
+        self.log.info("Experiment %s", self.state)
+
+    def _on_estimate(self, time_to_finish, n_sequences):
+        self.time_to_finish = time_to_finish
+        self.n_sequences = n_sequences
+        self.log.info("Estimated time: %.0fs, Sequences: %d", time_to_finish, n_sequences)
+
+    def abort(self):
+        '''Stop the station's experiment; the other stations are not affected'''
+        if self.state == 'running':
+            self.state = 'aborted'
+        if self.worker is not None:
+            self.worker.abort()
+        for device in (self.syringe_pump, self.disc_pump, self.temperature_controller):
+            if device is not None:
+                device.abort()
+        if self.selector_valves is not None:
+            self.selector_valves.invalidate_positions()
+        self.log.warning("Abort requested")
+
+    def join(self, timeout: float | None = None) -> bool:
+        '''Wait for the experiment thread; returns True once it has ended (or was never started)'''
+        if self.thread is None:
+            return True
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+    def status(self) -> dict:
+        """Snapshot of the station's state, latest progress, estimate and errors."""
+        return {
+            'state': self.state,
+            'progress': self.progress,
+            'time_to_finish': self.time_to_finish,
+            'n_sequences': self.n_sequences,
+            'errors': list(self.errors),
+        }
+
+    def close(self):
+        if self.selector_valves is not None:
+            self.selector_valves.close()
+        if self.syringe_pump is not None:
+            self.syringe_pump.reset_abort()
+            self.syringe_pump.close()
+        if self.temperature_controller is not None:
+            self.temperature_controller.close()
+
+
+class StationManager:
+    """Initializes and runs a set of Stations concurrently."""
+
+    def __init__(self, callbacks: dict | None = None):
+        """
+        Args:
+            callbacks: ExperimentWorker callbacks shared by all stations, each called as
+                fn(station_name, *args) (e.g. update_progress(name, index, sequence_num, status))
+        """
+        self.stations = {}
+        self.callbacks = callbacks or {}
+
+    def add_station(self, name: str, config, sequences: list[dict], **kwargs) -> Station:
+        """Register a station; kwargs are passed to Station."""
+        if name in self.stations:
+            raise ValueError(f"Duplicate station name: {name}")
+        station = Station(name, config, sequences, **kwargs)
+        self.stations[name] = station
+        return station
+
+    def __getitem__(self, name):
+        return self.stations[name]
+
+    def initialize(self) -> dict:
+        """
+        Initialize all stations in parallel from one fresh port enumeration.
+        Returns:
+            dict: station name -> exception, for the stations that failed (empty if all are ready)
+        """
+        stations = list(self.stations.values())
+        if not stations:
+            return {}
+        if not all(s.simulation for s in stations):
+            registry.ports(refresh=True)
+        errors = {}
+        with ThreadPoolExecutor(max_workers=len(stations), thread_name_prefix="StationInit") as pool:
+            futures = {s.name: pool.submit(s.initialize) for s in stations}
+            for name, future in futures.items():
+                e = future.exception()
+                if e is not None:
+                    self.stations[name].state = 'failed'
+                    self.stations[name].errors.append(f"Initialization failed: {e}")
+                    self.stations[name].log.error("Initialization failed: %s", e)
+                    errors[name] = e
+        return errors
+
+    def start(self, names=None):
+        """Start the experiments of the named stations (default: every initialized station)."""
+        if names is None:
+            names = [name for name, s in self.stations.items() if s.state == 'ready']
+        for name in names:
+            self.stations[name].start(self.callbacks)
+
+    def abort(self, name: str | None = None):
+        """Abort one station, or all of them if name is None."""
+        targets = self.stations.values() if name is None else [self.stations[name]]
+        for station in targets:
+            station.abort()
+
+    def join(self, timeout: float | None = None) -> bool:
+        """Wait for all running stations; returns True once all have ended."""
+        done = True
+        for station in self.stations.values():
+            done = station.join(timeout) and done
+        return done
+
+    def status(self) -> dict:
+        """Station name -> Station.status()."""
+        return {name: station.status() for name, station in self.stations.items()}
+
+    def close(self):
+        for station in self.stations.values():
+            station.close()
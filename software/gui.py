@@ -537,6 +537,7 @@ class SequencesWidget(QWidget):
                 self.discPump.abort()
             if self.temperatureController is not None:
                 self.temperatureController.abort()
+            # Also forgets the cached valve positions
             self.worker.abort()
             self.abortButton.setEnabled(False)
 
@@ -1015,10 +1016,12 @@ class TemperatureControlWidget(QWidget):
 
 
 class FluidicsControlGUI(QMainWindow):
-    def __init__(self, is_simulation):
+    def __init__(self, is_simulation, use_reader_thread=False):
         super().__init__()
         self.config = load_config_file()
         self.simulation = is_simulation
+        # Decode MCU status on a background thread, so valve moves confirmed by live telemetry are skipped
+        self.use_reader_thread = use_reader_thread
         self.temperatureController = None
 
         self.initialize_hardware(self.simulation, self.config)
@@ -1069,7 +1072,8 @@ class FluidicsControlGUI(QMainWindow):
                     stabilization_timeout_seconds=tc_cfg.stabilization_timeout_seconds,
                 )
         else:
-            self.controller = FluidController(config.microcontroller.serial_number)
+            self.controller = FluidController(config.microcontroller.serial_number,
+                                              use_reader_thread=self.use_reader_thread)
             self.syringePump = SyringePump(
                                 sn=config.syringe_pump.serial_number,
                                 syringe_ul=config.syringe_pump.volume_ul,
@@ -1104,6 +1108,7 @@ class FluidicsControlGUI(QMainWindow):
         self.tabWidget.setTabEnabled(manual_control_tab_index, not is_running)
 
     def closeEvent(self, event):
+        self.selectorValveSystem.close()
         if self.temperatureController is not None:
             self.temperatureController.close()
 
@@ -1117,9 +1122,11 @@ class FluidicsControlGUI(QMainWindow):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("--simulation", help="Run the GUI with simulated hardware.", action='store_true')
+    parser.add_argument("--reader-thread", action='store_true',
+                        help="Decode MCU status packets on a background thread, so valve moves confirmed by live telemetry are skipped.")
     args = parser.parse_args()
 
     app = QApplication(sys.argv)
-    gui = FluidicsControlGUI(args.simulation)
+    gui = FluidicsControlGUI(args.simulation, args.reader_thread)
     gui.show()
     sys.exit(app.exec_())
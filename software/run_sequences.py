@@ -3,15 +3,8 @@ import sys
 import threading
 from fluidics.sequences import load_sequences, get_included_sequences
 from fluidics.control.config import load_config
-from fluidics.control.controller import FluidControllerSimulation, FluidController
-from fluidics.control.syringe_pump import SyringePumpSimulation, SyringePump
-from fluidics.control.selector_valve import SelectorValveSystem
-from fluidics.control.disc_pump import DiscPump
-from fluidics.control.temperature_controller import TCMControllerSimulation, TCMController
-from fluidics.merfish_operations import MERFISHOperations
-from fluidics.open_chamber_operations import OpenChamberOperations
-from fluidics.experiment_worker import ExperimentWorker
-from fluidics.control._def import CMD_SET
+# Device, operations and planning modules are imported where they are used, so that
+# --help, --plan and --dry-run do not pay for the hardware stack (see tests/unit/test_import_time.py)
 
 
 def parse_args():
@@ -32,12 +25,59 @@ def parse_args():
         default=False,
         help='Run in simulation mode without operating hardware'
     )
-    return parser.parse_args()
-
-def initialize_hardware(simulation, config):
+    parser.add_argument(
+        '--prefetch',
+        action='store_true',
+        default=False,
+        help='Empty the syringe and route the valves for the next sequence during incubations (flow cell)'
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        default=False,
+        help='Simulate the whole run in virtual time and print its timeline and volumes'
+    )
+    parser.add_argument(
+        '--overlap-valve-moves',
+        action='store_true',
+        default=False,
+        help='Move the selector valves while the syringe pump dispenses to waste'
+    )
+    parser.add_argument(
+        '--plan',
+        action='store_true',
+        default=False,
+        help='Print the compiled device command plan and exit'
+    )
+    parser.add_argument(
+        '--compiled',
+        action='store_true',
+        default=False,
+        help='Compile the sequences before starting and run the compiled plan'
+    )
+    parser.add_argument(
+        '--reader-thread',
+        action='store_true',
+        default=False,
+        help='Decode MCU status packets on a background thread, so valve moves confirmed by live telemetry are skipped'
+    )
+    args = parser.parse_args()
+    # Compiled plans replay the sequential device commands; prefetching and overlapped valve moves are not compiled
+    if args.plan or args.compiled:
+        mode = '--plan' if args.plan else '--compiled'
+        for flag, value in (('--prefetch', args.prefetch), ('--overlap-valve-moves', args.overlap_valve_moves)):
+            if value:
+                parser.error(f"{flag} is not supported with {mode}")
+    return args
+
+def initialize_hardware(simulation, config, use_reader_thread=False):
+    from fluidics.control._def import CMD_SET
     temperatureController = None
 
     if simulation:
+        from fluidics.control.controller import FluidControllerSimulation
+        from fluidics.control.syringe_pump import SyringePumpSimulation
+        from fluidics.control.temperature_controller import TCMControllerSimulation
         controller = FluidControllerSimulation(config.microcontroller.serial_number)
         syringePump = SyringePumpSimulation(
             sn=config.syringe_pump.serial_number,
@@ -53,7 +93,10 @@ def initialize_hardware(simulation, config):
                 stabilization_timeout_seconds=tc_cfg.stabilization_timeout_seconds,
             )
     else:
-        controller = FluidController(config.microcontroller.serial_number)
+        from fluidics.control.controller import FluidController
+        from fluidics.control.syringe_pump import SyringePump
+        from fluidics.control.temperature_controller import TCMController
+        controller = FluidController(config.microcontroller.serial_number, use_reader_thread=use_reader_thread)
         syringePump = SyringePump(
             sn=config.syringe_pump.serial_number,
             syringe_ul=config.syringe_pump.volume_ul,
@@ -73,6 +116,15 @@ def initialize_hardware(simulation, config):
 
     return controller, syringePump, temperatureController
 
+# Flow rates the syringe pump misses by more than this fraction are reported before the run
+FLOW_RATE_ERROR_WARN = 0.05
+
+def report_flow_rates(syringePump, sequences):
+    for seq, match in zip(sequences, syringePump.match_sequence_flow_rates(sequences)):
+        if match is not None and abs(match.error) > FLOW_RATE_ERROR_WARN:
+            print(f"Warning: {seq.get('name') or seq['type']} flow rate {seq['flow_rate']} ul/min runs at "
+                  f"{match.flow_rate:.0f} ul/min (speed code {match.speed_code}, {match.error:+.1%})")
+
 def update_progress(index, sequence_num, status):
     print(f"Sequence {index} ({sequence_num}): {status}")
 
@@ -89,6 +141,7 @@ def main():
     args = parse_args()
 
     syringePump = None
+    selectorValveSystem = None
     temperatureController = None
     thread = None
 
@@ -99,17 +152,50 @@ def main():
         # Load config
         config = load_config(args.config)
 
-        controller, syringePump, temperatureController = initialize_hardware(args.simulation, config)
+        if args.dry_run:
+            from fluidics.dry_run import dry_run
+            result = dry_run(included, config, overlap_valve_moves=args.overlap_valve_moves, prefetch=args.prefetch)
+            print("\n".join(result.describe()))
+            if result.errors:
+                sys.exit(1)
+            return
+
+        if args.plan:
+            from fluidics.sequence_compiler import compile_sequences
+            plan = compile_sequences(included, config)
+            print("\n".join(plan.describe()))
+            print(f"Estimated time: {plan.duration_s:.0f}s")
+            return
+
+        controller, syringePump, temperatureController = initialize_hardware(args.simulation, config, args.reader_thread)
+        if args.compiled:
+            from fluidics.sequence_compiler import compile_sequences, PlanExecutor
+            # Compiled from what the syringe holds now, so the plan's volume checks and dumps to waste
+            # match the pump; fails here, before any liquid is moved, if a sequence cannot run
+            plan = compile_sequences(included, config, initial_volume_ul=syringePump.get_current_volume())
+        report_flow_rates(syringePump, included)
+
+        from fluidics.control.selector_valve import SelectorValveSystem
+        from fluidics.control.disc_pump import DiscPump
+        from fluidics.merfish_operations import MERFISHOperations
+        from fluidics.open_chamber_operations import OpenChamberOperations
+        from fluidics.experiment_worker import ExperimentWorker
 
         selectorValveSystem = SelectorValveSystem(controller, config)
         if config.application == "Open Chamber":
             discPump = DiscPump(controller)
 
         # Run experiment
-        if config.application == "Flow Cell":
-            experiment_ops = MERFISHOperations(config, syringePump, selectorValveSystem, temperatureController)
+        if args.compiled:
+            experiment_ops = PlanExecutor(plan, syringePump, selectorValveSystem,
+                                          discPump if config.application == "Open Chamber" else None,
+                                          temperatureController)
+        elif config.application == "Flow Cell":
+            experiment_ops = MERFISHOperations(config, syringePump, selectorValveSystem, temperatureController,
+                                              overlap_valve_moves=args.overlap_valve_moves)
         elif config.application == "Open Chamber":
-            experiment_ops = OpenChamberOperations(config, syringePump, selectorValveSystem, discPump, temperatureController)
+            experiment_ops = OpenChamberOperations(config, syringePump, selectorValveSystem, discPump, temperatureController,
+                                                  overlap_valve_moves=args.overlap_valve_moves)
         else:
             raise ValueError(f"Unsupported application: {config.application!r}")
 
@@ -120,7 +206,7 @@ def main():
             'on_estimate': on_estimate
         }
 
-        worker = ExperimentWorker(experiment_ops, included, config, callbacks)
+        worker = ExperimentWorker(experiment_ops, included, config, callbacks, prefetch=args.prefetch)
         thread = threading.Thread(target=worker.run)
         thread.start()
 
@@ -132,6 +218,8 @@ def main():
             thread.join()
         sys.exit(1)
     finally:
+        if selectorValveSystem is not None:
+            selectorValveSystem.close()
         if syringePump is not None:
             syringePump.reset_abort()
             syringePump.close()
@@ -0,0 +1,83 @@
+import argparse
+import logging
+import sys
+from fluidics.sequences import load_sequences, get_included_sequences
+from fluidics.control.config import load_config
+from fluidics.stations import StationManager
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Run sequences on several fluidics stations at once'
+    )
+    parser.add_argument(
+        '--station', nargs=3, action='append', required=True,
+        metavar=('NAME', 'CONFIG', 'SEQUENCES'),
+        help='Station name, configuration file and sequence file; repeat for each station'
+    )
+    parser.add_argument(
+        '--simulation',
+        action='store_true',
+        default=False,
+        help='Run in simulation mode without operating hardware'
+    )
+    parser.add_argument(
+        '--prefetch',
+        action='store_true',
+        default=False,
+        help='Empty the syringe and route the valves for the next sequence during incubations (flow cell)'
+    )
+    parser.add_argument(
+        '--overlap-valve-moves',
+        action='store_true',
+        default=False,
+        help='Move the selector valves while the syringe pump dispenses to waste'
+    )
+    parser.add_argument(
+        '--reader-thread',
+        action='store_true',
+        default=False,
+        help='Decode MCU status packets on a background thread, so valve moves confirmed by live telemetry are skipped'
+    )
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(name)s] %(message)s')
+
+    manager = StationManager()
+    try:
+        for name, config_path, sequence_path in args.station:
+            manager.add_station(name, load_config(config_path),
+                                get_included_sequences(load_sequences(sequence_path)),
+                                simulation=args.simulation, prefetch=args.prefetch,
+                                overlap_valve_moves=args.overlap_valve_moves,
+                                use_reader_thread=args.reader_thread)
+
+        errors = manager.initialize()
+        for name, e in errors.items():
+            print(f"Station {name} not started: {e}", file=sys.stderr)
+
+        manager.start()
+        try:
+            while not manager.join(timeout=1):
+                pass
+        except KeyboardInterrupt:
+            manager.abort()
+            manager.join()
+
+        failed = [name for name, s in manager.status().items() if s['state'] != 'finished']
+        if failed:
+            print(f"Stations not completed: {', '.join(failed)}", file=sys.stderr)
+            sys.exit(1)
+
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        manager.abort()
+        manager.join()
+        sys.exit(1)
+    finally:
+        manager.close()
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,6 @@
 # tests/integration/test_merfish_operations.py
+import time
+
 import pytest
 
 from fluidics.merfish_operations import MERFISHOperations
@@ -49,3 +51,73 @@ class TestSetTemperature:
         ops = MERFISHOperations(config, sp, sv)
         seq = {"type": "set_temperature", "temperature": 37}
         ops.process_sequence(seq)  # should not raise
+
+
+class TestOverlapValveMoves:
+    @pytest.fixture
+    def calls(self, flow_cell_hardware, monkeypatch):
+        _config, sp, sv = flow_cell_hardware
+        calls = []
+        for obj, name in [(sp, "execute"), (sp, "start_execute"), (sp, "finish_execute"), (sv, "open_port")]:
+            def record(*args, _name=name, _fn=getattr(obj, name)):
+                calls.append((_name,) + args)
+                return _fn(*args)
+            monkeypatch.setattr(obj, name, record)
+        return calls
+
+    # The simulated syringe is half full, so 3000 ul more has to go to waste first
+    SEQ = {"type": "flow_reagent", "fluidic_port": 2, "flow_rate": 5000, "volume": 3000}
+
+    def test_valves_move_during_dispense_to_waste(self, flow_cell_hardware, calls):
+        config, sp, sv = flow_cell_hardware
+        MERFISHOperations(config, sp, sv, overlap_valve_moves=True).process_sequence(self.SEQ)
+        assert [c[0] for c in calls[:3]] == ["start_execute", "open_port", "finish_execute"]
+        assert calls[1] == ("open_port", 2)
+
+    def test_sequential_by_default(self, flow_cell_hardware, calls):
+        config, sp, sv = flow_cell_hardware
+        MERFISHOperations(config, sp, sv).process_sequence(self.SEQ)
+        assert calls[:2] == [("execute",), ("open_port", 2)]
+
+    def test_overlap_saves_valve_time(self, flow_cell_hardware):
+        config, sp, sv = flow_cell_hardware
+        durations = []
+        for overlap in (False, True):
+            sv.invalidate_positions()
+            sv.open_port(1)
+            start = time.time()
+            MERFISHOperations(config, sp, sv, overlap_valve_moves=overlap).process_sequence(self.SEQ)
+            durations.append(time.time() - start)
+        assert durations[1] < durations[0]
+
+
+class TestPrepareSequence:
+    @pytest.fixture
+    def calls(self, flow_cell_hardware, monkeypatch):
+        _config, sp, sv = flow_cell_hardware
+        calls = []
+        for obj, name in [(sp, "extract"), (sp, "dispense"), (sp, "dispense_to_waste"), (sv, "open_port")]:
+            def record(*args, _name=name, _fn=getattr(obj, name)):
+                calls.append((_name,) + args)
+                return _fn(*args)
+            monkeypatch.setattr(obj, name, record)
+        return calls
+
+    def test_flow_reagent_routes_and_empties(self, flow_cell_hardware, calls):
+        config, sp, sv = flow_cell_hardware
+        ops = MERFISHOperations(config, sp, sv)
+        # The simulated syringe is half full, so 3000 ul does not fit
+        ops.prepare_sequence({"type": "flow_reagent", "fluidic_port": 7, "flow_rate": 5000, "volume": 3000})
+        assert calls == [("dispense_to_waste", None), ("open_port", 7)]
+
+    def test_priming_routes_to_first_port(self, flow_cell_hardware, calls):
+        config, sp, sv = flow_cell_hardware
+        ops = MERFISHOperations(config, sp, sv)
+        ops.prepare_sequence({"type": "priming", "fluidic_port": 10, "flow_rate": 5000, "volume": 2000,
+                              "use_ports": [4, 5]})
+        assert calls == [("dispense_to_waste", None), ("open_port", 4)]
+
+    def test_other_types_do_nothing(self, flow_cell_hardware, calls):
+        config, sp, sv = flow_cell_hardware
+        MERFISHOperations(config, sp, sv).prepare_sequence({"type": "set_temperature", "temperature": 37})
+        assert calls == []
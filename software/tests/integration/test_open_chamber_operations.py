@@ -51,3 +51,18 @@ class TestProcessSequence:
         seq = {"type": "nonexistent"}
         with pytest.raises(ValueError, match="Unknown sequence type"):
             oc_ops.process_sequence(seq)
+
+
+class TestOverlapValveMoves:
+    @pytest.mark.parametrize("seq_type", ["add_reagent", "clear_and_add_reagent", "wash_constant_flow"])
+    def test_valves_move_during_dispense_to_waste(self, open_chamber_hardware, monkeypatch, seq_type):
+        config, sp, sv, dp, tc = open_chamber_hardware
+        calls = []
+        for obj, name in [(sp, "execute"), (sp, "start_execute"), (sp, "finish_execute"), (sv, "open_port")]:
+            def record(*args, _name=name, _fn=getattr(obj, name)):
+                calls.append(_name)
+                return _fn(*args)
+            monkeypatch.setattr(obj, name, record)
+        ops = OpenChamberOperations(config, sp, sv, dp, tc, overlap_valve_moves=True)
+        ops.process_sequence({"type": seq_type, "fluidic_port": 3, "flow_rate": 1000, "volume": 1000})
+        assert calls[:3] == ["start_execute", "open_port", "finish_execute"]
@@ -0,0 +1,241 @@
+# tests/unit/control/test_aio.py
+import asyncio
+import os
+import threading
+import tty
+
+import pytest
+
+from fluidics.control._def import CMD_SET, COMMAND_STATUS
+from fluidics.control.aio import (
+    AsyncFluidController,
+    EventLoopThread,
+    FluidControllerBridge,
+    TecanAPIBridge,
+)
+from fluidics.control.mcu_emulator import MCUEmulator
+from fluidics.control.tecancavro import Syringe, SyringeTimeout, TecanAPITimeout
+from fluidics.control.tecancavro.aio_transport import TecanAPIAsyncSerial, waitReadyAsync
+
+# The autouse _fast_clock fixture replaces Event.wait, which Thread.start relies on
+_REAL_EVENT_WAIT = threading.Event.wait
+
+
+def _reply(data=b"", status=0x60, addr=0x30):
+    frame = bytes([0x02, addr, status]) + data + bytes([0x03])
+    checksum = 0
+    for b in frame:
+        checksum ^= b
+    return frame + bytes([checksum])
+
+
+class PtyTecan:
+    """Answers Tecan frames written to a pty from inside the test's event loop."""
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.master, slave = os.openpty()
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        self._slave = slave
+        self.buffer = bytearray()
+        self.frames = []
+
+    def attach(self):
+        asyncio.get_running_loop().add_reader(self.master, self._on_readable)
+
+    def _on_readable(self):
+        self.buffer += os.read(self.master, 1024)
+        while True:
+            etx = self.buffer.find(b"\x03")
+            if etx < 0 or len(self.buffer) < etx + 2:
+                return
+            frame = bytes(self.buffer[:etx + 2])
+            del self.buffer[:etx + 2]
+            self.frames.append(frame)
+            reply = self.respond(frame)
+            if reply:
+                os.write(self.master, reply)
+
+    def close(self):
+        asyncio.get_running_loop().remove_reader(self.master)
+        os.close(self.master)
+        os.close(self._slave)
+
+
+def _command(frame):
+    return frame[3:frame.index(b"\x03")]
+
+
+class TestTecanAPIAsyncSerial:
+    def test_send_rcv(self):
+        async def main():
+            pump = PtyTecan(lambda frame: _reply(b"3000" if _command(frame) == b"?" else b""))
+            pump.attach()
+            link = TecanAPIAsyncSerial(0, pump.port, 9600)
+            try:
+                return await link.sendRcv("?"), pump.frames
+            finally:
+                link.close()
+                pump.close()
+
+        response, frames = asyncio.run(main())
+        assert response == {"status_byte": "01100000", "data": b"3000"}
+        assert _command(frames[0]) == b"?"
+
+    def test_daisy_chained_devices_share_port(self):
+        async def main():
+            pump = PtyTecan(lambda frame: _reply(bytes([frame[1]])))
+            pump.attach()
+            links = [TecanAPIAsyncSerial(addr, pump.port, 9600) for addr in range(3)]
+            try:
+                assert len({id(link._port) for link in links}) == 1
+                return await asyncio.gather(*(link.sendRcv("Q") for link in links))
+            finally:
+                for link in links:
+                    link.close()
+                pump.close()
+
+        responses = asyncio.run(main())
+        assert [r["data"] for r in responses] == [b"1", b"2", b"3"]
+        assert not TecanAPIAsyncSerial.port_mapping
+
+    def test_no_reply_times_out(self):
+        async def main():
+            pump = PtyTecan(lambda frame: None)
+            pump.attach()
+            link = TecanAPIAsyncSerial(0, pump.port, 9600, ser_timeout=0.01, max_attempts=2)
+            try:
+                with pytest.raises(TecanAPITimeout):
+                    await link.sendRcv("Q")
+                return pump.frames
+            finally:
+                link.close()
+                pump.close()
+
+        frames = asyncio.run(main())
+        # The second attempt is a repeat frame (repeat bit set in the sequence byte)
+        assert len(frames) == 2
+        assert frames[1][2] & 0x08
+
+    def test_wait_ready(self):
+        replies = [0x40, 0x40, 0x60]
+
+        async def main():
+            pump = PtyTecan(lambda frame: _reply(status=replies.pop(0)))
+            pump.attach()
+            link = TecanAPIAsyncSerial(0, pump.port, 9600)
+            try:
+                syringe = Syringe(None)
+                await waitReadyAsync(syringe, polling_interval=0.001, com_link=link)
+                return syringe, pump.frames
+            finally:
+                link.close()
+                pump.close()
+
+        syringe, frames = asyncio.run(main())
+        assert syringe._ready
+        assert len(frames) == 3
+
+    def test_wait_ready_timeout(self):
+        async def main():
+            pump = PtyTecan(lambda frame: _reply(status=0x40))
+            pump.attach()
+            link = TecanAPIAsyncSerial(0, pump.port, 9600)
+            try:
+                with pytest.raises(SyringeTimeout):
+                    await waitReadyAsync(Syringe(None), polling_interval=0.001, timeout=0.02, com_link=link)
+            finally:
+                link.close()
+                pump.close()
+
+        asyncio.run(main())
+
+
+@pytest.fixture
+def emulator(monkeypatch):
+    monkeypatch.setattr(threading.Event, "wait", _REAL_EVENT_WAIT)
+    emu = MCUEmulator(n_selector_valves=2, time_scale=20)
+    emu.start()
+    yield emu
+    emu.stop()
+
+
+class TestAsyncFluidController:
+    def test_rotary_valve_round_trip(self, emulator):
+        async def main():
+            fc = AsyncFluidController(port=emulator.port)
+            await fc.begin()
+            try:
+                await fc.send_command_blocking(CMD_SET.INITIALIZE_ROTARY, 0, 10, timeout=5)
+                status = await fc.send_command_blocking(CMD_SET.SET_ROTARY_VALVE, 0, 7, timeout=5)
+                return status, await fc.get_mcu_status(), fc.cmd_uid
+            finally:
+                await fc.close()
+
+        status, data, uid = asyncio.run(main())
+        assert status == COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS
+        assert data["selector_valves_pos"][0] == 7
+        assert data["MCU_received_command_UID"] == uid == 2
+
+    def test_status_stream(self, emulator):
+        async def main():
+            fc = AsyncFluidController(port=emulator.port)
+            await fc.begin()
+            try:
+                seen = []
+                async for status in fc.status_stream():
+                    seen.append(status)
+                    if len(seen) == 3:
+                        break
+                return seen, fc._subscribers
+            finally:
+                await fc.close()
+
+        seen, subscribers = asyncio.run(main())
+        assert len(seen) == 3
+        assert subscribers == []
+
+    def test_wait_timeout(self, emulator):
+        async def main():
+            fc = AsyncFluidController(port=emulator.port)
+            await fc.begin()
+            try:
+                with pytest.raises(TimeoutError):
+                    await fc.wait_for_completion(uid=99, timeout=0.05)
+            finally:
+                await fc.close()
+
+        asyncio.run(main())
+
+
+class TestBridges:
+    @pytest.fixture
+    def loop(self, emulator):
+        with EventLoopThread() as loop:
+            yield loop
+
+    def test_fluid_controller_bridge(self, emulator, loop):
+        fc = FluidControllerBridge(AsyncFluidController(port=emulator.port), loop)
+        fc.begin()
+        try:
+            fc.send_command(CMD_SET.DELAY_MS, 500)
+            assert fc.wait_for_completion(timeout=5) == COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS
+            assert fc.get_mcu_status()["MCU_received_command_UID"] == fc.cmd_uid
+        finally:
+            fc.close()
+
+    def test_tecan_bridge_drives_sync_syringe(self, loop):
+        async def open_pump():
+            pump = PtyTecan(lambda frame: _reply(b"1500"))
+            pump.attach()
+            return pump
+
+        pump = loop.run(open_pump())
+        link = TecanAPIBridge(TecanAPIAsyncSerial(0, pump.port, 9600), loop)
+        try:
+            data, ready = Syringe(link)._sendRcv("?")
+            assert (data, ready) == (b"1500", 1)
+        finally:
+            link.close()
+            loop.call(pump.close)
@@ -0,0 +1,187 @@
+# tests/unit/control/test_command_queue.py
+import threading
+
+import pytest
+from cobs import cobs
+
+from fluidics.control._def import CMD_SET, COMMAND_STATUS
+from fluidics.control.command_queue import MCUCommandQueue
+from fluidics.control.controller import FluidController
+from fluidics.control.mcu_emulator import MCUEmulator
+
+# The autouse _fast_clock fixture replaces Event.wait, which Thread.start relies on
+_REAL_EVENT_WAIT = threading.Event.wait
+
+
+def _status_packet(uid, status):
+    msg = bytearray(30)
+    msg[0], msg[1] = uid >> 8, uid & 0xFF
+    msg[3] = status
+    return bytes(msg)
+
+
+class RecordingSerial:
+    """Serial stand-in that never receives anything and records the UIDs written to it."""
+
+    def __init__(self):
+        self.uids = []
+
+    @property
+    def in_waiting(self):
+        return 0
+
+    def read(self, size=1):
+        return b""
+
+    def write(self, data):
+        for frame in bytes(data).split(b"\x00"):
+            if frame:
+                packet = cobs.decode(frame)
+                self.uids.append((packet[0] << 8) + packet[1])
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fc(monkeypatch):
+    monkeypatch.setattr(threading.Event, "wait", _REAL_EVENT_WAIT)
+    fc = FluidController("test")
+    fc.serial = RecordingSerial()
+    yield fc
+    fc.stop_reader()
+
+
+@pytest.fixture
+def queue(fc):
+    q = MCUCommandQueue(fc, ack_timeout=60)
+    q.start()
+    yield q
+    q.close()
+
+
+def _report(fc, uid, status):
+    fc._decode_and_publish(_status_packet(uid, status))
+
+
+class TestMCUCommandQueue:
+    def test_submit_does_not_wait(self, fc, queue):
+        futures = [queue.submit(CMD_SET.DELAY_MS, 10) for _ in range(3)]
+        assert fc.serial.uids == [1, 2, 3]
+        assert not any(f.done() for f in futures)
+        assert queue.pending_count() == 3
+
+    def test_resolves_by_uid(self, fc, queue):
+        first = queue.submit(CMD_SET.DELAY_MS, 10)
+        second = queue.submit(CMD_SET.DELAY_MS, 10)
+        _report(fc, 1, COMMAND_STATUS.IN_PROGRESS)
+        assert not first.done()
+        _report(fc, 1, COMMAND_STATUS.CMD_EXECUTION_ERROR)
+        assert first.result(0) == COMMAND_STATUS.CMD_EXECUTION_ERROR
+        assert not second.done()
+
+    def test_later_uid_supersedes_earlier_commands(self, fc, queue):
+        quick = queue.submit(CMD_SET.SET_ROTARY_VALVE, 0, 2)
+        interrupted = queue.submit(CMD_SET.DELAY_MS, 1000)
+        last = queue.submit(CMD_SET.DELAY_MS, 10)
+        _report(fc, 2, COMMAND_STATUS.IN_PROGRESS)
+        assert quick.result(0) == COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS
+        _report(fc, 3, COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+        assert interrupted.result(0) == COMMAND_STATUS.IN_PROGRESS
+        assert last.result(0) == COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS
+        assert queue.pending_count() == 0
+
+    def test_stale_packets_are_ignored(self, fc, queue):
+        future = queue.submit(CMD_SET.DELAY_MS, 10)
+        _report(fc, 0, COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+        assert not future.done()
+        assert fc.serial.uids == [1]
+
+    def test_retry_when_not_acknowledged(self, fc):
+        q = MCUCommandQueue(fc, ack_timeout=0, max_retries=1)
+        q.start()
+        future = q.submit(CMD_SET.DELAY_MS, 10)
+        _report(fc, 0, COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+        assert fc.serial.uids == [1, 2]
+        _report(fc, 2, COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+        assert future.result(0) == COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS
+        q.close()
+
+    def test_retry_on_unknown_uid(self, fc, queue):
+        future = queue.submit(CMD_SET.DELAY_MS, 10)
+        # The MCU restarted and reports a UID the queue never sent
+        _report(fc, 77, COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+        assert fc.serial.uids == [1, 2]
+        assert not future.done()
+
+    def test_repeated_unknown_uid_resends_once(self, fc):
+        fc.cmd_uid = 5
+        q = MCUCommandQueue(fc, ack_timeout=60, max_retries=2)
+        q.start()
+        future = q.submit(CMD_SET.SET_ROTARY_VALVE, 1, 11)
+        # The MCU was cleared and keeps reporting UID 0 until it sees the re-sent command
+        for _ in range(3):
+            _report(fc, 0, COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+        assert fc.serial.uids == [6, 7]
+        assert not future.done()
+        _report(fc, 7, COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+        assert future.result(0) == COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS
+        q.close()
+
+    def test_fails_after_max_retries(self, fc):
+        q = MCUCommandQueue(fc, ack_timeout=0, max_retries=1)
+        q.start()
+        future = q.submit(CMD_SET.DELAY_MS, 10)
+        _report(fc, 0, COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+        _report(fc, 0, COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)
+        with pytest.raises(TimeoutError):
+            future.result(0)
+        q.close()
+
+    def test_completion_timeout(self, fc, queue):
+        future = queue.submit(CMD_SET.DELAY_MS, 10, timeout=0)
+        _report(fc, 1, COMMAND_STATUS.IN_PROGRESS)
+        _report(fc, 1, COMMAND_STATUS.IN_PROGRESS)
+        with pytest.raises(TimeoutError):
+            future.result(0)
+
+    def test_close_fails_pending(self, fc):
+        q = MCUCommandQueue(fc)
+        q.start()
+        future = q.submit(CMD_SET.DELAY_MS, 10)
+        q.close()
+        with pytest.raises(RuntimeError):
+            future.result(0)
+        with pytest.raises(RuntimeError):
+            q.submit(CMD_SET.DELAY_MS, 10)
+
+    def test_reader_stop_fails_pending(self, fc, queue):
+        future = queue.submit(CMD_SET.DELAY_MS, 10)
+        fc.stop_reader()
+        with pytest.raises(RuntimeError):
+            future.result(0)
+
+
+class TestWithEmulator:
+    @pytest.fixture
+    def emulated(self, monkeypatch):
+        monkeypatch.setattr(threading.Event, "wait", _REAL_EVENT_WAIT)
+        # Each valve move blocks the firmware for 0.7-1.1 s emulated, 0.14-0.22 s real: longer than ack_timeout
+        emu = MCUEmulator(n_selector_valves=1, time_scale=5, valve_settle_s=0.6, valve_step_s=0.1)
+        emu.start()
+        fc = FluidController("emulated", port=emu.port)
+        fc.begin()
+        yield emu, fc
+        fc.stop_reader()
+        fc.serial.close()
+        emu.stop()
+
+    def test_pipelined_blocking_valve_moves_are_sent_once(self, emulated):
+        emu, fc = emulated
+        with MCUCommandQueue(fc, ack_timeout=0.1, max_retries=2) as q:
+            assert q.submit(CMD_SET.INITIALIZE_ROTARY, 0, 10).result(5) == COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS
+            received = emu.commands_received
+            futures = [q.submit(CMD_SET.SET_ROTARY_VALVE, 0, port) for port in (4, 7, 2)]
+            assert [f.result(5) for f in futures] == [COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS] * 3
+        assert emu.commands_received - received == 3
+        assert emu.selector_valves_pos[0] == 2
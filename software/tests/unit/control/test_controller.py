@@ -1,9 +1,15 @@
 # tests/unit/control/test_controller.py
+import threading
+
 import numpy as np
 import pytest
+from cobs import cobs
+
+from fluidics.control.controller import FluidController, encode_command, split_byte, uint_to_bytes
+from fluidics.control._def import CMD_SET, COMMAND_STATUS, MCU_CONSTANTS
 
-from fluidics.control.controller import split_byte, uint_to_bytes
-from fluidics.control._def import MCU_CONSTANTS
+# The autouse _fast_clock fixture replaces Event.wait, which Thread.start relies on
+_REAL_EVENT_WAIT = threading.Event.wait
 
 
 class TestSplitByte:
@@ -80,3 +86,160 @@ class TestRawToPsi:
     def test_midpoint_gives_zero_psi(self):
         result = self.raw_to_psi(16383 / 2)
         assert result == pytest.approx(0.0, abs=0.01)
+
+
+def _status_packet(uid=0, cmd=0, status=0, selector_valves=(1, 1, 1, 1, 1)):
+    """Build a 30-byte MCU -> computer status packet."""
+    msg = [0] * 30
+    msg[0], msg[1] = uid >> 8, uid & 0xFF
+    msg[2] = cmd
+    msg[3] = status
+    msg[6:11] = list(selector_valves)
+    return msg
+
+
+class FakeSerial:
+    """Minimal stand-in for serial.Serial that serves a fixed byte stream."""
+
+    def __init__(self, data=b""):
+        self.buffer = bytearray(data)
+        self.written = bytearray()
+
+    @property
+    def in_waiting(self):
+        return len(self.buffer)
+
+    def read(self, size=1):
+        out = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return out
+
+    def write(self, data):
+        self.written += data
+
+    def close(self):
+        pass
+
+
+class ChunkedFakeSerial(FakeSerial):
+    """FakeSerial that only exposes the next chunk once the previous one is drained,
+    mimicking packets arriving over time."""
+
+    def __init__(self, chunks):
+        super().__init__()
+        self.chunks = list(chunks)
+
+    @property
+    def in_waiting(self):
+        if not self.buffer and self.chunks:
+            self.buffer += self.chunks.pop(0)
+        return len(self.buffer)
+
+
+def _cobs_stream(*packets):
+    return b"".join(cobs.encode(bytes(p)) + b"\x00" for p in packets)
+
+
+class TestReaderThread:
+    @pytest.fixture
+    def fc(self, monkeypatch):
+        monkeypatch.setattr(threading.Event, "wait", _REAL_EVENT_WAIT)
+        fc = FluidController("test")
+        yield fc
+        fc.stop_reader()
+
+    def test_get_mcu_status_without_reader_reads_serial(self, fc):
+        fc.serial = FakeSerial(_cobs_stream(_status_packet(uid=7)))
+        data = fc.get_mcu_status()
+        assert data["MCU_received_command_UID"] == 7
+        assert fc.get_latest_status() == (1, data)
+
+    def test_reader_publishes_every_packet(self, fc):
+        fc.serial = FakeSerial(_cobs_stream(*[_status_packet(uid=i) for i in range(1, 4)]))
+        fc.start_reader()
+        with fc._status_cond:
+            assert fc._status_cond.wait_for(lambda: fc.status_seq == 3, timeout=5)
+        seq, data = fc.get_latest_status()
+        assert seq == 3
+        assert data["MCU_received_command_UID"] == 3
+
+    def test_get_mcu_status_served_from_snapshot(self, fc):
+        fc.serial = FakeSerial(_cobs_stream(_status_packet(selector_valves=(4, 2, 1, 1, 1))))
+        fc.start_reader()
+        data = fc.get_mcu_status()
+        assert data["selector_valves_pos"][:2] == (4, 2)
+        assert fc.serial.in_waiting == 0
+
+    def test_stop_reader(self, fc):
+        fc.serial = FakeSerial()
+        fc.start_reader()
+        assert fc.reader_running()
+        fc.stop_reader()
+        assert not fc.reader_running()
+
+
+class TestCommandListeners:
+    def test_called_after_send(self):
+        fc = FluidController("test")
+        fc.serial = FakeSerial()
+        seen = []
+        fc.add_command_listener(lambda command, args: seen.append((command, args, fc.cmd_uid)))
+        fc.send_command(CMD_SET.SET_ROTARY_VALVE, 0, 3)
+        fc.send_command(CMD_SET.CLEAR)
+        assert seen == [(CMD_SET.SET_ROTARY_VALVE, (0, 3), 1), (CMD_SET.CLEAR, (), 0)]
+
+
+class TestWaitForCompletion:
+    @pytest.fixture
+    def fc(self):
+        return FluidController("test")
+
+    def test_ignores_stale_packets(self, fc):
+        fc.serial = ChunkedFakeSerial([
+            _cobs_stream(_status_packet(uid=4, status=COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)),
+            _cobs_stream(_status_packet(uid=5, status=COMMAND_STATUS.IN_PROGRESS)),
+            _cobs_stream(_status_packet(uid=5, status=COMMAND_STATUS.CMD_EXECUTION_ERROR)),
+        ])
+        assert fc.wait_for_completion(uid=5) == COMMAND_STATUS.CMD_EXECUTION_ERROR
+        assert fc.serial.in_waiting == 0
+
+    def test_defaults_to_last_sent_uid(self, fc):
+        fc.serial = ChunkedFakeSerial([
+            _cobs_stream(_status_packet(uid=0)),
+            _cobs_stream(_status_packet(uid=1, cmd=CMD_SET.SET_ROTARY_VALVE)),
+        ])
+        uid = fc.send_command(CMD_SET.SET_ROTARY_VALVE, 0, 3)
+        assert uid == 1
+        assert fc.wait_for_completion() == COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS
+        assert fc.recorded_data["MCU_received_command_UID"] == 1
+
+    def test_timeout(self, fc):
+        fc.serial = ChunkedFakeSerial([_cobs_stream(_status_packet(uid=1))])
+        with pytest.raises(TimeoutError):
+            fc.wait_for_completion(uid=2, timeout=1)
+
+    def test_uid_wraps_to_16_bits(self, fc):
+        fc.serial = FakeSerial()
+        fc.cmd_uid = 0xFFFF
+        assert fc.send_command(CMD_SET.INITIALIZE_VALVES) == 0
+
+    def test_send_command_uses_encoder(self, fc):
+        fc.serial = FakeSerial()
+        fc.cmd_uid = 0x0102
+        fc.send_command(CMD_SET.SET_ROTARY_VALVE, 1, 5)
+        expected = encode_command(CMD_SET.SET_ROTARY_VALVE, 1, 5)
+        expected[0:2] = [0x01, 0x03]
+        assert bytes(cobs.decode(bytes(fc.serial.written[:-1]))) == bytes(expected)
+
+    def test_reader_thread_signals_completion(self, fc, monkeypatch):
+        monkeypatch.setattr(threading.Event, "wait", _REAL_EVENT_WAIT)
+        fc.serial = ChunkedFakeSerial([
+            _cobs_stream(_status_packet(uid=2, status=COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)),
+            _cobs_stream(_status_packet(uid=3, status=COMMAND_STATUS.IN_PROGRESS)),
+            _cobs_stream(_status_packet(uid=3, status=COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS)),
+        ])
+        fc.start_reader()
+        try:
+            assert fc.wait_for_completion(uid=3, timeout=5) == COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS
+        finally:
+            fc.stop_reader()
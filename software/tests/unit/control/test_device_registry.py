@@ -0,0 +1,84 @@
+# tests/unit/control/test_device_registry.py
+from types import SimpleNamespace
+
+import pytest
+
+from fluidics.control.device_registry import DeviceRegistry, port_vid_pid
+
+
+def _port(device, serial_number=None, vid=None, pid=None, location=None):
+    return SimpleNamespace(device=device, serial_number=serial_number, vid=vid, pid=pid, location=location)
+
+
+class FakeComports:
+    def __init__(self, ports):
+        self.ports = list(ports)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return list(self.ports)
+
+
+@pytest.fixture
+def comports():
+    return FakeComports([
+        _port("/dev/ttyACM0", "12345", 0x16c0, 0x0483, "1-1.1:1.0"),
+        _port("/dev/ttyUSB0", "FT1ABC", 0x0403, 0x6001, "1-1.2:1.0"),
+        _port("/dev/ttyUSB1", "FT2DEF", 0x0403, 0x6001, "1-1.3:1.0"),
+        _port("/dev/ttyS0"),
+    ])
+
+
+class TestDeviceRegistry:
+    def test_single_scan_for_many_lookups(self, comports):
+        registry = DeviceRegistry(comports, fingerprint=None)
+        assert registry.find_device("12345") == "/dev/ttyACM0"
+        assert registry.find_device("FT2DEF") == "/dev/ttyUSB1"
+        assert registry.find_device(location="1-1.2:1.0") == "/dev/ttyUSB0"
+        assert comports.calls == 1
+
+    def test_vid_pid(self, comports):
+        registry = DeviceRegistry(comports, fingerprint=None)
+        assert port_vid_pid(comports.ports[0]) == "16c0:0483"
+        assert port_vid_pid(comports.ports[3]) is None
+        assert [p.device for p in registry.ports() if port_vid_pid(p) == "0403:6001"] == ["/dev/ttyUSB0", "/dev/ttyUSB1"]
+        assert registry.find_device(vid_pid="0403:6001") == "/dev/ttyUSB0"
+        assert registry.find_device(vid_pid="0403:6001", location="1-1.3:1.0") == "/dev/ttyUSB1"
+        assert registry.find_device("12345", vid_pid="0403:6001") is None
+
+    def test_miss_rescans_once(self, comports):
+        registry = DeviceRegistry(comports, fingerprint=None)
+        registry.ports()
+        assert registry.find_device("NEW") is None
+        assert comports.calls == 2
+        # A device plugged in after the cached scan is found by the rescan
+        comports.ports.append(_port("/dev/ttyACM1", "NEW"))
+        assert registry.find_device("NEW") == "/dev/ttyACM1"
+        assert comports.calls == 3
+
+    def test_hotplug_invalidates(self, comports):
+        nodes = ["/dev/ttyACM0"]
+        registry = DeviceRegistry(comports, fingerprint=lambda: tuple(nodes))
+        registry.ports()
+        registry.ports()
+        assert comports.calls == 1
+        nodes.append("/dev/ttyACM1")
+        registry.ports()
+        assert comports.calls == 2
+
+    def test_max_age_and_invalidate(self, comports):
+        registry = DeviceRegistry(comports, fingerprint=None, max_age_s=-1)
+        registry.ports()
+        registry.ports()
+        assert comports.calls == 2
+
+        registry = DeviceRegistry(comports, fingerprint=None)
+        registry.ports()
+        registry.invalidate()
+        registry.ports()
+        assert comports.calls == 4
+
+    def test_find_needs_a_key(self, comports):
+        with pytest.raises(ValueError):
+            DeviceRegistry(comports, fingerprint=None).find()
@@ -0,0 +1,82 @@
+# tests/unit/control/test_framing.py
+from cobs import cobs
+from cobs.cobs import _cobs_py
+
+from fluidics.control import framing
+from fluidics.control.framing import COBSFrameReader, FixedLengthFrameReader
+
+
+def _encode(payload):
+    return cobs.encode(bytes(payload)) + b"\x00"
+
+
+class TestCOBSFrameReader:
+    def test_single_frame(self):
+        reader = COBSFrameReader()
+        assert reader.feed(_encode([1, 0, 2])) == 1
+        assert reader.next_frame() == b"\x01\x00\x02"
+        assert reader.next_frame() is None
+
+    def test_frames_split_across_reads(self):
+        reader = COBSFrameReader()
+        data = _encode([5, 6, 0, 7])
+        assert reader.feed(data[:3]) == 0
+        assert reader.next_frame() is None
+        assert reader.feed(data[3:]) == 1
+        assert reader.next_frame() == b"\x05\x06\x00\x07"
+
+    def test_backlog_in_one_feed(self):
+        reader = COBSFrameReader()
+        data = b"".join(_encode([i, 0, i]) for i in range(1, 6))
+        assert reader.feed(data) == 5
+        assert reader.pop_frames() == [bytes([i, 0, i]) for i in range(1, 6)]
+        assert reader.pop_frames() == []
+
+    def test_latest_frame_discards_older(self):
+        reader = COBSFrameReader()
+        reader.feed(_encode([1]) + _encode([2]) + _encode([3]))
+        assert reader.latest_frame() == b"\x03"
+        assert reader.next_frame() is None
+
+    def test_partial_frame_kept_after_complete_ones(self):
+        reader = COBSFrameReader()
+        second = _encode([9, 9])
+        reader.feed(_encode([1]) + second[:1])
+        assert reader.pop_frames() == [b"\x01"]
+        reader.feed(second[1:])
+        assert reader.pop_frames() == [b"\x09\x09"]
+
+    def test_corrupted_frame_is_skipped(self):
+        reader = COBSFrameReader()
+        reader.feed(b"\x05\x01\x00" + _encode([4]))
+        assert reader.pop_frames() == [b"\x04"]
+        assert reader.decode_errors == 1
+
+    def test_decodes_from_buffer_view(self, monkeypatch):
+        # The pure Python decoder accepts memoryviews, unlike the cobs 1.2 C extension
+        monkeypatch.setattr(framing.cobs, "decode", _cobs_py.decode)
+        monkeypatch.setattr(framing.cobs, "DecodeError", _cobs_py.DecodeError)
+        reader = COBSFrameReader()
+        reader.decode_from_view = True
+        second = _encode([9, 0, 9])
+        assert reader.feed(_encode([1]) + b"\x05\x01\x00" + second[:2]) == 1
+        assert reader.feed(second[2:]) == 1
+        assert reader.pop_frames() == [b"\x01", b"\x09\x00\x09"]
+        assert reader.decode_errors == 1
+        assert len(reader.buffer) == 0
+
+    def test_clear(self):
+        reader = COBSFrameReader()
+        reader.feed(_encode([1]) + b"\x02")
+        reader.clear()
+        assert reader.next_frame() is None
+        assert len(reader.buffer) == 0
+
+
+class TestFixedLengthFrameReader:
+    def test_splits_into_fixed_frames(self):
+        reader = FixedLengthFrameReader(3)
+        assert reader.feed(bytes(range(8))) == 2
+        assert reader.pop_frames() == [b"\x00\x01\x02", b"\x03\x04\x05"]
+        reader.feed(b"\x08")
+        assert reader.next_frame() == b"\x06\x07\x08"
@@ -0,0 +1,122 @@
+# tests/unit/control/test_mcu_emulator.py
+import threading
+
+import pytest
+
+from fluidics.control._def import CMD_SET, COMMAND_STATUS, VALVE_POSITIONS
+from fluidics.control.controller import FluidController
+from fluidics.control.mcu_emulator import (
+    INTERNAL_STATE,
+    TX_INTERVAL_MS,
+    MCUEmulator,
+)
+from fluidics.control.mcu_status import decode_status
+
+# The autouse _fast_clock fixture replaces Event.wait, which Thread.start relies on
+_REAL_EVENT_WAIT = threading.Event.wait
+
+
+def _packet(uid, command, *payload):
+    return bytes([uid >> 8, uid & 0xFF, command, *payload])
+
+
+@pytest.fixture
+def emu():
+    emu = MCUEmulator(n_selector_valves=2)
+    return emu
+
+
+class TestCommandHandling:
+    def test_status_reflects_latest_uid(self, emu):
+        emu.handle_packet(_packet(7, CMD_SET.SET_SOLENOID_VALVES, 0x00, 0x15))
+        status = decode_status(emu.status_packet())
+        assert status.MCU_received_command_UID == 7
+        assert status.MCU_received_command == CMD_SET.SET_SOLENOID_VALVES
+        assert status.MCU_command_execution_status == COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS
+        assert status.solenoid_valves == 0x15
+
+    def test_wrong_length_is_invalid(self, emu):
+        emu.handle_packet(_packet(1, CMD_SET.SET_SOLENOID_VALVES, 0x00))
+        assert emu.execution_status == COMMAND_STATUS.CMD_INVALID
+
+    def test_rotary_move_blocks_for_move_time(self, emu):
+        emu.handle_packet(_packet(1, CMD_SET.INITIALIZE_ROTARY, 0, 10))
+        emu.handle_packet(_packet(2, CMD_SET.SET_ROTARY_VALVE, 0, 4))
+        # 3 ports of travel
+        assert emu._busy_until_ms == pytest.approx(200 + 3 * 50)
+        assert emu.selector_valves_pos[0] == 4
+        assert emu.execution_status == COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS
+
+    def test_rotary_move_rejects_uninitialized_valve(self, emu):
+        emu.handle_packet(_packet(1, CMD_SET.SET_ROTARY_VALVE, 1, 4))
+        assert emu.execution_status == COMMAND_STATUS.CMD_INVALID
+
+    def test_no_status_while_valve_moves(self, emu):
+        sent = []
+        emu._send = sent.append
+        emu.handle_packet(_packet(1, CMD_SET.INITIALIZE_ROTARY, 0, 10))
+        emu.handle_packet(_packet(2, CMD_SET.SET_ROTARY_VALVE, 0, 6))
+        emu.advance(emu._busy_until_ms - 1)
+        assert sent == []
+        emu.advance(emu._busy_until_ms + TX_INTERVAL_MS)
+        assert sent
+
+    def test_delay_completes_after_duration(self, emu):
+        emu.handle_packet(_packet(1, CMD_SET.DELAY_MS, 0, 0, 0x01, 0xF4))
+        assert emu.execution_status == COMMAND_STATUS.IN_PROGRESS
+        emu.advance(400)
+        assert emu.state == INTERNAL_STATE.DELAYING
+        emu.advance(600)
+        assert emu.execution_status == COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS
+
+    def test_clear_resets_uid(self, emu):
+        emu.handle_packet(_packet(9, CMD_SET.SET_PUMP_PWR_OPEN_LOOP, 0x01, 0xF4))
+        emu.handle_packet(_packet(10, CMD_SET.CLEAR))
+        assert emu.cmd_uid == 0
+        assert emu.pump_power == 0
+
+    def test_open_loop_pump_drives_flow_and_pressure(self, emu):
+        emu.handle_packet(_packet(1, CMD_SET.INITIALIZE_FLOW_SENSOR, 0, 0x08, 1))
+        emu.handle_packet(_packet(2, CMD_SET.SET_PUMP_PWR_OPEN_LOOP, 0x01, 0xF4))
+        emu.advance(100)
+        status = decode_status(emu.status_packet())
+        assert status.measurement_pump_power == pytest.approx(500, rel=1e-3)
+        assert status.flowrates[0] > 0
+        assert status.pressures[1] > 0
+
+    def test_clear_lines_finishes_once_line_is_dry(self, emu):
+        emu.handle_packet(_packet(1, CMD_SET.INITIALIZE_FLOW_SENSOR, 0, 0x08, 1))
+        emu.handle_packet(_packet(2, CMD_SET.INITIALIZE_BUBBLE_SENSORS))
+        # 600 mW, 20 s timeout, 200 ms debounce
+        emu.handle_packet(_packet(3, CMD_SET.CLEAR_LINES, 0x02, 0x58, 0x4E, 0x20, 0x00, 0xC8))
+        assert emu.solenoid_valves == VALVE_POSITIONS.FLUID_CLEAR_LINES
+        emu.advance(1000)
+        assert emu.execution_status == COMMAND_STATUS.IN_PROGRESS
+        emu.advance(10000)
+        assert emu.execution_status == COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS
+        assert emu.pump_power == 0
+
+
+class TestEndToEnd:
+    @pytest.fixture
+    def fc(self, monkeypatch):
+        monkeypatch.setattr(threading.Event, "wait", _REAL_EVENT_WAIT)
+        emu = MCUEmulator(n_selector_valves=2, time_scale=20)
+        emu.start()
+        fc = FluidController("emulated", use_reader_thread=True, port=emu.port)
+        fc.begin()
+        yield fc
+        fc.stop_reader()
+        fc.serial.close()
+        emu.stop()
+
+    def test_rotary_valve_round_trip(self, fc):
+        fc.send_command_blocking(CMD_SET.INITIALIZE_ROTARY, 0, 10, timeout=5)
+        status = fc.send_command_blocking(CMD_SET.SET_ROTARY_VALVE, 0, 7, timeout=5)
+        assert status == COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS
+        assert fc.get_mcu_status()["selector_valves_pos"][0] == 7
+
+    def test_delay_round_trip(self, fc):
+        status = fc.send_command_blocking(CMD_SET.DELAY_MS, 1000, timeout=5)
+        assert status == COMMAND_STATUS.COMPLETED_WITHOUT_ERRORS
+        assert fc.get_mcu_status()["MCU_received_command_UID"] == fc.cmd_uid
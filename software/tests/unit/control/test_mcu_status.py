@@ -0,0 +1,106 @@
+# tests/unit/control/test_mcu_status.py
+import numpy as np
+import pytest
+
+from fluidics.control._def import MCU_CONSTANTS, MCU_MSG_LENGTH
+from fluidics.control.mcu_status import (
+    MCUStatus,
+    STATUS_DTYPE,
+    decode_status,
+    decode_status_batch,
+    raw_to_psi,
+)
+
+
+def _packet(uid=0x1234, cmd=3, status=1, program=2, bubble=0xA5,
+            selector_valves=(1, 2, 3, 4, 5), solenoid=0x8001, pump_power=0x8000,
+            pressures=(0, 8191, 16383, 1000), flows=(-500, 500), elapsed=9, volume=-32767):
+    msg = bytearray(MCU_MSG_LENGTH)
+    msg[0:2] = uid.to_bytes(2, "big")
+    msg[2], msg[3], msg[4], msg[5] = cmd, status, program, bubble
+    msg[6:11] = bytes(selector_valves)
+    msg[11:13] = solenoid.to_bytes(2, "big")
+    msg[13:15] = pump_power.to_bytes(2, "big")
+    for i, p in enumerate(pressures):
+        msg[15 + 2 * i:17 + 2 * i] = p.to_bytes(2, "big")
+    msg[23:25] = flows[0].to_bytes(2, "big", signed=True)
+    msg[25:27] = flows[1].to_bytes(2, "big", signed=True)
+    msg[27] = elapsed
+    msg[28:30] = volume.to_bytes(2, "big", signed=True)
+    return bytes(msg)
+
+
+class TestDecodeStatus:
+    def test_fields(self):
+        s = decode_status(_packet())
+        assert s.MCU_received_command_UID == 0x1234
+        assert s.MCU_received_command == 3
+        assert s.MCU_command_execution_status == 1
+        assert s.MCU_interal_program == 2
+        assert s.bubble_sensor_states == (0x0A, 0x05)
+        assert s.selector_valves_pos == (1, 2, 3, 4, 5)
+        assert s.MCU_CMD_time_elapsed == 9
+
+    def test_signed_fields(self):
+        s = decode_status(_packet())
+        assert s.solenoid_valves == np.int16(-32767)
+        assert s.flowrates == pytest.approx(
+            (-500 / MCU_CONSTANTS.SCALE_FACTOR_FLOW, 500 / MCU_CONSTANTS.SCALE_FACTOR_FLOW))
+        assert s.vol_ul == pytest.approx(-MCU_CONSTANTS.VOLUME_UL_MAX)
+
+    def test_scaled_fields(self):
+        s = decode_status(_packet())
+        assert s.measurement_pump_power == pytest.approx(MCU_CONSTANTS.TTP_MAX_PW * 0x8000 / 65535)
+        assert s.pressures[0] == pytest.approx(MCU_CONSTANTS._p_min)
+        assert s.pressures[2] == pytest.approx(MCU_CONSTANTS._p_max)
+
+    def test_dict_style_access(self):
+        s = decode_status(_packet())
+        assert s["selector_valves_pos"][4] == 5
+        assert "pressures" in s
+        assert s.get("missing") is None
+        with pytest.raises(KeyError):
+            s["missing"]
+
+    def test_slots_record(self):
+        s = decode_status(_packet())
+        assert not hasattr(s, "__dict__")
+        assert set(s.to_dict()) == set(MCUStatus.__slots__)
+
+    def test_accepts_bytearray(self):
+        assert decode_status(bytearray(_packet())) == decode_status(_packet())
+
+
+class TestDecodeStatusBatch:
+    def test_matches_single_decoder(self):
+        packets = [_packet(uid=i, flows=(i, -i), pressures=(i, 2 * i, 3 * i, 4 * i)) for i in range(5)]
+        batch = decode_status_batch(packets)
+        for i, packet in enumerate(packets):
+            single = decode_status(packet)
+            for key in MCUStatus.__slots__:
+                np.testing.assert_allclose(batch[key][i], single[key])
+
+    def test_contiguous_buffer(self):
+        packets = [_packet(uid=i) for i in range(3)]
+        batch = decode_status_batch(b"".join(packets))
+        assert list(batch["MCU_received_command_UID"]) == [0, 1, 2]
+        assert batch["pressures"].shape == (3, 4)
+        assert batch["bubble_sensor_states"].shape == (3, 2)
+
+    def test_uint8_array(self):
+        arr = np.frombuffer(_packet() * 2, dtype=np.uint8).reshape(2, MCU_MSG_LENGTH)
+        batch = decode_status_batch(arr)
+        assert list(batch["MCU_received_command_UID"]) == [0x1234, 0x1234]
+
+    def test_empty(self):
+        batch = decode_status_batch([])
+        assert len(batch["vol_ul"]) == 0
+
+
+def test_dtype_matches_wire_length():
+    assert STATUS_DTYPE.itemsize == MCU_MSG_LENGTH
+
+
+def test_raw_to_psi_vectorized():
+    raw = np.array([MCU_CONSTANTS._output_min, MCU_CONSTANTS._output_max])
+    np.testing.assert_allclose(raw_to_psi(raw), [MCU_CONSTANTS._p_min, MCU_CONSTANTS._p_max])
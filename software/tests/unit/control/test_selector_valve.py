@@ -1,9 +1,11 @@
 # tests/unit/control/test_selector_valve.py
+import numpy as np
 import pytest
 
 from fluidics.control.config import load_config
+from fluidics.control._def import CMD_SET
 from fluidics.control.controller import FluidControllerSimulation
-from fluidics.control.selector_valve import SelectorValveSystem
+from fluidics.control.selector_valve import PortRoutingTable, SelectorValveSystem
 
 
 def _make_valve_system(config_path):
@@ -101,3 +103,221 @@ class TestOpenPort:
         open_chamber_system.open_port(5)
         open_chamber_system.open_port(999)  # should do nothing
         assert open_chamber_system.get_current_port() == 5
+
+
+class RecordingController(FluidControllerSimulation):
+    """Simulated controller that records every call made to it."""
+
+    def __init__(self):
+        super().__init__(serial_number="test")
+        self.calls = []
+        self.uid = 0
+
+    def send_command(self, command, *args):
+        super().send_command(command, *args)
+        self.uid += 1
+        self.calls.append(("send", command, *args))
+        return self.uid
+
+    def wait_for_completion(self, uid=None, timeout=None):
+        self.calls.append(("wait", uid))
+        return super().wait_for_completion(uid, timeout)
+
+    def get_mcu_status(self):
+        self.calls.append(("status",))
+        return super().get_mcu_status()
+
+
+class TestParallelRouting:
+    @pytest.fixture
+    def system(self, fixtures_dir):
+        config = load_config(str(fixtures_dir / "flow_cell_config.yaml"))
+        fc = RecordingController()
+        system = SelectorValveSystem(fc, config, parallel_routing=True)
+        fc.calls.clear()
+        return system
+
+    def test_route(self, system):
+        assert [(v.id, p) for v, p in system.get_route(5)] == [(0, 5)]
+        assert [(v.id, p) for v, p in system.get_route(12)] == [(0, 10), (1, 3)]
+        assert [(v.id, p) for v, p in system.get_route(20)] == [(0, 10), (1, 10), (2, 2)]
+
+    def test_sends_all_moves_then_waits_once(self, system):
+        system.open_port(20)
+        assert [c[0] for c in system.fc.calls] == ["send", "send", "send", "wait", "status"]
+        assert system.fc.calls[3] == ("wait", system.fc.uid)
+        positions = system.fc.get_mcu_status()["selector_valves_pos"]
+        assert [positions[i] for i in range(3)] == [10, 10, 2]
+        assert [v.position for v in system.valves] == [10, 10, 2]
+        assert system.get_current_port() == 20
+
+    def test_sequential_override(self, system):
+        system.open_port(20, parallel=False)
+        assert [c[0] for c in system.fc.calls] == ["send", "wait", "status"] * 3
+
+    def test_mismatch_raises(self, system, monkeypatch):
+        monkeypatch.setattr(system.fc, "get_mcu_status", lambda: {"selector_valves_pos": {0: 10, 1: 4, 2: 1}})
+        with pytest.raises(RuntimeError, match="valve 1"):
+            system.open_port(12)
+        assert system.get_current_port() == 1
+
+
+class TestPositionCache:
+    @pytest.fixture
+    def system(self, fixtures_dir):
+        config = load_config(str(fixtures_dir / "flow_cell_config.yaml"))
+        fc = RecordingController()
+        system = SelectorValveSystem(fc, config)
+        fc.calls.clear()
+        return system
+
+    def _sent(self, system):
+        return [c[1:] for c in system.fc.calls if c[0] == "send"]
+
+    def test_initial_positions_verified(self, system):
+        assert all(v.is_at(1) for v in system.valves)
+        system.open_port(1)
+        assert system.fc.calls == []
+
+    def test_only_changed_valves_move(self, system):
+        system.open_port(20)
+        system.fc.calls.clear()
+        system.open_port(21)
+        assert self._sent(system) == [(CMD_SET.SET_ROTARY_VALVE, 2, 3)]
+
+    def test_parallel_skips_valves_in_place(self, system):
+        system.open_port(12)
+        system.fc.calls.clear()
+        system.open_port(20, parallel=True)
+        assert self._sent(system) == [(CMD_SET.SET_ROTARY_VALVE, 1, 10), (CMD_SET.SET_ROTARY_VALVE, 2, 2)]
+        system.fc.calls.clear()
+        system.open_port(20, parallel=True)
+        assert system.fc.calls == []
+
+    def test_invalidate_forces_move(self, system):
+        system.invalidate_positions()
+        system.open_port(1)
+        assert self._sent(system) == [(CMD_SET.SET_ROTARY_VALVE, 0, 1)]
+
+    def test_failed_move_invalidates(self, system, monkeypatch):
+        monkeypatch.setattr(system.fc, "get_mcu_status", lambda: {"selector_valves_pos": {0: 3, 1: 1, 2: 1}})
+        with pytest.raises(RuntimeError):
+            system.open_port(5)
+        assert not system.valves[0].position_verified
+        assert system.valves[1].is_at(1)
+
+    def test_telemetry_mismatch_invalidates(self, system):
+        system._on_status({"selector_valves_pos": (1, 7, 1, 1, 1)})
+        assert system.valves[0].is_at(1)
+        assert not system.valves[1].position_verified
+        system._on_status(None)
+        assert not any(v.position_verified for v in system.valves)
+
+    def test_refresh_positions(self, system):
+        system.invalidate_positions()
+        system.fc.data["selector_valves_pos"][2] = 6
+        system.refresh_positions()
+        assert system.valves[2].is_at(6)
+        assert system.valves[0].is_at(1)
+
+
+class StreamingController(RecordingController):
+    """Recording controller with a status reader thread that can be stopped, like FluidController."""
+
+    def __init__(self):
+        super().__init__()
+        self.streaming = True
+        self.snapshot = None
+        self.command_listeners = []
+
+    def reader_running(self):
+        return self.streaming
+
+    def get_latest_status(self):
+        if self.snapshot is not None:
+            return 1, self.snapshot
+        return 1, {"selector_valves_pos": dict(self.data["selector_valves_pos"])}
+
+    def add_command_listener(self, callback):
+        self.command_listeners.append(callback)
+
+    def remove_command_listener(self, callback):
+        self.command_listeners.remove(callback)
+
+    def send_command(self, command, *args):
+        uid = super().send_command(command, *args)
+        for callback in self.command_listeners:
+            callback(command, args)
+        return uid
+
+
+class TestStreamedPositionCheck:
+    @pytest.fixture
+    def system(self, fixtures_dir):
+        config = load_config(str(fixtures_dir / "flow_cell_config.yaml"))
+        fc = StreamingController()
+        system = SelectorValveSystem(fc, config)
+        fc.calls.clear()
+        return system
+
+    def _sent(self, system):
+        return [c[1:] for c in system.fc.calls if c[0] == "send"]
+
+    def test_skips_move_confirmed_by_snapshot(self, system):
+        system.open_port(1)
+        assert self._sent(system) == []
+
+    def test_moves_without_live_reader(self, system):
+        system.fc.streaming = False
+        system.open_port(1)
+        assert self._sent(system) == [(CMD_SET.SET_ROTARY_VALVE, 0, 1)]
+
+    def test_moves_when_snapshot_disagrees(self, system):
+        # e.g. moved by hand; the snapshot has not reached the status listener yet
+        system.fc.snapshot = {"selector_valves_pos": {0: 4, 1: 1, 2: 1}}
+        assert not system.valves[0].is_at(1)
+        assert system.valves[1].is_at(1)
+
+    def test_clear_invalidates_every_valve(self, system):
+        system.fc.send_command(CMD_SET.CLEAR)
+        assert not any(v.position_verified for v in system.valves)
+
+    def test_initialize_rotary_invalidates_its_valve(self, system):
+        system.fc.send_command(CMD_SET.INITIALIZE_ROTARY, 1, 10)
+        assert [v.position_verified for v in system.valves] == [True, False, True]
+
+    def test_close_stops_listening(self, system):
+        system.close()
+        assert system.fc.command_listeners == []
+        # Nothing would notice a CLEAR any more, so nothing is skipped
+        assert not any(v.position_verified for v in system.valves)
+
+
+class TestPortRoutingTable:
+    @pytest.fixture
+    def table(self, fixtures_dir):
+        return PortRoutingTable(load_config(str(fixtures_dir / "flow_cell_config.yaml")).reagent_selection)
+
+    def test_size(self, table):
+        assert len(table) == 28
+        assert 28 in table and 0 not in table and 29 not in table
+
+    def test_route_entries(self, table):
+        route = table.route(19)
+        assert route.valve_id == 2
+        assert route.moves == ((0, 10), (1, 10), (2, 1))
+        assert route.volume_to_valve == 1140
+        assert route.volume_to_port == 450
+        assert table.route(1).reagent == "reagent x"
+
+    def test_unknown_port(self, table):
+        with pytest.raises(KeyError):
+            table.route(29)
+
+    def test_bulk_arrays(self, table):
+        assert table.positions.shape == (29, 3)
+        np.testing.assert_array_equal(table.positions[10], [10, 1, 0])
+        np.testing.assert_array_equal(table.volume_to_valve[[1, 10, 19]], [800, 1000, 1140])
+        assert not table.positions.flags.writeable
+        with pytest.raises(ValueError):
+            table.volume_to_port[1] = 0
@@ -1,6 +1,9 @@
 # tests/unit/control/test_syringe_pump.py
+import time
+
 import pytest
-from fluidics.control.syringe_pump import SyringePump, SyringePumpSimulation
+from fluidics.control.syringe_pump import SpeedCodeTable, SyringePump, SyringePumpSimulation, speed_code_table
+from fluidics.control.tecancavro import ChainCache, TecanAPISimulation
 
 
 def _make_sim_with_real_speed_code(speed_code_limit=10):
@@ -76,6 +79,57 @@ class TestFlowRateToSpeedCode:
         assert len(seen) == 41
 
 
+class TestSpeedCodeTable:
+    def test_match_reports_achieved_rate_and_error(self):
+        match = SpeedCodeTable(5000).lookup(2300, speed_code_limit=10)
+        # 5000*60/2300 = 130.4 s lies between codes 32 (120 s) and 33 (150 s)
+        assert match.speed_code == 32
+        assert match.flow_rate == pytest.approx(2500)
+        assert match.error == pytest.approx(200 / 2300)
+
+    def test_exact_rate_has_no_error(self):
+        match = SpeedCodeTable(5000).lookup(5000)
+        assert match.speed_code == 27
+        assert match.error == pytest.approx(0)
+
+    def test_tie_goes_to_faster_code(self):
+        table = SpeedCodeTable(6000)
+        # Halfway between codes 33 (150 s) and 34 (200 s)
+        assert table.lookup(6000 * 60 / 175).speed_code == 33
+
+    def test_agrees_with_linear_scan(self):
+        table = SpeedCodeTable(2500)
+        mapping = SyringePump.SPEED_SEC_MAPPING
+        for rate in range(100, 130000, 97):
+            target = 2500 * 60 / rate
+            limit = 5
+            expected = min(range(limit, len(mapping)), key=lambda c: (abs(mapping[c] - target), c))
+            assert table.lookup(rate, limit).speed_code == expected
+
+    def test_rejects_non_positive_rate(self):
+        with pytest.raises(ValueError):
+            SpeedCodeTable(5000).lookup(0)
+
+    def test_map_sequences(self):
+        sequences = [{"type": "priming", "flow_rate": 5000}, {"type": "set_temperature"},
+                     {"type": "flow_reagent", "flow_rate": 5000}]
+        matches = SpeedCodeTable(5000).map_sequences(sequences)
+        assert matches[1] is None
+        assert matches[0] is matches[2]
+        assert matches[0].speed_code == 27
+
+    def test_tables_shared_per_volume(self):
+        assert speed_code_table(5000) is speed_code_table(5000)
+        assert speed_code_table(5000) is not speed_code_table(2500)
+
+    def test_simulation_matches_pump(self):
+        sim = SyringePumpSimulation(sn=None, syringe_ul=5000, speed_code_limit=10, waste_port=1)
+        pump = _sim_pump()
+        sequences = [{"type": "flow_reagent", "flow_rate": rate} for rate in (100, 2300, 60000, 999999)]
+        assert sim.match_sequence_flow_rates(sequences) == pump.match_sequence_flow_rates(sequences)
+        assert sim.flow_rate_to_speed_code(999999) == 10
+
+
 class TestGetFlowRate:
     def test_known_values(self):
         """get_flow_rate returns volume * 60 / (mapping[code] * 1000)."""
@@ -99,3 +153,216 @@ class TestGetFlowRate:
             rate = p.volume * 60 / mapping[code]
             recovered_code = p.flow_rate_to_speed_code(rate)
             assert recovered_code == code, f"Round-trip failed for code {code}: rate={rate}, recovered={recovered_code}"
+
+
+class FakeSyringe:
+    """Reports ready once the (fake) clock passes `finish`, counting polls."""
+
+    def __init__(self, finish):
+        self.finish = finish
+        self.polls = []
+
+    def _checkReady(self):
+        self.polls.append(time.time())
+        return time.time() >= self.finish
+
+
+class TestWaitForStop:
+    @pytest.fixture
+    def pump(self):
+        p = SyringePump.__new__(SyringePump)
+        p.is_aborted = False
+        p.is_busy = True
+        p.chain_speed_code = 10
+        p.finish_time_error = {}
+        return p
+
+    def test_first_poll_just_before_predicted_finish(self, pump):
+        start = time.time()
+        pump.syringe = FakeSyringe(start + 10)
+        pump.wait_for_stop(10)
+        assert not pump.is_busy
+        assert pump.syringe.polls[0] - start == pytest.approx(10 - SyringePump.POLL_LEAD_S)
+        # Ready within a couple of fine-grained polls of the finish instead of 0.5 s steps
+        assert pump.syringe.polls[-1] - start < 10 + SyringePump.POLL_INTERVAL_MIN_S * 2
+
+    def test_backs_off_geometrically(self, pump):
+        start = time.time()
+        pump.syringe = FakeSyringe(start + 5)
+        pump.wait_for_stop(1)
+        gaps = [b - a for a, b in zip(pump.syringe.polls, pump.syringe.polls[1:])]
+        assert gaps[0] == pytest.approx(SyringePump.POLL_INTERVAL_MIN_S)
+        assert all(b >= a for a, b in zip(gaps, gaps[1:]))
+        assert max(gaps) <= SyringePump.POLL_INTERVAL_MAX_S
+
+    def test_learns_error_per_speed_code(self, pump):
+        for _ in range(10):
+            pump.syringe = FakeSyringe(time.time() + 3)
+            pump.wait_for_stop(2)
+        assert pump.finish_time_error[10] == pytest.approx(1, abs=0.1)
+        assert 20 not in pump.finish_time_error
+        # With the learned correction the first poll lands just before the real finish
+        start = time.time()
+        pump.syringe = FakeSyringe(start + 3)
+        pump.wait_for_stop(2)
+        assert len(pump.syringe.polls) <= 3
+
+    def test_abort_stops_polling(self, pump):
+        pump.syringe = FakeSyringe(float("inf"))
+        pump.is_aborted = True
+        pump.wait_for_stop(1)
+        assert not pump.is_busy
+        assert pump.syringe.polls == []
+
+    def test_finish_execute_counts_time_since_start(self, pump):
+        start = time.time()
+        pump.syringe = FakeSyringe(start + 10)
+        pump.syringe.executeChain = lambda minimal_reset: 10
+        pump.syringe.getPlungerPos = lambda: 0
+        pump.range = 3000
+        t = pump.start_execute()
+        time.sleep(4)  # e.g. a valve move issued meanwhile
+        pump.finish_execute(t)
+        assert pump.syringe.polls[0] - start == pytest.approx(10 - SyringePump.POLL_LEAD_S)
+        # Finished on time, so nothing is learned as a finish time error
+        assert abs(pump.finish_time_error[10]) < SyringePump.POLL_INTERVAL_MIN_S
+
+    def test_send_latency_is_not_counted_twice(self, pump):
+        start = time.time()
+        pump.syringe = FakeSyringe(start + 10)
+
+        def execute_chain(minimal_reset):
+            time.sleep(0.3)  # sending the chain and reading the pump's answer
+            return 10 - 0.3  # executeChain takes that time off its prediction
+
+        pump.syringe.executeChain = execute_chain
+        pump.syringe.getPlungerPos = lambda: 0
+        pump.range = 3000
+        t = pump.start_execute()
+        time.sleep(4)
+        pump.finish_execute(t)
+        assert pump.syringe.polls[0] - start == pytest.approx(10 - SyringePump.POLL_LEAD_S)
+        assert abs(pump.finish_time_error[10]) < SyringePump.POLL_INTERVAL_MIN_S
+
+
+def _sim_pump(cache_size=None, plunger_pos=0):
+    pump = SyringePump(None, 5000, 10, 3, com_link=TecanAPISimulation(plunger_pos=plunger_pos))
+    if cache_size is not None:
+        pump.chain_cache = ChainCache(cache_size)
+    return pump
+
+
+def _run_ops(pump, ops):
+    """Build each chain of ops; returns (chain, exec_time, sim_state) per chain, executing between chains."""
+    out = []
+    for chain_ops in ops:
+        for op, args in chain_ops:
+            getattr(pump, op)(*args)
+        syringe = pump.syringe
+        out.append((syringe.cmd_chain, syringe.exec_time, dict(syringe.sim_state), syringe.sim_speed_change))
+        syringe.executeChain(minimal_reset=True)
+        pump.get_plunger_position()
+        pump.chained_volume = 0
+    return out
+
+
+class TestChainCache:
+    OPS = [
+        [("extract", (2, 1000, 20)), ("dispense", (4, 1000, 25))],
+        [("extract", (2, 1000, 20)), ("dispense", (4, 1000, 25))],
+        [("extract", (2, 1000, 20)), ("extract", (3, 500, 5)), ("dispense_to_waste", ())],
+        [("extract", (2, 1000, 20)), ("dispense", (4, 1000, 25))],
+        [("extract", (1, 2000, 30)), ("dispense_to_waste", (12,))],
+        [("extract", (1, 2000, 30)), ("dispense_to_waste", (12,))],
+    ]
+
+    def test_chains_identical_to_uncached(self):
+        cached = _run_ops(_sim_pump(), self.OPS)
+        uncached = _run_ops(_sim_pump(cache_size=0), self.OPS)
+        assert len(cached) == len(uncached)
+        for (chain, t, state, speed_change), (chain0, t0, state0, speed_change0) in zip(cached, uncached):
+            assert chain == chain0
+            assert t == pytest.approx(t0, rel=1e-12)
+            assert state == state0
+            assert speed_change == speed_change0
+
+    def test_repeated_operations_hit(self):
+        pump = _sim_pump()
+        _run_ops(pump, self.OPS)
+        # Chain 4 repeats chain 2 from the same state; chain 6 starts from another valve
+        # port than chain 5, so only its dispense to waste is reused
+        assert pump.chain_cache.hits == 3
+        assert pump.chain_cache.misses == 10
+
+    def test_lru_eviction(self):
+        pump = _sim_pump(cache_size=2)
+        _run_ops(pump, [[("extract", (2, 100, 20))], [("extract", (3, 100, 20))], [("extract", (4, 100, 20))]])
+        assert len(pump.chain_cache) == 2
+        pump.syringe.sim_state["plunger_pos"] = 0
+        before = pump.chain_cache.misses
+        pump.extract(2, 100, 20)
+        assert pump.chain_cache.misses == before + 1
+
+    def test_invalid_operation_is_not_cached(self):
+        pump = _sim_pump()
+        with pytest.raises(ValueError):
+            pump.extract(9, 100, 20)
+        assert len(pump.chain_cache) == 0
+
+
+class TestCycle:
+    def test_oversize_volume_loops_full_strokes(self):
+        pump = _sim_pump()
+        pump.cycle(2, 12000, 10)
+        chain = pump.syringe.cmd_chain
+        # Two full 5000 ul strokes in a loop, then the 2000 ul remainder
+        assert chain.count("g") == 1 and "G2" in chain
+        assert pump.syringe.sim_state["plunger_pos"] == 0
+
+        unrolled = _sim_pump(cache_size=0)
+        for volume in (5000, 5000, 2000):
+            unrolled.extract(2, volume, 10)
+            unrolled.dispense_to_waste()
+        assert pump.syringe.exec_time == pytest.approx(unrolled.syringe.exec_time)
+        assert len(chain) < len(unrolled.syringe.cmd_chain)
+
+    def test_remainder_is_whole_steps(self):
+        pump = _sim_pump()
+        # 5000 ul / 3000 steps: 12000.4 ul is 7200 steps, two full strokes and 1200 steps
+        pump.cycle(2, 12000.4, 10)
+        assert pump.syringe.cmd_chain.endswith("P1200S10I3A0")
+        # Less than a step over two full strokes: no micro-stroke
+        tiny = _sim_pump()
+        tiny.cycle(2, 10000.5, 10)
+        assert tiny.syringe.cmd_chain.count("P") == 1
+        assert tiny.syringe.cmd_chain.endswith("G2")
+
+    def test_strokes_survive_float_rounding(self):
+        pump = _sim_pump()
+        # 7 steps is 11.666... ul, which truncates to 6 steps without rounding to whole steps
+        pump.cycle(1, 7 * 5000 / 3000, 10, out_port=4)
+        assert "P7" in pump.syringe.cmd_chain and "D7" in pump.syringe.cmd_chain
+
+    def test_dumps_syringe_before_cycle_to_waste(self):
+        pump = _sim_pump(plunger_pos=1200)
+        pump.cycle(2, 1000, 10)
+        chain = pump.syringe.cmd_chain
+        assert chain.index("A0") < chain.index("P")
+
+    def test_executes_early_when_buffer_would_overflow(self):
+        pump = _sim_pump()
+        pump.COMMAND_BUFFER_LEN = 20
+        pump.cycle(2, 1000, 10)
+        first = pump.syringe.cmd_chain
+        pump.cycle(4, 1000, 10)
+        # The second cycle did not fit: the first was executed and a new chain started
+        assert pump.syringe.cmd_chain != first
+        assert not pump.syringe.cmd_chain.startswith(first)
+        assert pump.get_plunger_position() == 0
+
+    def test_cycle_too_long_for_buffer_raises(self):
+        pump = _sim_pump()
+        pump.COMMAND_BUFFER_LEN = 10
+        with pytest.raises(ValueError, match="command buffer"):
+            pump.cycle(2, 1000, 10)
+        assert pump.syringe.cmd_chain == ""
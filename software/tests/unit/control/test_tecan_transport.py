@@ -0,0 +1,207 @@
+# tests/unit/control/test_tecan_transport.py
+import threading
+
+import pytest
+
+from fluidics.control.tecancavro import (AsyncioBackend, SyringeTimeout, TecanAPISimulation, ThreadBackend,
+                                         XCaliburD, getBackend, transport)
+from fluidics.control.tecancavro.transport import TecanAPISerial
+
+
+def _reply(data=b"", status=0x60, addr=0x30):
+    frame = bytes([0x02, addr, status]) + data + bytes([0x03])
+    checksum = 0
+    for b in frame:
+        checksum ^= b
+    return frame + bytes([checksum])
+
+
+class FakeSerial:
+    """Serial stand-in that answers every write with the next canned reply."""
+
+    def __init__(self, port=None, baudrate=None, timeout=None):
+        self.replies = []
+        self.buffer = bytearray()
+        self.written = []
+        self.timeouts = 0
+
+    def reset_input_buffer(self):
+        self.buffer.clear()
+
+    def write(self, data):
+        self.written.append(bytes(data))
+        if self.replies:
+            self.buffer += self.replies.pop(0)
+
+    def read(self, size=1):
+        if not self.buffer:
+            # A real port would block for the full timeout here
+            self.timeouts += 1
+            return b""
+        out = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return out
+
+    def read_until(self, expected=b"\n"):
+        out = bytearray()
+        while not out.endswith(expected):
+            c = self.read(1)
+            if not c:
+                break
+            out += c
+        return bytes(out)
+
+    def close(self):
+        pass
+
+
+class RecordingBackend:
+    """Concurrency backend that records sleeps instead of waiting."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def api(monkeypatch, request):
+    monkeypatch.setattr(transport.serial, "Serial", FakeSerial)
+    # One port per test; the registration is dropped when the instance is collected
+    return TecanAPISerial(0, "/dev/fake-" + request.node.name, 9600, max_attempts=2,
+                          backend=RecordingBackend())
+
+
+# The autouse _fast_clock fixture replaces Event.wait, which thread pools rely on
+_REAL_EVENT_WAIT = threading.Event.wait
+
+
+class PumpSerial(FakeSerial):
+    """FakeSerial that answers every command, as a pump on the port would."""
+
+    def write(self, data):
+        self.replies.append(_reply(b"1"))
+        super().write(data)
+
+
+class TestReceiveFrame:
+    def test_returns_without_waiting_for_timeout(self, api):
+        api._ser.replies.append(_reply(b"3000"))
+        response = api.sendRcv("?")
+        assert response["data"] == b"3000"
+        assert response["status_byte"] == "01100000"
+        assert api._ser.timeouts == 0
+
+    def test_skips_noise_before_start_byte(self, api):
+        api._ser.replies.append(b"\xff\x00" + _reply())
+        assert api.sendRcv("Q")["data"] is None
+
+    def test_checksum_may_equal_stop_byte(self, api):
+        # Pick a status byte that makes the checksum 0x03
+        status = 0x02 ^ 0x30 ^ 0x03 ^ 0x03
+        frame = _reply(status=status)
+        assert frame[-1] == 0x03
+        api._ser.replies.append(frame)
+        assert api.sendRcv("Q")["status_byte"] == "{:08b}".format(status)
+
+    def test_truncated_reply_is_retried(self, api):
+        api._ser.replies.extend([_reply(b"12")[:-1], _reply(b"12")])
+        assert api.sendRcv("?")["data"] == b"12"
+        assert len(api._ser.written) == 2
+        # The retry back-off goes through the backend
+        assert api.backend.sleeps == [0.05]
+
+    def test_stale_bytes_are_dropped(self, api):
+        api._ser.buffer += _reply(b"old")
+        api._ser.replies.append(_reply(b"new"))
+        assert api.sendRcv("?")["data"] == b"new"
+
+
+class TestFindSerialPumps:
+    @pytest.fixture(autouse=True)
+    def _ports(self, monkeypatch):
+        monkeypatch.setattr(threading.Event, "wait", _REAL_EVENT_WAIT)
+        monkeypatch.setattr(TecanAPISerial, "ser_mapping", {})
+        monkeypatch.setattr(transport, "listSerialPorts", lambda: ["/dev/ttyS0", "/dev/ttyPUMP", "/dev/ttyS1"])
+        monkeypatch.setattr(transport.serial, "Serial",
+                            lambda port, **kwargs: PumpSerial() if port == "/dev/ttyPUMP" else FakeSerial())
+
+    def test_finds_pump_among_silent_ports(self):
+        assert TecanAPISerial.findSerialPumps() == [("/dev/ttyPUMP", b"1", b"1")]
+
+    def test_probes_every_address(self):
+        found = TecanAPISerial.findSerialPumps(tecan_addrs=[0, 1])
+        assert [port for port, _, _ in found] == ["/dev/ttyPUMP", "/dev/ttyPUMP"]
+
+
+class TestProbeConcurrently:
+    @pytest.fixture(autouse=True)
+    def _real_event_wait(self, monkeypatch):
+        monkeypatch.setattr(threading.Event, "wait", _REAL_EVENT_WAIT)
+
+    def test_results_in_item_order(self):
+        assert transport._probeConcurrently(lambda x: x * 2, [3, 1, 2], timeout=5) == [6, 2, 4]
+
+    def test_slow_probe_is_skipped(self):
+        release = threading.Event()
+
+        def probe(item):
+            if item == "slow":
+                release.wait()
+            return item
+
+        try:
+            assert transport._probeConcurrently(probe, ["a", "slow", "b"], timeout=0.1) == ["a", "b"]
+        finally:
+            release.set()
+
+    def test_probe_errors_propagate(self):
+        def probe(item):
+            raise OSError(5, "I/O error")
+
+        with pytest.raises(OSError):
+            transport._probeConcurrently(probe, ["a"], timeout=5)
+
+
+class TestBackends:
+    def test_default_is_threads(self):
+        assert isinstance(getBackend(), ThreadBackend)
+        assert isinstance(getBackend("asyncio"), AsyncioBackend)
+        backend = RecordingBackend()
+        assert getBackend(backend) is backend
+        with pytest.raises(ValueError, match="Unknown"):
+            getBackend("fibers")
+
+    def test_blocking_classes_reject_asyncio_backend(self):
+        with pytest.raises(ValueError, match="asynchronous"):
+            XCaliburD(TecanAPISimulation(), num_ports=4, syringe_ul=5000, waste_port=3, backend="asyncio")
+        with pytest.raises(ValueError, match="asynchronous"):
+            TecanAPISerial(0, "/dev/null", 9600, backend=AsyncioBackend())
+        link = TecanAPISimulation()
+        link.backend = AsyncioBackend()
+        with pytest.raises(ValueError, match="asynchronous"):
+            XCaliburD(link, num_ports=4, syringe_ul=5000, waste_port=3)
+
+    def test_syringe_waits_on_link_backend(self):
+        backend = RecordingBackend()
+        link = TecanAPISimulation()
+        link.backend = backend
+        syringe = XCaliburD(link, num_ports=4, syringe_ul=5000, waste_port=3)
+        assert syringe.backend is backend
+        syringe._ready = False
+        syringe._waitReady(polling_interval=0.3, delay=1.0)
+        assert backend.sleeps == [1.0]
+
+    def test_wait_ready_times_out(self):
+        backend = RecordingBackend()
+        syringe = XCaliburD(TecanAPISimulation(), num_ports=4, syringe_ul=5000, waste_port=3, backend=backend)
+        syringe._checkReady = lambda: False
+        with pytest.raises(SyringeTimeout):
+            syringe._waitReady(polling_interval=0.5, timeout=2)
+        assert backend.sleeps == [0.5] * 4
@@ -0,0 +1,84 @@
+# tests/unit/control/test_telemetry.py
+import os
+
+import numpy as np
+import pytest
+
+from fluidics.control._def import MCU_MSG_LENGTH
+from fluidics.control.telemetry import (
+    HEADER_SIZE,
+    RECORD_DTYPE,
+    TelemetryWriter,
+    export_columns,
+    read_header,
+    read_telemetry,
+)
+
+
+def _frame(uid):
+    msg = bytearray(MCU_MSG_LENGTH)
+    msg[0], msg[1] = uid >> 8, uid & 0xFF
+    msg[6:11] = bytes([1, 2, 3, 4, 5])
+    return bytes(msg)
+
+
+class TestTelemetryWriter:
+    def test_roundtrip(self, tmp_path):
+        path = str(tmp_path / "log.tlm")
+        with TelemetryWriter(path, capacity=8) as w:
+            for i in range(3):
+                w.append(_frame(i), t=w.start_monotonic + i)
+        timestamps, frames = read_telemetry(path)
+        assert frames.shape == (3, MCU_MSG_LENGTH)
+        assert bytes(frames[2]) == _frame(2)
+        np.testing.assert_allclose(timestamps - timestamps[0], [0, 1, 2])
+
+    def test_preallocates_and_trims_on_close(self, tmp_path):
+        path = str(tmp_path / "log.tlm")
+        w = TelemetryWriter(path, capacity=16)
+        w.append(_frame(1))
+        assert os.path.getsize(path) == HEADER_SIZE + 16 * RECORD_DTYPE.itemsize
+        w.close()
+        assert os.path.getsize(path) == HEADER_SIZE + RECORD_DTYPE.itemsize
+        assert read_header(path)["count"] == 1
+
+    def test_grows_when_full(self, tmp_path):
+        path = str(tmp_path / "log.tlm")
+        with TelemetryWriter(path, capacity=2) as w:
+            for i in range(5):
+                w.append(_frame(i))
+            assert w.capacity == 6
+        _, frames = read_telemetry(path)
+        assert [f[1] for f in frames] == [0, 1, 2, 3, 4]
+
+    def test_recovers_records_without_close(self, tmp_path):
+        path = str(tmp_path / "log.tlm")
+        w = TelemetryWriter(path, capacity=8)
+        for i in range(4):
+            w.append(_frame(i))
+        w.flush()
+        # Simulate a crash after the header count went stale
+        w._count[0] = 2
+        w.flush()
+        _, frames = read_telemetry(path)
+        assert len(frames) == 4
+
+    def test_rejects_other_files(self, tmp_path):
+        path = tmp_path / "log.tlm"
+        path.write_bytes(b"\x00" * HEADER_SIZE)
+        with pytest.raises(ValueError):
+            read_telemetry(str(path))
+
+
+def test_export_columns(tmp_path):
+    path = str(tmp_path / "log.tlm")
+    with TelemetryWriter(path, capacity=4) as w:
+        for i in range(3):
+            w.append(_frame(i))
+    out_dir = str(tmp_path / "columns")
+    written = export_columns(path, out_dir)
+    assert os.path.join(out_dir, "timestamp.npy") in written
+    uid = np.load(os.path.join(out_dir, "MCU_received_command_UID.npy"))
+    assert list(uid) == [0, 1, 2]
+    valves = np.load(os.path.join(out_dir, "selector_valves_pos.npy"))
+    assert valves.shape == (3, 5)
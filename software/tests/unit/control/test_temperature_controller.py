@@ -1,6 +1,7 @@
 import pytest
 
 from fluidics.control.temperature_controller import TCMControllerSimulation
+from fluidics.control.virtual_clock import VirtualClock
 
 
 class TestTCMControllerSimulation:
@@ -95,3 +96,17 @@ class TestTCMControllerSimulation:
         assert tc.is_aborted is True
         tc.reset_abort()
         assert tc.is_aborted is False
+
+    def test_ramps_in_clock_time(self):
+        clock = VirtualClock()
+        tc = TCMControllerSimulation(channels=1, clock=clock)
+        tc.set_target_temperature(1, 20.0)
+        assert tc.get_actual_temperature(1) == 10.0
+        clock.sleep(10)
+        assert tc.get_actual_temperature(1) == pytest.approx(10.0 + 10 * TCMControllerSimulation.RAMP_CELSIUS_PER_S)
+        clock.sleep(1000)
+        assert tc.get_actual_temperature(1) == 20.0
+        # A new target ramps from the current reading
+        tc.set_target_temperature(1, 15.0)
+        clock.sleep(2)
+        assert tc.get_actual_temperature(1) == pytest.approx(20.0 - 2 * TCMControllerSimulation.RAMP_CELSIUS_PER_S)
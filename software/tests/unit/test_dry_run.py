@@ -0,0 +1,101 @@
+# tests/unit/test_dry_run.py
+import threading
+
+import pytest
+
+from fluidics.control.config import load_config
+from fluidics.control.virtual_clock import VirtualClock
+from fluidics.dry_run import dry_run
+from fluidics.sequences import get_included_sequences, load_sequences
+
+
+@pytest.fixture
+def flow_cell_config(fixtures_dir):
+    return load_config(str(fixtures_dir / "flow_cell_config.yaml"))
+
+
+@pytest.fixture
+def open_chamber_config(fixtures_dir):
+    return load_config(str(fixtures_dir / "open_chamber_config.yaml"))
+
+
+def _flow(port, volume=2000, **kwargs):
+    return dict({"type": "flow_reagent", "fluidic_port": port, "flow_rate": 5000, "volume": volume,
+                 "fill_tubing_with": None, "incubation_time": 0, "repeat": 1}, **kwargs)
+
+
+class TestVirtualClock:
+    def test_sleep_advances(self):
+        clock = VirtualClock(start=5)
+        clock.sleep(2.5)
+        clock.sleep(-1)
+        assert clock.time() == 7.5
+
+    def test_wait(self):
+        clock = VirtualClock()
+        event = threading.Event()
+        assert clock.wait(event, 10) is False
+        assert clock.time() == 10
+        event.set()
+        assert clock.wait(event, 10) is True
+        assert clock.time() == 10
+
+
+class TestDryRun:
+    def test_flow_cell_protocol(self, flow_cell_config, fixtures_dir):
+        sequences = get_included_sequences(load_sequences(str(fixtures_dir / "valid_sequences.yaml")))
+        result = dry_run(sequences, flow_cell_config)
+        assert result.errors == ()
+        n_runs = sum(seq.get("repeat", 1) for seq in sequences)
+        assert sum(1 for entry in result.timeline if entry[3] == "Completed") == n_runs
+        # Incubations alone take 4 minutes
+        assert result.duration_s > 240
+        times = [entry[0] for entry in result.timeline]
+        assert times == sorted(times)
+
+    def test_volumes_balance(self, flow_cell_config):
+        result = dry_run([_flow(2, volume=3000), _flow(3, volume=4000)], flow_cell_config)
+        assert result.consumption_ul == {2: pytest.approx(3000), 3: pytest.approx(4000)}
+        # The second flow does not fit next to the first, so the syringe is emptied in between
+        assert result.waste_ul == pytest.approx(3000)
+        assert result.syringe_trace[-1][1] == pytest.approx(4000)
+        drawn = sum(result.consumption_ul.values())
+        assert result.syringe_trace[-1][1] == pytest.approx(drawn - result.waste_ul)
+        assert all(0 <= volume <= flow_cell_config.syringe_pump.volume_ul for _, volume in result.syringe_trace)
+
+    def test_incubation_in_virtual_time(self, flow_cell_config):
+        short = dry_run([_flow(2)], flow_cell_config)
+        long = dry_run([_flow(2, incubation_time=600)], flow_cell_config)
+        assert long.duration_s - short.duration_s == pytest.approx(600 * 60)
+
+    def test_open_chamber_dispense(self, open_chamber_config):
+        seq = {"type": "add_reagent", "fluidic_port": 2, "flow_rate": 5000, "volume": 1000,
+               "fill_tubing_with": None, "incubation_time": 0, "repeat": 1}
+        result = dry_run([seq], open_chamber_config)
+        assert result.errors == ()
+        assert result.dispensed_ul[open_chamber_config.syringe_pump.dispense_port] > 0
+
+    def test_errors_are_collected(self, flow_cell_config):
+        result = dry_run([_flow(2, volume=20000)], flow_cell_config)
+        assert len(result.errors) == 1
+        assert "Invalid Operand" in result.errors[0]
+
+    def test_prefetch_shortens_cycles(self, flow_cell_config):
+        sequences = [_flow(2, volume=3000, incubation_time=5), _flow(13, volume=3000, incubation_time=5),
+                     _flow(25, volume=3000)]
+        plain = dry_run(sequences, flow_cell_config)
+        prefetched = dry_run(sequences, flow_cell_config, prefetch=True)
+        assert prefetched.errors == ()
+        assert prefetched.duration_s < plain.duration_s
+        # Only emptying and valve moves are moved into the incubation: the same reagent is drawn
+        assert prefetched.consumption_ul == plain.consumption_ul
+        assert prefetched.waste_ul == pytest.approx(plain.waste_ul)
+        # Nothing is drawn through the flow cell while a sample incubates
+        starts = [t for t, _, _, status in prefetched.timeline if status == "Incubating"]
+        ends = [t for t, _, _, status in prefetched.timeline if status == "Completed"][:len(starts)]
+        assert len(starts) == 2
+        trace = prefetched.syringe_trace
+        for start, end in zip(starts, ends):
+            for (t0, v0), (t1, v1) in zip(trace, trace[1:]):
+                if start <= t1 < end:
+                    assert v1 <= v0
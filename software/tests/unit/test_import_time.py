@@ -0,0 +1,34 @@
+# tests/unit/test_import_time.py
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+SOFTWARE_DIR = Path(__file__).resolve().parents[2]
+
+# Imported only by the features that need them, never at CLI start-up
+HEAVY_MODULES = ("numpy", "pandas", "matplotlib", "gevent", "serial", "cobs")
+
+
+def _import_times(module):
+    """Run `import module` in a fresh interpreter; returns {module: cumulative import time in us}."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=SOFTWARE_DIR, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestImportTime:
+    @pytest.mark.parametrize("module", ["run_sequences", "fluidics.sequences", "fluidics.control.config"])
+    def test_no_heavy_imports_at_startup(self, module):
+        times = _import_times(module)
+        heavy = sorted(name for name in times if name.split(".")[0] in HEAVY_MODULES)
+        assert not heavy, (f"import {module} ({times[module] / 1000:.0f} ms) pulls in "
+                           f"{', '.join(heavy)}")
@@ -0,0 +1,26 @@
+# tests/unit/test_run_sequences.py
+import sys
+
+import pytest
+
+import run_sequences
+
+
+def _parse(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["run_sequences.py", "--path", "seq.yaml", *argv])
+    return run_sequences.parse_args()
+
+
+class TestParseArgs:
+    @pytest.mark.parametrize("mode", ["--plan", "--compiled"])
+    @pytest.mark.parametrize("flag", ["--prefetch", "--overlap-valve-moves"])
+    def test_compiled_plan_rejects_uncompiled_options(self, monkeypatch, capsys, mode, flag):
+        with pytest.raises(SystemExit) as exc:
+            _parse(monkeypatch, mode, flag)
+        assert exc.value.code == 2
+        assert f"{flag} is not supported with {mode}" in capsys.readouterr().err
+
+    def test_options_allowed_without_plan(self, monkeypatch):
+        args = _parse(monkeypatch, "--prefetch", "--overlap-valve-moves")
+        assert args.prefetch and args.overlap_valve_moves
+        assert _parse(monkeypatch, "--compiled").compiled
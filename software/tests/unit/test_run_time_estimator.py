@@ -0,0 +1,114 @@
+# tests/unit/test_run_time_estimator.py
+import pytest
+
+from fluidics.control.config import load_config
+from fluidics.control.controller import FluidControllerSimulation
+from fluidics.control.selector_valve import SelectorValveSystem
+from fluidics.control.syringe_pump import SyringePumpSimulation
+from fluidics.experiment_worker import ExperimentWorker
+from fluidics.merfish_operations import MERFISHOperations
+from fluidics.run_time_estimator import RunTimeEstimator
+from fluidics.sequence_compiler import compile_sequences
+from fluidics.sequences import get_included_sequences, load_sequences
+
+
+@pytest.fixture
+def flow_cell_config(fixtures_dir):
+    return load_config(str(fixtures_dir / "flow_cell_config.yaml"))
+
+
+@pytest.fixture
+def sequences(fixtures_dir):
+    return get_included_sequences(load_sequences(str(fixtures_dir / "valid_sequences.yaml")))
+
+
+def _flow(port, volume=2000, **kwargs):
+    return dict({"type": "flow_reagent", "fluidic_port": port, "flow_rate": 5000, "volume": volume,
+                 "fill_tubing_with": 5, "incubation_time": 0, "repeat": 1}, **kwargs)
+
+
+class TestRunTimeEstimator:
+    def test_matches_plan(self, flow_cell_config, sequences):
+        estimator = RunTimeEstimator(sequences, flow_cell_config)
+        plan = compile_sequences(sequences, flow_cell_config)
+        assert len(estimator) == len(plan.sequences)
+        assert estimator.total_s() == pytest.approx(plan.duration_s)
+        assert estimator.remaining_s(0) == pytest.approx(plan.duration_s)
+
+    def test_breakdown(self, flow_cell_config):
+        estimator = RunTimeEstimator([_flow(2, incubation_time=1, repeat=2)], flow_cell_config)
+        rows = estimator.breakdown()
+        assert [(r["index"], r["repeat"]) for r in rows] == [(0, 0), (0, 1)]
+        assert all(r["estimate_s"] == pytest.approx(r["fluidics_s"] + 60) for r in rows)
+        assert all(r["actual_s"] is None for r in rows)
+
+    def test_valve_move_time(self, flow_cell_config):
+        fast = RunTimeEstimator([_flow(2)], flow_cell_config, valve_move_s=0)
+        slow = RunTimeEstimator([_flow(2)], flow_cell_config, valve_move_s=3)
+        assert slow.total_s() > fast.total_s()
+
+    def test_record_corrects_remaining(self, flow_cell_config):
+        estimator = RunTimeEstimator([_flow(2), _flow(3)], flow_cell_config)
+        predicted = [r["fluidics_s"] for r in estimator.breakdown()]
+        estimator.record(0, predicted[0] * 2)
+        expected_correction = 1 + RunTimeEstimator.CORRECTION_ALPHA
+        assert estimator.correction == pytest.approx(expected_correction)
+        assert estimator.remaining_s(1) == pytest.approx(predicted[1] * expected_correction)
+        assert estimator.total_s() == pytest.approx(predicted[0] * 2 + predicted[1] * expected_correction)
+
+    def test_temperature_not_corrected(self, flow_cell_config):
+        estimator = RunTimeEstimator([_flow(2), {"type": "set_temperature", "temperature": 37}], flow_cell_config)
+        estimator.record(0, estimator.breakdown()[0]["fluidics_s"] * 3)
+        assert estimator.remaining_s(1) == pytest.approx(60)
+
+
+class TestWorkerEstimate:
+    @pytest.fixture
+    def ops(self, flow_cell_config):
+        fc = FluidControllerSimulation(serial_number="test")
+        sp = SyringePumpSimulation(None, flow_cell_config.syringe_pump.volume_ul,
+                                   flow_cell_config.syringe_pump.speed_code_limit,
+                                   flow_cell_config.syringe_pump.waste_port)
+        return MERFISHOperations(flow_cell_config, sp, SelectorValveSystem(fc, flow_cell_config))
+
+    def test_uses_measured_valve_time(self, ops, flow_cell_config):
+        worker = ExperimentWorker(ops, [_flow(2)], flow_cell_config)
+        move_s = ops.sv.get_move_time_s()
+        assert move_s is not None
+        expected = RunTimeEstimator([_flow(2)], flow_cell_config, valve_move_s=move_s)
+        assert worker.estimate() == (pytest.approx(expected.total_s()), 1)
+        assert worker.time_to_finish == pytest.approx(expected.total_s())
+        assert worker.n_sequences == 1
+
+    def test_estimate_is_built_lazily_and_once(self, ops, flow_cell_config):
+        estimates = []
+        worker = ExperimentWorker(ops, [_flow(2)], flow_cell_config,
+                                  {"on_estimate": lambda t, n: estimates.append(t)})
+        assert worker.estimator is None and worker.time_to_finish is None
+        assert estimates == []
+        worker.estimate()
+        worker.estimate()
+        assert worker.estimator is not None
+        assert len(estimates) == 1
+
+    def test_live_updates(self, ops, flow_cell_config):
+        estimates = []
+        seqs = [_flow(2, incubation_time=1), _flow(3)]
+        worker = ExperimentWorker(ops, seqs, flow_cell_config,
+                                  {"on_estimate": lambda t, n: estimates.append(t)})
+        worker.run()
+        # Initial estimate, then one update per finished sequence
+        assert len(estimates) == 3
+        rows = worker.get_estimate_breakdown()
+        assert all(r["actual_s"] is not None for r in rows)
+        # The last update is the measured run time
+        assert estimates[-1] == pytest.approx(sum(r["actual_s"] + r["incubation_s"] for r in rows))
+
+    def test_falls_back_when_plan_fails(self, ops, flow_cell_config):
+        seqs = [_flow(2, volume=20000)]
+        worker = ExperimentWorker(ops, seqs, flow_cell_config)
+        worker.estimate()
+        assert worker.estimator is None
+        assert worker.get_estimate_breakdown() is None
+        assert worker.time_to_finish == pytest.approx(20000 / 5000 * 60 + 2
+                                                      + flow_cell_config.reagent_selection.common_tubing_fluid_amount_ul / 5000 * 60 + 1)
@@ -0,0 +1,171 @@
+# tests/unit/test_sequence_compiler.py
+import sys
+
+import pytest
+
+from fluidics.control.config import load_config
+from fluidics.control.controller import FluidControllerSimulation
+from fluidics.control.selector_valve import SelectorValveSystem
+from fluidics.control.syringe_pump import SyringePump, SyringePumpSimulation
+from fluidics.control.tecancavro import TecanAPISimulation
+from fluidics.experiment_worker import ExperimentWorker, OperationError
+from fluidics.sequence_compiler import (
+    DiscPumpPower,
+    PlanExecutor,
+    SetTemperature,
+    SyringeChain,
+    ValveRoute,
+    Wait,
+    compile_sequences,
+)
+from fluidics.sequences import get_included_sequences, load_sequences
+
+
+@pytest.fixture
+def flow_cell_config(fixtures_dir):
+    return load_config(str(fixtures_dir / "flow_cell_config.yaml"))
+
+
+@pytest.fixture
+def open_chamber_config(fixtures_dir):
+    return load_config(str(fixtures_dir / "open_chamber_config.yaml"))
+
+
+@pytest.fixture
+def sequences(fixtures_dir):
+    return get_included_sequences(load_sequences(str(fixtures_dir / "valid_sequences.yaml")))
+
+
+def _flow(port, volume=2000, **kwargs):
+    return dict({"type": "flow_reagent", "fluidic_port": port, "flow_rate": 5000, "volume": volume,
+                 "fill_tubing_with": 5, "incubation_time": 0, "repeat": 1}, **kwargs)
+
+
+class TestCompile:
+    def test_one_block_per_repeat(self, flow_cell_config, sequences):
+        plan = compile_sequences(sequences, flow_cell_config)
+        expected = [(i, r) for i, seq in enumerate(sequences) for r in range(seq.get("repeat", 1))]
+        assert [(p.index, p.repeat) for p in plan.sequences] == expected
+
+    def test_flow_reagent_steps(self, flow_cell_config):
+        plan = compile_sequences([_flow(2)], flow_cell_config)
+        steps = plan.sequences[0].steps
+        assert {type(s) for s in steps} <= {ValveRoute, SyringeChain, Wait}
+        assert ValveRoute(2, ((0, 2),), 1.0) in steps
+        chains = [s for s in steps if isinstance(s, SyringeChain)]
+        assert all(s.duration_s > 0 for s in chains)
+        # Each chain starts with what the previous one left in the syringe
+        for prev, nxt in zip(chains, chains[1:]):
+            assert nxt.start_volume_ul == pytest.approx(prev.end_volume_ul)
+
+    def test_compiles_quietly_without_redirecting_stdout(self, flow_cell_config, sequences, capsys):
+        stdout = sys.stdout
+        compile_sequences(sequences, flow_cell_config)
+        assert sys.stdout is stdout
+        assert capsys.readouterr().out == ""
+
+    def test_valve_already_in_place_is_free(self, flow_cell_config):
+        # Valves start at position 1, so routing to port 1 moves nothing
+        plan = compile_sequences([_flow(1)], flow_cell_config)
+        assert ValveRoute(1, (), 0.0) in plan.sequences[0].steps
+
+    def test_open_chamber_records_disc_pump(self, open_chamber_config):
+        seq = {"type": "add_reagent", "fluidic_port": 2, "flow_rate": 5000, "volume": 1000,
+               "fill_tubing_with": 5, "incubation_time": 1, "repeat": 1}
+        plan = compile_sequences([seq], open_chamber_config)
+        steps = plan.sequences[0].steps
+        on = steps.index(DiscPumpPower(1.0))
+        assert isinstance(steps[on + 1], Wait)
+        assert steps[on + 2] == DiscPumpPower(0.0)
+        assert plan.sequences[0].incubation_s == 60
+
+    def test_set_temperature(self, flow_cell_config):
+        plan = compile_sequences([{"type": "set_temperature", "temperature": 37, "repeat": 1}], flow_cell_config)
+        assert plan.sequences[0].steps == (SetTemperature(37),)
+
+    def test_duration_includes_incubation(self, flow_cell_config):
+        plan = compile_sequences([_flow(2, incubation_time=2)], flow_cell_config)
+        assert plan.duration_s == pytest.approx(plan.sequences[0].duration_s + 120)
+
+    def test_plunger_overrun_is_reported(self, flow_cell_config):
+        with pytest.raises(OperationError, match=r"Sequence 1 \(flow_reagent, repeat 1\)"):
+            compile_sequences([_flow(2), _flow(2, volume=20000)], flow_cell_config)
+
+    def test_open_chamber_overflow_is_reported(self, open_chamber_config):
+        # Below the tubing volumes, add_reagent would dispense more overflow than the syringe holds
+        seq = {"type": "add_reagent", "fluidic_port": 2, "flow_rate": 5000, "volume": 100,
+               "fill_tubing_with": 5, "incubation_time": 0, "repeat": 1}
+        with pytest.raises(OperationError, match="Invalid Operand"):
+            compile_sequences([seq], open_chamber_config)
+
+    def test_unknown_type_is_reported(self, flow_cell_config):
+        with pytest.raises(OperationError, match="Unknown sequence type"):
+            compile_sequences([{"type": "bogus", "repeat": 1}], flow_cell_config)
+
+
+class TestPlanExecutor:
+    def _hardware(self, config, pump_model=True, plunger_pos=0):
+        fc = FluidControllerSimulation(serial_number="test")
+        sv = SelectorValveSystem(fc, config)
+        sp_cfg = config.syringe_pump
+        if pump_model:
+            sp = SyringePump(None, sp_cfg.volume_ul, sp_cfg.speed_code_limit, sp_cfg.waste_port,
+                             com_link=TecanAPISimulation(plunger_pos=plunger_pos))
+        else:
+            sp = SyringePumpSimulation(None, sp_cfg.volume_ul, sp_cfg.speed_code_limit, sp_cfg.waste_port)
+        return sp, sv
+
+    def test_replays_chains_on_pump(self, flow_cell_config):
+        plan = compile_sequences([_flow(2)], flow_cell_config)
+        sp, sv = self._hardware(flow_cell_config)
+        link = sp.syringe.com_link
+        link.history.clear()
+        PlanExecutor(plan, sp, sv).process_sequence(plan.sequences[0].sequence)
+        executed = [cmd[:-1] for cmd in link.history if cmd.endswith("R")]
+        assert executed == [s.chain for s in plan.steps() if isinstance(s, SyringeChain)]
+        last_route = [s for s in plan.steps() if isinstance(s, ValveRoute)][-1]
+        assert sv.get_current_port() == last_route.port
+
+    def test_replay_leaves_model_at_chain_end_state(self, flow_cell_config):
+        plan = compile_sequences([_flow(2)], flow_cell_config)
+        sp, sv = self._hardware(flow_cell_config)
+        PlanExecutor(plan, sp, sv).process_sequence(plan.sequences[0].sequence)
+        last = [s for s in plan.steps() if isinstance(s, SyringeChain)][-1]
+        state = sp.syringe.state
+        assert state['port'] == last.port
+        assert sp.chain_speed_code == last.speed_code
+        assert state['top_speed'] == sp.syringe.SPEED_CODES[last.speed_code]
+        assert sp.syringe.sim_state == state
+
+    def test_volume_mismatch_is_reported(self, flow_cell_config):
+        plan = compile_sequences([_flow(2)], flow_cell_config, initial_volume_ul=1000)
+        sp, sv = self._hardware(flow_cell_config)
+        with pytest.raises(OperationError, match="plan expects 1000 ul"):
+            PlanExecutor(plan, sp, sv).process_sequence(plan.sequences[0].sequence)
+
+    def test_compiled_from_non_empty_syringe(self, flow_cell_config):
+        sp, sv = self._hardware(flow_cell_config, plunger_pos=600)
+        plan = compile_sequences([_flow(2), _flow(3)], flow_cell_config,
+                                 initial_volume_ul=sp.get_current_volume())
+        chains = [s for s in plan.steps() if isinstance(s, SyringeChain)]
+        assert chains[0].start_volume_ul == pytest.approx(sp.get_current_volume())
+        executor = PlanExecutor(plan, sp, sv)
+        for planned in plan.sequences:
+            executor.process_sequence(planned.sequence)
+        assert sp.get_current_volume() == pytest.approx(chains[-1].end_volume_ul,
+                                                        abs=sp.volume / sp.range)
+
+    def test_out_of_step(self, flow_cell_config):
+        plan = compile_sequences([_flow(2), _flow(3)], flow_cell_config)
+        sp, sv = self._hardware(flow_cell_config)
+        with pytest.raises(OperationError, match="out of step"):
+            PlanExecutor(plan, sp, sv).process_sequence(plan.sequences[1].sequence)
+
+    def test_runs_under_experiment_worker(self, flow_cell_config, sequences):
+        plan = compile_sequences(sequences, flow_cell_config)
+        sp, sv = self._hardware(flow_cell_config, pump_model=False)
+        errors = []
+        worker = ExperimentWorker(PlanExecutor(plan, sp, sv), sequences, flow_cell_config,
+                                  {"on_error": errors.append})
+        worker.run()
+        assert errors == []
@@ -134,6 +134,20 @@ class TestSequenceLoadingCSV:
         assert len(temp_seqs) == 1
         assert temp_seqs[0]["temperature"] == 50.0
 
+    def test_csv_empty_cells_use_defaults(self, tmp_path):
+        path = tmp_path / "gaps.csv"
+        path.write_text("sequence_name,fluidic_port,flow_rate,volume,fill_tubing_with,incubation_time,repeat,include\n"
+                        "Flow Reagent,2,5000,2000,,1.5,2,\n"
+                        "Priming,10,5000.0,2000,0,,,0\n")
+        flow, priming = load_sequences(str(path))
+        assert flow["fill_tubing_with"] is None
+        assert flow["incubation_time"] == 1.5
+        assert flow["repeat"] == 2
+        assert flow["include"] is True
+        assert priming["flow_rate"] == 5000
+        assert priming["repeat"] == 1
+        assert priming["include"] is False
+
 
 class TestSaveSequences:
     def test_round_trip(self, tmp_path):
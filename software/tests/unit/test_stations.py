@@ -0,0 +1,137 @@
+# tests/unit/test_stations.py
+import threading
+
+import pytest
+
+from fluidics import stations
+from fluidics.control._def import CMD_SET
+from fluidics.control.config import load_config
+from fluidics.control.controller import FluidControllerSimulation
+from fluidics.stations import StationManager
+
+# The autouse _fast_clock fixture replaces Event.wait, which Thread.start relies on
+_REAL_EVENT_WAIT = threading.Event.wait
+
+
+@pytest.fixture(autouse=True)
+def _real_event_wait(monkeypatch):
+    monkeypatch.setattr(threading.Event, "wait", _REAL_EVENT_WAIT)
+
+
+@pytest.fixture
+def flow_cell_config(fixtures_dir):
+    return load_config(str(fixtures_dir / "flow_cell_config.yaml"))
+
+
+@pytest.fixture
+def open_chamber_config(fixtures_dir):
+    return load_config(str(fixtures_dir / "open_chamber_config.yaml"))
+
+
+def _flow(port, incubation_time=0, repeat=1):
+    return {"type": "flow_reagent", "fluidic_port": port, "flow_rate": 5000, "volume": 1000,
+            "fill_tubing_with": None, "incubation_time": incubation_time, "repeat": repeat}
+
+
+class RecordingController(FluidControllerSimulation):
+    def __init__(self, serial_number):
+        super().__init__(serial_number)
+        self.calls = []
+
+    def send_command(self, command, *args):
+        self.calls.append(("send", command))
+        return super().send_command(command, *args)
+
+    def wait_for_completion(self, uid=None, timeout=None):
+        self.calls.append(("wait",))
+        return super().wait_for_completion(uid, timeout)
+
+
+class TestStationManager:
+    def test_runs_every_station(self, flow_cell_config):
+        progress = []
+        manager = StationManager({'update_progress': lambda *args: progress.append(args)})
+        manager.add_station("A", flow_cell_config, [_flow(2, repeat=2)], simulation=True)
+        manager.add_station("B", flow_cell_config, [_flow(3)], simulation=True)
+        assert manager.initialize() == {}
+        manager.start()
+        assert manager.join(timeout=10)
+        manager.close()
+
+        status = manager.status()
+        assert status["A"]["state"] == "finished"
+        assert status["A"]["progress"] == (0, 2, "Completed")
+        assert status["B"]["state"] == "finished"
+        assert status["B"]["errors"] == []
+        # Callbacks are tagged with the station name
+        assert ("A", 0, 2, "Completed") in progress
+        assert ("B", 0, 1, "Completed") in progress
+
+    def test_stations_have_separate_devices(self, flow_cell_config, open_chamber_config):
+        manager = StationManager()
+        a = manager.add_station("A", flow_cell_config, [], simulation=True)
+        b = manager.add_station("B", flow_cell_config, [], simulation=True)
+        c = manager.add_station("C", open_chamber_config, [], simulation=True)
+        assert manager.initialize() == {}
+        assert a.controller is not b.controller
+        assert a.syringe_pump is not b.syringe_pump
+        assert a.experiment_ops.sv is not b.experiment_ops.sv
+        assert a.disc_pump is None
+        assert c.experiment_ops.dp is c.disc_pump
+
+    def test_duplicate_name(self, flow_cell_config):
+        manager = StationManager()
+        manager.add_station("A", flow_cell_config, [], simulation=True)
+        with pytest.raises(ValueError, match="Duplicate"):
+            manager.add_station("A", flow_cell_config, [], simulation=True)
+
+    def test_failed_initialization_is_per_station(self, flow_cell_config, open_chamber_config):
+        manager = StationManager()
+        manager.add_station("good", flow_cell_config, [_flow(2)], simulation=True)
+        bad = manager.add_station("bad", open_chamber_config, [], simulation=True)
+        bad.config = None
+        errors = manager.initialize()
+        assert list(errors) == ["bad"]
+        assert manager["bad"].state == "failed"
+        manager.start()
+        assert manager.join(timeout=10)
+        assert manager["good"].state == "finished"
+        assert manager["bad"].thread is None
+
+    def test_abort_one_station(self, flow_cell_config):
+        manager = StationManager()
+        # A one-hour incubation keeps station A waiting until it is aborted
+        manager.add_station("A", flow_cell_config, [_flow(2, incubation_time=60)], simulation=True)
+        manager.add_station("B", flow_cell_config, [_flow(3)], simulation=True)
+        manager.initialize()
+        manager.start()
+        assert manager["B"].join(timeout=10)
+        assert not manager["A"].join(timeout=0.05)
+        manager.abort("A")
+        assert manager.join(timeout=10)
+        assert manager["A"].state == "aborted"
+        assert manager["A"].errors == ["Operation aborted by user"]
+        assert manager["B"].state == "finished"
+        # The aborted station re-verifies its valves on the next move; the other keeps its cache
+        assert not any(v.position_verified for v in manager["A"].selector_valves.valves)
+        assert any(v.position_verified for v in manager["B"].selector_valves.valves)
+
+    def test_reinitialize_closes_previous_valves(self, flow_cell_config, monkeypatch):
+        manager = StationManager()
+        station = manager.add_station("A", flow_cell_config, [], simulation=True)
+        manager.initialize()
+        previous = station.selector_valves
+        closed = []
+        monkeypatch.setattr(previous, "close", lambda: closed.append(previous))
+        manager.initialize()
+        assert closed == [previous]
+        assert station.selector_valves is not previous
+
+    def test_initialize_waits_for_clear(self, flow_cell_config, monkeypatch):
+        monkeypatch.setattr(stations, "FluidControllerSimulation", RecordingController)
+        manager = StationManager()
+        station = manager.add_station("A", flow_cell_config, [], simulation=True)
+        assert manager.initialize() == {}
+        calls = station.controller.calls
+        assert calls[:2] == [("send", CMD_SET.CLEAR), ("wait",)]
+        assert ("send", CMD_SET.INITIALIZE_ROTARY) in calls[2:]